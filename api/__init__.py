@@ -1,3 +1,12 @@
 from .binance_client import BinanceClient
 from .defillama_client import DlClient
 from .utils_api import EXCHANGE_TO_BASE_URL, make_get_request
+from .session_manager import SESSIONS, SessionManager, get_session
+from .rate_limiter import RATE_LIMITER, RateLimiter, TokenBucket
+from .ticker_cache import TICKER_CACHES, CachedValue, CachedValueMissing, TickerCache, get_ticker_cache
+from .coingecko_index import COINGECKO_INDEX, CoinGeckoIndex
+from .defillama_yields import YieldsFilter, YieldsIndex, YieldsTable, iter_json_array
+from .defillama_tvl import TVL_DTYPE, TvlStore
+from .execution_engine import ExecutionEngine
+from .fill_store import FillStore
+from .symbol_rules import SYMBOL_RULES_CACHES, SymbolRules, SymbolRulesCache, get_symbol_rules_cache
@@ -0,0 +1,200 @@
+import asyncio
+import hmac
+import os
+from urllib.parse import urlencode
+
+from .binance_client import BinanceClient
+from .rate_limiter import RATE_LIMITER
+from .ticker_cache import get_ticker_cache
+from .utils_api import EXCHANGE_TO_BASE_URL, make_endpoint, get_timestamp_ms
+
+DEFAULT_CONCURRENCY = 10
+DEFAULT_TIMEOUT_S = 15
+
+
+def make_client_session(limit=DEFAULT_CONCURRENCY * 2, limit_per_host=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT_S):
+    """
+    aiohttp session with a keep-alive connection pool, share one per event loop
+    """
+    import aiohttp  # only needed once an async client is used, not to import this module
+
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host, ttl_dns_cache=300)
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout))
+
+
+async def gather_with_concurrency(limit, *coros, return_exceptions=False):
+    """
+    asyncio.gather with at most [[limit]] coroutines in flight
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*[_run(c) for c in coros], return_exceptions=return_exceptions)
+
+
+class AsyncClient:
+    """
+    base for async clients, owns a session unless one is passed in,
+    requests are paced by the same RateLimiter as the sync clients
+    """
+
+    def __init__(self, session=None, rate_limiter=RATE_LIMITER):
+        """
+        :param rate_limiter: RateLimiter shared with the sync clients, None disables pacing
+        """
+        self._session = session
+        self._owns_session = session is None
+        self.rate_limiter = rate_limiter
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = make_client_session()
+        return self._session
+
+    async def close(self):
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def request(self, method, url, **kwargs):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async(url, method)
+        async with self.session.request(method, url, **kwargs) as resp:
+            if self.rate_limiter is not None:
+                self.rate_limiter.update(url, resp)
+            return await resp.json(content_type=None)
+
+    async def make_get_request(self, url: str, endpoint: str, **args):
+        return await self.request('GET', os.path.join(url, make_endpoint(endpoint, **args)))
+
+
+class AsyncBinanceClient(AsyncClient):
+    """
+    async twin of BinanceClient
+    """
+
+    def __init__(self, exchange, api_key=None, api_secret=None, session=None, rate_limiter=RATE_LIMITER):
+        super().__init__(session, rate_limiter)
+        self.exchange = exchange.upper()
+        self.base_url = EXCHANGE_TO_BASE_URL[self.exchange]
+        self.api_key = api_key
+        self.api_secret = api_secret
+
+    @classmethod
+    def from_client(cls, client, session=None):
+        """
+        async client with the exchange and keys of a sync BinanceClient
+        """
+        return cls(client.exchange, client.api_key, client.api_secret, session=session)
+
+    def hashing(self, query_string):
+        return hmac.new(self.api_secret.encode("utf-8"), query_string.encode("utf-8"), 'sha256').hexdigest()
+
+    async def make_signed_request(self, method, endpoint, body_in={}):
+        url = os.path.join(self.base_url, endpoint)
+
+        body = dict(body_in)
+        body['timestamp'] = get_timestamp_ms()
+        headers = {
+            'X-MBX-APIKEY': self.api_key,
+            'Content-Type': 'application/x-www-form-urlencoded;charset=UTF-8;',
+        }
+
+        if method in ('GET', 'DELETE'):
+            path = urlencode(body)
+            url = url + f"?{path}&signature={self.hashing(path)}"
+            return await self.request(method, url, headers=headers)
+        elif method == 'POST':
+            body['signature'] = self.hashing(urlencode(body))
+            return await self.request(method, url, headers=headers, data=body)
+        else:
+            raise ValueError(f'unsupported method {method}')
+
+    async def make_public_request(self, endpoint, **args):
+        return await self.make_get_request(self.base_url, endpoint, **args)
+
+    async def get_account(self):
+        return await self.make_signed_request("GET", "account")
+
+    async def get_order_book(self, symbol, limit=10):
+        return await self.make_public_request("depth", symbol=symbol, limit=limit)
+
+    async def post_order(self, symbol, side, type_, quantity, price, timeInForce, **params):
+        """
+        **params, any other order parameter, ie newClientOrderId, reduceOnly
+        """
+        params = {
+            "symbol": symbol,
+            "side": side.upper(),
+            "type": type_.upper(),
+            "quantity": quantity,
+            "price": price,
+            "timeInForce": timeInForce,
+            **params,
+        }
+        params = {k: v for k, v in params.items() if v is not None}  # MARKET orders have no price / timeInForce
+        return await self.make_signed_request("POST", "order", body_in=params)
+
+    async def cancel_open_orders(self, symbol):
+        """
+        symbol, ie BTCUSDT, or base ie BTC which is converted to BTCUSDT
+        """
+        symbol = symbol if symbol.endswith('USDT') else f'{symbol}USDT'
+        return await self.make_signed_request("DELETE", "allOpenOrders", body_in={'symbol': symbol})
+
+    async def get_spot(self, symbs):
+        # spot prices from the shared bulk ticker cache, a stale one is refetched over this session
+        cache = get_ticker_cache('BINANCE')
+        if cache.is_stale():
+            cache.load(await self.make_get_request(cache.base_url, cache.endpoint))
+        return cache.get_spot(symbs)
+
+    async def get_open_futs_positions(self, ignore_usdt_in_key=False, account=None):
+        if account is None:
+            account = await self.get_account()
+        return BinanceClient.parse_open_futs_positions(account, ignore_usdt_in_key=ignore_usdt_in_key)
+
+
+class AsyncDlClient(AsyncClient):
+    """
+    async twin of DlClient
+    """
+
+    def __init__(self, session=None, rate_limiter=RATE_LIMITER):
+        super().__init__(session, rate_limiter)
+        self.base_url = EXCHANGE_TO_BASE_URL["DEFILLAMA"]
+
+    async def get_protocol_tvl(self, protocol):
+        return await self.make_get_request(self.base_url, f"protocol/{protocol.lower()}")
+
+    async def get_protocols_tvl(self, protocols, limit=DEFAULT_CONCURRENCY):
+        """
+        {protocol: tvl response}, fetched concurrently
+        """
+        resps = await gather_with_concurrency(limit, *[self.get_protocol_tvl(p) for p in protocols])
+        return dict(zip(protocols, resps))
+
+    async def get_yields(self):
+        return await self.make_get_request('https://yields.llama.fi', 'pools')
+
+
+async def get_accounts(clients, limit=DEFAULT_CONCURRENCY):
+    """
+    fetch get_account of every sync BinanceClient concurrently on one session
+
+    returns;
+        list of account responses, same order as clients
+    """
+    async with make_client_session() as session:
+        aclients = [AsyncBinanceClient.from_client(c, session=session) for c in clients]
+        return await gather_with_concurrency(limit, *[c.get_account() for c in aclients])
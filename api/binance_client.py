@@ -1,27 +1,21 @@
 import hmac
+import json
 import os
-import requests
 from urllib.parse import urlencode
 
-from .utils_api import EXCHANGE_TO_BASE_URL, make_get_request, get_timestamp_ms
+from .session_manager import SESSIONS
+from .symbol_rules import get_symbol_rules_cache
+from .ticker_cache import get_ticker_cache
+from .utils_api import EXCHANGE_TO_BASE_URL, make_get_request, make_endpoint, get_timestamp_ms
 
 
 class BinanceClient:
     
     def __init__(self, exchange, api_key=None, api_secret=None):
-        self.base_url = EXCHANGE_TO_BASE_URL[exchange.upper()]
+        self.exchange = exchange.upper()
+        self.base_url = EXCHANGE_TO_BASE_URL[self.exchange]
         self.api_key = api_key
         self.api_secret = api_secret
-        self.price_tick_size = {
-            'BTC': 1,
-            'ETH': 2,
-            'CRV': 3,
-        }
-        self.qty_tick_size = {
-            'BTC': 3,
-            'ETH': 3,
-            'CRV': 1,
-        }
 
     def hashing(self, query_string):
         return hmac.new(self.api_secret.encode("utf-8"), query_string.encode("utf-8"), 'sha256').hexdigest()
@@ -44,11 +38,11 @@ class BinanceClient:
             url = url + f"?{path}&signature={signature}"
             if verbose: 
                 print(url)
-            resp = requests.get(url, headers=headers)
+            resp = SESSIONS.get(url, headers=headers)
 
         elif method == 'POST':
             body['signature'] = self.hashing(urlencode(body))
-            resp = requests.post(url, headers=headers, data=body)
+            resp = SESSIONS.post(url, headers=headers, data=body)
 
         elif method == 'DELETE':
             path = urlencode(body)
@@ -56,22 +50,39 @@ class BinanceClient:
             url = url + f"?{path}&signature={signature}"
             if verbose:
                 print(url)
-            resp = requests.delete(url, headers=headers)
+            resp = SESSIONS.delete(url, headers=headers)
 
         print(url)
         # print(resp)
         return resp.json()
     
+    def make_api_key_request(self, method, endpoint, **args):
+        """
+        endpoints that only need the api key header, no timestamp / signature (ie listenKey)
+        """
+        url = os.path.join(self.base_url, make_endpoint(endpoint, **args))
+        resp = SESSIONS.request(method, url, headers={'X-MBX-APIKEY': self.api_key})
+        return resp.json()
+
     def make_public_request(self, endpoint, **args):
         return make_get_request(self.base_url, endpoint, **args)
     
     def get_account(self):
         return self.make_signed_request("GET", "account")
     
+    def get_symbol_rules(self, symbol):
+        """
+        tick size / step size / min notional of symbol, ie BTCUSDT, from the shared exchangeInfo cache
+        """
+        return get_symbol_rules_cache(self.exchange).get(symbol)
+
     def get_order_book(self, symbol, limit=10):
         return self.make_public_request("depth", symbol=symbol, limit=limit)
     
-    def post_order(self, symbol, side, type_, quantity, price, timeInForce):
+    def post_order(self, symbol, side, type_, quantity, price, timeInForce, **params):
+        """
+        **params, any other order parameter, ie newClientOrderId, reduceOnly
+        """
         params = {
             "symbol": symbol,
             "side": side.upper(),
@@ -79,24 +90,60 @@ class BinanceClient:
             "quantity": quantity,
             "price": price,
             "timeInForce": timeInForce,
+            **params,
         }
+        params = {k: v for k, v in params.items() if v is not None}  # MARKET orders have no price / timeInForce
         return self.make_signed_request("POST", "order", body_in=params)
-    
+
+    def post_batch_orders(self, orders):
+        """
+        futures only, up to 5 orders in one request, ie [{symbol, side, type, quantity, price, timeInForce}]
+
+        returns;
+            one ack or {code, msg} error per order, same order as orders
+        """
+        batch = [{k: str(v) for k, v in o.items() if v is not None} for o in orders]  # values must be strings
+        return self.make_signed_request("POST", "batchOrders", body_in={'batchOrders': json.dumps(batch)})
+
     def cancel_open_orders(self, symbol):
         """
-        symbol (use base), ie BTC , function converts to BTCUSDT
+        symbol, ie BTCUSDT, or base ie BTC which is converted to BTCUSDT
         """
-        return self.make_signed_request("DELETE", "allOpenOrders", body_in={'symbol': f'{symbol}USDT'})
+        symbol = symbol if symbol.endswith('USDT') else f'{symbol}USDT'
+        return self.make_signed_request("DELETE", "allOpenOrders", body_in={'symbol': symbol})
     
+    @property
+    def listen_key_endpoint(self):
+        return 'userDataStream' if self.exchange == 'BINANCE' else 'listenKey'
+
+    def create_listen_key(self):
+        """
+        user data stream key, valid 60mins unless kept alive
+        """
+        return self.make_api_key_request("POST", self.listen_key_endpoint)['listenKey']
+
+    def keep_alive_listen_key(self, listen_key):
+        return self.make_api_key_request("PUT", self.listen_key_endpoint, listenKey=listen_key)
+
+    def close_listen_key(self, listen_key):
+        return self.make_api_key_request("DELETE", self.listen_key_endpoint, listenKey=listen_key)
+
     def get_spot(self, symbs):
-        if isinstance(symbs, str):
-            symbs = [symbs]
-        binance_prices = requests.get(f"https://api.binance.com/api/v3/ticker/price").json()
-        return {s: float(d['price']) for d in binance_prices for s in symbs if d['symbol'] == f'{s.upper()}USDT'}
+        # spot prices from the shared bulk ticker cache
+        return get_ticker_cache('BINANCE').get_spot(symbs)
     
-    def get_open_futs_positions(self, ignore_usdt_in_key=False):
-        position = self.get_account()['positions']
+    def get_open_futs_positions(self, ignore_usdt_in_key=False, account=None):
+        """
+        account (optional), response of get_account to reuse instead of fetching again
+        """
+        if account is None:
+            account = self.get_account()
+        return self.parse_open_futs_positions(account, ignore_usdt_in_key=ignore_usdt_in_key)
+
+    @staticmethod
+    def parse_open_futs_positions(account, ignore_usdt_in_key=False):
+        position = account['positions']
         open_futs = {d['symbol']: float(d['positionAmt']) for d in position if abs(float(d['positionAmt'])) > 0}
         if ignore_usdt_in_key:
             open_futs = {k[:-4]: v for k, v in open_futs.items()}
-        return open_futs
\ No newline at end of file
+        return open_futs
@@ -0,0 +1,382 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+import aiohttp
+
+from .fill_store import MAX_FILLS_PER_SYMBOL, FillStore
+from .utils_api import EXCHANGE_TO_WS_URL
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_INTERVAL_S = 30 * 60    # listenKey expires after 60mins without a keep-alive
+RECONNECT_DELAY_S = 1
+MAX_RECONNECT_DELAY_S = 60
+HEARTBEAT_S = 30
+
+
+class BinanceStream:
+    """
+    Websocket feed keeping Binance account / market state in memory
+
+    one combined stream connection carries the user-data stream (positions, wallet balances,
+    unrealised pnl, fills) and per symbol bookTicker / markPrice / depth diff streams, the
+    connection runs on an asyncio loop in a background thread, reads are lock protected copies
+
+    stream = BinanceStream(client, symbols=['BTCUSDT', 'ETHUSDT']).start()
+    stream.wait_ready(10)
+    stream.get_top_of_book('BTCUSDT')
+
+    ws_url can point at a local websocket stand-in, user_data=False skips the listenKey calls
+    """
+
+    def __init__(
+            self,
+            client,
+            symbols=(),
+            book_ticker=True,
+            mark_price=True,
+            depth=False,
+            user_data=True,
+            ws_url=None,
+            keepalive_interval=KEEPALIVE_INTERVAL_S,
+            max_fills=MAX_FILLS_PER_SYMBOL,
+    ):
+        """
+        :param client: BinanceClient, used for the listenKey and to seed account state over REST
+        :param symbols: ie ['BTCUSDT'], market streams subscribed per symbol
+        :param depth: subscribe to <symbol>@depth@100ms diffs, handled by listeners (see OrderBook)
+        :param max_fills: fills kept in memory per symbol
+        """
+        self.client = client
+        self.symbols = [s.upper() for s in symbols]
+        self.book_ticker = book_ticker
+        self.mark_price = mark_price and client.exchange != 'BINANCE'  # futures only
+        self.depth = depth
+        self.user_data = user_data and client.api_key is not None
+        self.ws_url = (ws_url or EXCHANGE_TO_WS_URL[client.exchange]).rstrip('/')
+        self.keepalive_interval = keepalive_interval
+
+        self._lock = threading.Lock()
+        self.positions = {}          # symbol -> position amount
+        self.urlz_pnl = {}           # symbol -> unrealised pnl
+        self.balances = {}           # asset -> wallet balance
+        self.top_of_book = {}        # symbol -> {bid, bid_qty, ask, ask_qty, time}
+        self.mark_prices = {}        # symbol -> mark price
+        self.funding_rates = {}      # symbol -> funding rate
+        self.fill_store = FillStore(client, maxlen=max_fills)  # fills of the user stream, synced from userTrades by its users
+        self.order_books = {}        # symbol -> OrderBook fed by depth diffs, see order_book.attach_order_books
+        self.last_update = None      # local epoch seconds of the last message
+        self.connected = False
+        self.seeded = False          # account state loaded, deltas from the stream are applied on top
+        self.seeded_at_ms = None     # local ms just before the seeding get_account, older account deltas are dropped
+        self.reconnects = 0
+
+        self._listeners = defaultdict(list)  # event type -> [callback(data)]
+        self.listen_key = None
+        self._ws = None
+        self._loop = None
+        self._thread = None
+        self._stop = None
+        self._ready = threading.Event()
+
+    ################################# listeners
+
+    def add_listener(self, event_type, callback):
+        """
+        callback(data) for every message of event_type (ie 'depthUpdate', 'ORDER_TRADE_UPDATE'),
+        runs on the stream thread so keep it short, '*' receives every message,
+        'connected' fires on every (re)connect once the stream is subscribed
+        """
+        self._listeners[event_type].append(callback)
+        return self
+
+    def _emit(self, event_type, data):
+        for callback in self._listeners.get(event_type, []) + self._listeners.get('*', []):
+            try:
+                callback(data)
+            except Exception as e:
+                logger.exception(f"stream listener for {event_type} failed|e={e}")
+
+    ################################# state reads
+
+    def get_positions(self, ignore_usdt_in_key=False):
+        with self._lock:
+            positions = {k: v for k, v in self.positions.items() if v}
+        if ignore_usdt_in_key:
+            positions = {k[:-4]: v for k, v in positions.items()}
+        return positions
+
+    def get_balances(self):
+        with self._lock:
+            return {k: v for k, v in self.balances.items() if v}
+
+    def get_urlz_pnl(self):
+        with self._lock:
+            return {k: v for k, v in self.urlz_pnl.items() if v}
+
+    def get_top_of_book(self, symbol):
+        """
+        {bid, bid_qty, ask, ask_qty, time} or None before the first update
+        """
+        with self._lock:
+            tob = self.top_of_book.get(symbol.upper())
+            return dict(tob) if tob else None
+
+    def get_mark_price(self, symbol):
+        with self._lock:
+            return self.mark_prices.get(symbol.upper())
+
+    def get_fills(self, symbol=None, since_ms=None):
+        """
+        fills oldest first, {id, symbol, side, qty, price, quoteQty, time}
+        """
+        if symbol is not None:
+            return self.fill_store.get(symbol.upper(), since_ms)
+        fills = [f for s in self.fill_store.symbols() for f in self.fill_store.get(s, since_ms)]
+        return sorted(fills, key=lambda f: f['time'])
+
+    @property
+    def is_live(self):
+        return self.connected and (self.seeded or not self.user_data)
+
+    def wait_ready(self, timeout=None):
+        """
+        block until connected (and account state seeded), returns False on timeout
+        """
+        return self._ready.wait(timeout)
+
+    ################################# message handling
+
+    def handle_message(self, msg):
+        """
+        apply one raw or combined stream message to the local state
+        """
+        stream = msg.get('stream')
+        data = msg.get('data', msg)
+        event_type = data.get('e')
+        if event_type is None and stream and stream.endswith('@bookTicker'):
+            event_type = 'bookTicker'   # spot bookTicker has no event type
+
+        self.last_update = time.time()
+        handler = self._HANDLERS.get(event_type)
+        if handler is not None:
+            handler(self, data)
+        if event_type is not None:
+            self._emit(event_type, data)
+
+    def _on_book_ticker(self, data):
+        with self._lock:
+            self.top_of_book[data['s']] = {
+                'bid': float(data['b']),
+                'bid_qty': float(data['B']),
+                'ask': float(data['a']),
+                'ask_qty': float(data['A']),
+                'time': data.get('T') or data.get('E'),
+            }
+
+    def _on_mark_price(self, data):
+        with self._lock:
+            self.mark_prices[data['s']] = float(data['p'])
+            if data.get('r') not in (None, ''):
+                self.funding_rates[data['s']] = float(data['r'])
+
+    def _is_before_seed(self, data):
+        # account deltas buffered while the REST seed was in flight, already in (or older than) it
+        return self.seeded_at_ms is not None and data.get('E', self.seeded_at_ms) < self.seeded_at_ms
+
+    def _on_futs_account_update(self, data):
+        if self._is_before_seed(data):
+            return
+        account = data['a']
+        with self._lock:
+            for b in account.get('B', []):
+                self.balances[b['a']] = float(b['wb'])
+            for p in account.get('P', []):
+                self.positions[p['s']] = float(p['pa'])
+                self.urlz_pnl[p['s']] = float(p['up'])
+
+    def _on_spot_account_update(self, data):
+        if self._is_before_seed(data):
+            return
+        with self._lock:
+            for b in data.get('B', []):
+                self.balances[b['a']] = float(b['f']) + float(b['l'])
+
+    def _on_futs_order_update(self, data):
+        o = data['o']
+        if o['x'] != 'TRADE':
+            return
+        qty, price = float(o['l']), float(o['L'])
+        self.fill_store.add({
+            'id': o['t'], 'symbol': o['s'], 'side': o['S'], 'qty': qty, 'price': price,
+            'quoteQty': qty * price, 'time': o['T'],
+        })
+
+    def _on_spot_order_update(self, data):
+        if data['x'] != 'TRADE':
+            return
+        qty, price = float(data['l']), float(data['L'])
+        self.fill_store.add({
+            'id': data['t'], 'symbol': data['s'], 'side': data['S'], 'qty': qty, 'price': price,
+            'quoteQty': qty * price, 'time': data['T'],
+        })
+
+    def _on_listen_key_expired(self, data):
+        logger.warning("listenKey expired, reconnecting")
+        self.listen_key = None
+        if self._ws is not None:
+            asyncio.ensure_future(self._ws.close())
+
+    _HANDLERS = {
+        'bookTicker': _on_book_ticker,
+        'markPriceUpdate': _on_mark_price,
+        'ACCOUNT_UPDATE': _on_futs_account_update,
+        'outboundAccountPosition': _on_spot_account_update,
+        'ORDER_TRADE_UPDATE': _on_futs_order_update,
+        'executionReport': _on_spot_order_update,
+        'listenKeyExpired': _on_listen_key_expired,
+    }
+
+    def seed(self, account, requested_at_ms=None):
+        """
+        load positions / balances from a get_account response, the stream only sends changes
+
+        :param requested_at_ms: local ms the request was sent, account events older than it are dropped
+        """
+        with self._lock:
+            self.seeded_at_ms = requested_at_ms
+            if 'positions' in account:  # futures
+                for d in account['positions']:
+                    self.positions[d['symbol']] = float(d['positionAmt'])
+                    self.urlz_pnl[d['symbol']] = float(d['unrealizedProfit'])
+                for d in account['assets']:
+                    self.balances[d['asset']] = float(d['walletBalance'])
+            else:  # spot
+                for d in account['balances']:
+                    self.balances[d['asset']] = float(d['free']) + float(d['locked'])
+            self.seeded = True
+
+    ################################# connection
+
+    def streams(self):
+        streams = [self.listen_key] if self.listen_key else []
+        for symbol in self.symbols:
+            s = symbol.lower()
+            if self.book_ticker:
+                streams.append(f'{s}@bookTicker')
+            if self.mark_price:
+                streams.append(f'{s}@markPrice@1s')
+            if self.depth:
+                streams.append(f'{s}@depth@100ms')
+        return streams
+
+    def url(self):
+        return f"{self.ws_url}/stream?streams={'/'.join(self.streams())}"
+
+    async def _call(self, func, *args):
+        # blocking REST calls run off the event loop
+        return await self._loop.run_in_executor(None, func, *args)
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            if self.listen_key:
+                try:
+                    await self._call(self.client.keep_alive_listen_key, self.listen_key)
+                except Exception as e:
+                    logger.warning(f"listenKey keep-alive failed|e={e}")
+
+    async def _connect_once(self, session):
+        if self.user_data and self.listen_key is None:
+            self.listen_key = await self._call(self.client.create_listen_key)
+
+        async with session.ws_connect(self.url(), heartbeat=HEARTBEAT_S) as ws:
+            self._ws = ws
+            # seed after subscribing so no update between the REST snapshot and the stream is lost,
+            # the ones buffered meanwhile that are older than the request are dropped
+            if self.user_data:
+                requested_at_ms = int(time.time() * 1000)
+                self.seed(await self._call(self.client.get_account), requested_at_ms)
+            self.connected = True
+            self._ready.set()
+            logger.info(f"stream connected {len(self.streams())} streams")
+            self._emit('connected', {'reconnects': self.reconnects})
+
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    try:
+                        self.handle_message(json.loads(msg.data))
+                    except Exception as e:
+                        logger.exception(f"bad stream message|e={e}|msg={msg.data[:200]}")
+                elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    break
+
+    async def _run(self):
+        self._stop = asyncio.Event()
+        delay = RECONNECT_DELAY_S
+        async with aiohttp.ClientSession() as session:
+            keepalive = asyncio.ensure_future(self._keepalive()) if self.user_data else None
+            while not self._stop.is_set():
+                started = time.monotonic()
+                try:
+                    await self._connect_once(session)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"stream error|e={e}")
+                finally:
+                    # deltas sent while down are lost, the next connection seeds again
+                    self.connected = False
+                    self.seeded = False
+                    self._ws = None
+                    self._ready.clear()
+
+                if self._stop.is_set():
+                    break
+                # a connection that lived a while resets the backoff
+                delay = RECONNECT_DELAY_S if time.monotonic() - started > MAX_RECONNECT_DELAY_S else min(delay * 2, MAX_RECONNECT_DELAY_S)
+                self.reconnects += 1
+                logger.info(f"stream reconnecting in {delay}s")
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+            if keepalive is not None:
+                keepalive.cancel()
+        if self.listen_key:
+            try:
+                await self._call(self.client.close_listen_key, self.listen_key)
+            except Exception:
+                pass
+            self.listen_key = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_until_complete, args=(self._run(),), name='binance-stream', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        if self._loop is None or self._thread is None:
+            return
+
+        def _stop():
+            if self._stop is not None:
+                self._stop.set()
+            if self._ws is not None:
+                asyncio.ensure_future(self._ws.close())
+
+        self._loop.call_soon_threadsafe(_stop)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def __repr__(self):
+        return f"BinanceStream({self.client.exchange}, symbols={self.symbols}, live={self.is_live})"
@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import threading
+
+from utils import TtlState, write_json_atomic
+
+from .utils_api import EXCHANGE_TO_BASE_URL, make_get_request
+
+logger = logging.getLogger(__name__)
+
+COINGECKO_INDEX_PATH = os.environ.get(
+    'COINGECKO_INDEX_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'defi_public', 'coingecko', 'coins_list.json'),
+)
+COINGECKO_INDEX_TTL = 24 * 60 * 60  # seconds, new listings show up within a day
+RETRY_AFTER_S = 5 * 60              # wait before retrying a failed refresh while a stale index is served
+
+# symbols shared by several coins, the one we mean
+SYMBOL_2_ID_OVERRIDES = {
+    'btc': 'bitcoin',
+    'eth': 'ethereum',
+    'usdt': 'tether',
+    'usdc': 'usd-coin',
+    'dai': 'dai',
+    'bnb': 'binancecoin',
+    'sol': 'solana',
+    'arb': 'arbitrum',
+    'op': 'optimism',
+    'gmx': 'gmx',
+    'crv': 'curve-dao-token',
+    'uni': 'uniswap',
+    'link': 'chainlink',
+    'avax': 'avalanche-2',
+    'matic': 'matic-network',
+}
+
+
+class CoinGeckoIndex:
+    """
+    symbol -> CoinGecko coin id from /coins/list, persisted to disk and refreshed on a TTL
+
+    duplicate symbols resolve deterministically;
+        1) SYMBOL_2_ID_OVERRIDES
+        2) the coin whose id is the symbol itself
+        3) the first id in sorted order
+
+    COINGECKO_INDEX.get_id('BTC')  # 'bitcoin'
+    """
+
+    def __init__(self, path=COINGECKO_INDEX_PATH, ttl=COINGECKO_INDEX_TTL, overrides=SYMBOL_2_ID_OVERRIDES):
+        """
+        :param ttl: seconds before /coins/list is downloaded again, None never expires
+        """
+        self.path = path
+        self.overrides = {k.lower(): v for k, v in overrides.items()}
+        self.state = TtlState(ttl, RETRY_AFTER_S)
+        self._symbol_2_ids = None   # symbol -> sorted [ids]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def build(coins):
+        symbol_2_ids = {}
+        for coin in coins:
+            symbol = (coin.get('symbol') or '').lower()
+            if symbol and coin.get('id'):
+                symbol_2_ids.setdefault(symbol, []).append(coin['id'])
+        return {s: sorted(ids) for s, ids in symbol_2_ids.items()}
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+            self._symbol_2_ids = stored['symbol_2_ids']
+            self.state.fetched(stored['fetched_at'])
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+    def refresh(self):
+        coins = make_get_request(EXCHANGE_TO_BASE_URL['COINGECKO'], 'coins/list')
+        symbol_2_ids = self.build(coins)
+        if not symbol_2_ids:
+            raise ValueError(f'empty coins list: {str(coins)[:200]}')
+        self._symbol_2_ids = symbol_2_ids
+        self.state.fetched()
+        write_json_atomic({'fetched_at': self.fetched_at, 'symbol_2_ids': symbol_2_ids}, self.path)
+        return symbol_2_ids
+
+    @property
+    def fetched_at(self):
+        return self.state.fetched_at
+
+    def is_stale(self):
+        return self.state.is_stale()
+
+    @property
+    def symbol_2_ids(self):
+        if self._symbol_2_ids is None or self.is_stale():
+            with self._lock:
+                if self._symbol_2_ids is None:
+                    self._load()
+                if self.is_stale():
+                    try:
+                        self.refresh()
+                    except Exception as e:
+                        if self._symbol_2_ids is None:
+                            raise
+                        # keep serving the stale index
+                        self.state.failed()
+                        logger.warning(f"coingecko coins list refresh failed, using index from {self.fetched_at}|e={e}")
+        return self._symbol_2_ids
+
+    def get_ids(self, symbol):
+        return list(self.symbol_2_ids.get(symbol.lower(), []))
+
+    def get_id(self, symbol):
+        """
+        returns;
+            coin id or None if CoinGecko has no such symbol
+        """
+        symbol = symbol.lower()
+        override = self.overrides.get(symbol)
+        if override is not None:
+            return override
+        ids = self.symbol_2_ids.get(symbol)
+        if not ids:
+            return None
+        return symbol if symbol in ids else ids[0]
+
+
+# process wide index, shared by every MarketDataGateway
+COINGECKO_INDEX = CoinGeckoIndex()
@@ -1,13 +1,71 @@
+from .defillama_tvl import TVL_TTL_S, TvlStore
+from .defillama_yields import YIELDS_TTL_S, YieldsIndex
 from .utils_api import EXCHANGE_TO_BASE_URL, make_get_request
 
 
 class DlClient:
 
-    def __init__(self):
+    def __init__(self, yields_filter=None, yields_ttl=YIELDS_TTL_S, tvl_ttl=TVL_TTL_S):
+        """
+        :param yields_filter: YieldsFilter of the pools get_yields keeps, None keeps every pool
+        :param yields_ttl: seconds the filtered pools are served before the dump is streamed again
+        :param tvl_ttl: seconds stored TVL histories are served before they are downloaded again
+        """
         self.base_url = EXCHANGE_TO_BASE_URL["DEFILLAMA"]
+        self.yields_filter = yields_filter
+        self.yields_ttl = yields_ttl
+        self.tvl_ttl = tvl_ttl
+        self._yields = None
+        self._tvl_store = None
+
+    # built on first use, a client that only calls get_protocol_tvl / get_yields_raw touches no disk
+
+    @property
+    def yields(self):
+        if self._yields is None:
+            self._yields = YieldsIndex(self.yields_filter, ttl=self.yields_ttl)
+        return self._yields
+
+    @property
+    def tvl_store(self):
+        if self._tvl_store is None:
+            self._tvl_store = TvlStore(fetch=self.get_protocol_tvl, ttl=self.tvl_ttl)
+        return self._tvl_store
 
     def get_protocol_tvl(self, protocol):
+        """
+        raw /protocol/{name} response, full history of every chain, see get_tvl for the stored series
+        """
         return make_get_request(self.base_url, f"protocol/{protocol.lower()}")
 
-    def get_yields(self):
+    def get_tvl(self, protocol, chains=None, start=None):
+        """
+        {chain: array of (date, tvl)} from the local store, 'total' is the protocol wide series
+        """
+        return self.tvl_store.get(protocol, chains, start)
+
+    def get_tvls(self, protocols, chains=None, start=None):
+        """
+        {protocol: {chain: array of (date, tvl)}}, stale protocols downloaded concurrently
+        """
+        return self.tvl_store.get_many(protocols, chains, start)
+
+    def get_yields(self, project=None, chain=None, symbol=None, min_tvl_usd=None):
+        """
+        pools of the yields.llama.fi/pools dump kept by yields_filter, narrowed by the given criteria
+
+        the dump is streamed and parsed pool by pool, only the kept pools are stored (columnar)
+
+        returns;
+            list of pool dicts, ie {'pool', 'project', 'chain', 'symbol', 'tvlUsd', 'apy', ...}
+        """
+        return self.yields.select(project, chain, symbol, min_tvl_usd)
+
+    def get_yields_table(self):
+        return self.yields.table
+
+    def get_yields_raw(self):
+        """
+        raw yields.llama.fi/pools response {'status', 'data': [pool, ...]}, what get_yields returned before the index
+        """
         return make_get_request('https://yields.llama.fi', 'pools')
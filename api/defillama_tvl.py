@@ -0,0 +1,184 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TVL_STORE_DIR = os.environ.get('TVL_STORE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'defi_public', 'tvl'))
+TVL_TTL_S = 60 * 60          # DefiLlama updates the latest point about hourly
+TVL_MAX_WORKERS = 8          # concurrent protocol downloads in get_many
+
+TVL_DTYPE = np.dtype([
+    ('date', '<i8'),   # unix seconds
+    ('tvl', '<f8'),    # usd
+])
+
+TOTAL = 'total'  # key of the protocol wide series, the others are chainTvls keys (ie 'Arbitrum', 'Arbitrum-staking')
+
+
+def to_tvl_array(points):
+    """
+    [{'date': .., 'totalLiquidityUSD': ..}] -> TVL_DTYPE array sorted by date, last duplicate wins
+    """
+    out = np.empty(len(points), dtype=TVL_DTYPE)
+    if not len(points):
+        return out
+    out['date'] = [int(p['date']) for p in points]
+    out['tvl'] = [p.get('totalLiquidityUSD') or 0. for p in points]
+    out = out[np.argsort(out['date'], kind='stable')]
+    keep = np.append(out['date'][1:] != out['date'][:-1], True)
+    return out[keep]
+
+
+def parse_protocol_tvl(resp):
+    """
+    /protocol/{name} response -> {TOTAL: array, chain: array}
+    """
+    series = {TOTAL: to_tvl_array(resp.get('tvl') or [])}
+    for chain, d in (resp.get('chainTvls') or {}).items():
+        series[chain] = to_tvl_array(d.get('tvl') or [])
+    return series
+
+
+def merge_series(old, new):
+    """
+    append the points of new from the last stored date on, history before it is never rewritten
+    (the last stored point is the intraday one and gets replaced)
+    """
+    if not len(old):
+        return new
+    new = new[new['date'] >= old['date'][-1]]
+    if not len(new):
+        return old
+    return np.concatenate([old[old['date'] < new['date'][0]], new])
+
+
+class TvlStore:
+    """
+    per protocol TVL history, one .npz per protocol holding a typed array per chain
+
+    DefiLlama has no 'since' parameter on /protocol/{name}, so a refresh still downloads the
+    full history, but only once per ttl, only new points are merged in and every read in
+    between is served from disk
+
+    store = TvlStore(fetch=DlClient().get_protocol_tvl)
+    store.get('gmx')['Arbitrum']                  # TVL_DTYPE array, date ascending
+    store.get_many(['gmx', 'aave-v3', 'curve'])   # stale ones downloaded concurrently
+    """
+
+    def __init__(self, path=TVL_STORE_DIR, fetch=None, ttl=TVL_TTL_S, max_workers=TVL_MAX_WORKERS):
+        """
+        :param fetch: fetch(protocol) -> /protocol/{name} response
+        :param ttl: seconds a stored protocol is served before it is refreshed, None never expires
+        """
+        self.path = path
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _file(self, protocol):
+        return os.path.join(self.path, f'{protocol.lower()}.npz')
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    ################################# disk
+
+    def read(self, protocol, chains=None, start=None):
+        """
+        returns;
+            ({chain: TVL_DTYPE array with date >= start}, fetched_at), ({}, None) if not stored
+        """
+        f = self._file(protocol)
+        if not os.path.exists(f):
+            return {}, None
+        with np.load(f) as npz:
+            names = [str(c) for c in npz['chains']]
+            series = {
+                chain: npz[f's{i}'] for i, chain in enumerate(names)
+                if chains is None or chain in chains
+            }
+            fetched_at = float(npz['fetched_at'])
+        if start is not None:
+            series = {c: s[np.searchsorted(s['date'], start, side='left'):] for c, s in series.items()}
+        return series, fetched_at
+
+    def write(self, protocol, series, fetched_at=None):
+        """
+        merge series in (atomic replace)
+
+        returns;
+            number of new points over every chain
+        """
+        f = self._file(protocol)
+        with self._key_lock(f):
+            old, _ = self.read(protocol)
+            merged, added = dict(old), 0
+            for chain, new in series.items():
+                prev = old.get(chain, np.empty(0, dtype=TVL_DTYPE))
+                merged[chain] = merge_series(prev, new)
+                added += len(merged[chain]) - len(prev)
+            chains = list(merged)
+            arrays = {f's{i}': merged[c] for i, c in enumerate(chains)}
+            os.makedirs(self.path, exist_ok=True)  # on first write, not on construction
+            tmp = f'{f}.{os.getpid()}.tmp.npz'
+            np.savez(tmp, chains=np.array(chains, dtype=str), fetched_at=np.float64(fetched_at or time.time()), **arrays)
+            os.replace(tmp, f)
+        return added
+
+    def delete(self, protocol):
+        f = self._file(protocol)
+        if os.path.exists(f):
+            os.remove(f)
+
+    ################################# network
+
+    def is_stale(self, protocol, now=None):
+        f = self._file(protocol)
+        if not os.path.exists(f):
+            return True
+        if self.ttl is None:
+            return False
+        with np.load(f) as npz:
+            fetched_at = float(npz['fetched_at'])
+        return (now or time.time()) - fetched_at > self.ttl
+
+    def update(self, protocol):
+        fetched_at = time.time()
+        return self.write(protocol, parse_protocol_tvl(self.fetch(protocol)), fetched_at)
+
+    def get(self, protocol, chains=None, start=None, refresh=True):
+        """
+        {chain: TVL_DTYPE array} from disk, refreshed first when older than ttl,
+        the stored history is served if the refresh fails
+        """
+        if refresh and self.fetch is not None and self.is_stale(protocol):
+            try:
+                self.update(protocol)
+            except Exception as e:
+                if not os.path.exists(self._file(protocol)):
+                    raise
+                logger.warning(f"tvl refresh failed for {protocol}, serving stored history|e={e}")
+        return self.read(protocol, chains, start)[0]
+
+    def get_many(self, protocols, chains=None, start=None, refresh=True):
+        """
+        {protocol: {chain: TVL_DTYPE array}}, stale protocols are downloaded concurrently,
+        a protocol that fails with nothing stored maps to {}
+        """
+        stale = [p for p in protocols if refresh and self.fetch is not None and self.is_stale(p)]
+        if stale:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(stale))) as pool:
+                futures = {p: pool.submit(self.update, p) for p in stale}
+            for p, future in futures.items():
+                e = future.exception()
+                if e is not None:
+                    logger.warning(f"tvl refresh failed for {p}|e={e}")
+        return {p: self.read(p, chains, start)[0] for p in protocols}
@@ -0,0 +1,239 @@
+import codecs
+import json
+import logging
+import re
+import threading
+import time
+
+import numpy as np
+
+from utils import TtlState
+
+from .session_manager import SESSIONS
+
+logger = logging.getLogger(__name__)
+
+YIELDS_URL = 'https://yields.llama.fi/pools'
+YIELDS_TTL_S = 10 * 60           # the pools dump is recomputed about hourly, no need to stream it more often
+YIELDS_CHUNK_SIZE = 64 * 1024    # bytes read from the socket per step
+RETRY_AFTER_S = 60               # wait before re-streaming after a failed refresh while a stale table is served
+
+STR_COLUMNS = ('pool', 'project', 'chain', 'symbol')
+NUM_COLUMNS = ('tvlUsd', 'apy', 'apyBase', 'apyReward', 'apyMean30d')
+BOOL_COLUMNS = ('stablecoin',)
+
+_SKIP_RE = re.compile(r'[\s,]*')
+
+
+def _decode_chunks(chunks, encoding='utf-8'):
+    """
+    bytes chunks -> str chunks, multi byte characters split across chunks are carried over
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in chunks:
+        text = decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def iter_json_array(chunks, key='data'):
+    """
+    yield the elements of the array under [[key]] of a streamed json object one at a time,
+    only the element being decoded (plus one chunk) is held in memory
+
+    for pool in iter_json_array(resp.iter_content(YIELDS_CHUNK_SIZE)): ...
+    """
+    decoder = json.JSONDecoder()
+    marker = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    chunks = _decode_chunks(chunks)
+
+    buf = ''
+    for chunk in chunks:
+        buf += chunk
+        m = marker.search(buf)
+        if m:
+            buf = buf[m.end():]
+            break
+        buf = buf[-(len(key) + 64):]  # the marker may straddle two chunks
+    else:
+        return
+
+    pos, exhausted = 0, False
+    while True:
+        pos = _SKIP_RE.match(buf, pos).end()
+        if pos < len(buf):
+            if buf[pos] == ']':
+                return
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+            else:
+                yield obj
+                continue
+        if exhausted:
+            raise ValueError(f'json array "{key}" is truncated')
+        # element incomplete, drop what was consumed and read on
+        chunk = next(chunks, None)
+        exhausted = chunk is None
+        buf = buf[pos:] + (chunk or '')
+        pos = 0
+
+
+class YieldsFilter:
+    """
+    keeps pools of the given projects / chains / symbols, None matches everything,
+    a pool symbol matches when any of its legs does (ie 'WETH-USDC' matches 'USDC')
+
+    YieldsFilter(projects=['gmx', 'aave-v3'], chains=['Arbitrum'], min_tvl_usd=1e6)
+    """
+
+    def __init__(self, projects=None, chains=None, symbols=None, min_tvl_usd=None):
+        self.projects = None if projects is None else {p.lower() for p in projects}
+        self.chains = None if chains is None else {c.lower() for c in chains}
+        self.symbols = None if symbols is None else {s.upper() for s in symbols}
+        self.min_tvl_usd = min_tvl_usd
+
+    def __call__(self, pool):
+        if self.projects is not None and (pool.get('project') or '').lower() not in self.projects:
+            return False
+        if self.chains is not None and (pool.get('chain') or '').lower() not in self.chains:
+            return False
+        if self.symbols is not None and self.symbols.isdisjoint((pool.get('symbol') or '').upper().split('-')):
+            return False
+        if self.min_tvl_usd is not None and (pool.get('tvlUsd') or 0) < self.min_tvl_usd:
+            return False
+        return True
+
+    def __repr__(self):
+        return f"YieldsFilter(projects={self.projects}, chains={self.chains}, symbols={self.symbols}, min_tvl_usd={self.min_tvl_usd})"
+
+
+class YieldsTable:
+    """
+    pools as columns, strings as lists, numbers as float arrays (nan when missing),
+    with row indices per project and per chain (lower case keys)
+    """
+
+    def __init__(self, pools=()):
+        pools = list(pools)
+        self.columns = {c: [p.get(c) or '' for p in pools] for c in STR_COLUMNS}
+        for c in NUM_COLUMNS:
+            self.columns[c] = np.array([np.nan if p.get(c) is None else p[c] for p in pools], dtype=float)
+        for c in BOOL_COLUMNS:
+            self.columns[c] = np.array([bool(p.get(c)) for p in pools], dtype=bool)
+        self.project_2_rows = self._make_index(self.columns['project'])
+        self.chain_2_rows = self._make_index(self.columns['chain'])
+
+    @staticmethod
+    def _make_index(values):
+        key_2_rows = {}
+        for row, value in enumerate(values):
+            key_2_rows.setdefault(value.lower(), []).append(row)
+        return {k: np.array(rows, dtype=np.intp) for k, rows in key_2_rows.items()}
+
+    def __len__(self):
+        return len(self.columns['pool'])
+
+    def rows(self, project=None, chain=None, symbol=None, min_tvl_usd=None):
+        """
+        row numbers matching every given criteria, in table order
+        """
+        rows = np.arange(len(self), dtype=np.intp)
+        empty = np.empty(0, dtype=np.intp)
+        if project is not None:
+            rows = self.project_2_rows.get(project.lower(), empty)
+        if chain is not None:
+            rows = np.intersect1d(rows, self.chain_2_rows.get(chain.lower(), empty), assume_unique=True)
+        if min_tvl_usd is not None:
+            rows = rows[self.columns['tvlUsd'][rows] >= min_tvl_usd]
+        if symbol is not None:
+            symbol = symbol.upper()
+            symbols = self.columns['symbol']
+            rows = np.array([r for r in rows if symbol in symbols[r].upper().split('-')], dtype=np.intp)
+        return rows
+
+    def column(self, name, rows=None):
+        values = self.columns[name]
+        if rows is None:
+            return values
+        if isinstance(values, list):
+            return [values[r] for r in rows]
+        return values[rows]
+
+    def to_records(self, rows=None):
+        """
+        list of pool dicts (table columns only)
+        """
+        rows = range(len(self)) if rows is None else rows
+        return [
+            {c: (v[r] if isinstance(v, list) else v[r].item()) for c, v in self.columns.items()}
+            for r in rows
+        ]
+
+    def __repr__(self):
+        return f"YieldsTable(pools={len(self)}, projects={len(self.project_2_rows)}, chains={len(self.chain_2_rows)})"
+
+
+class YieldsIndex:
+    """
+    DefiLlama pools matching a YieldsFilter, streamed off the wire and kept as a YieldsTable,
+    re-streamed once older than ttl, the stale table is served if a refresh fails
+
+    index = YieldsIndex(YieldsFilter(projects=['gmx']))
+    index.select(chain='Arbitrum')
+    """
+
+    def __init__(self, filter_=None, ttl=YIELDS_TTL_S, url=YIELDS_URL, chunk_size=YIELDS_CHUNK_SIZE):
+        self.filter = filter_ if filter_ is not None else YieldsFilter()
+        self.url = url
+        self.chunk_size = chunk_size
+        self.state = TtlState(ttl, RETRY_AFTER_S, clock=time.monotonic)
+        self.n_scanned = 0        # pools seen in the last refresh, kept or not
+        self._table = None
+        self._lock = threading.Lock()
+
+    @property
+    def updated_at(self):
+        # monotonic seconds of the last successful refresh
+        return self.state.fetched_at
+
+    def is_stale(self):
+        return self.state.is_stale()
+
+    def refresh(self):
+        n_scanned, kept = 0, []
+        with SESSIONS.get(self.url, stream=True) as resp:
+            resp.raise_for_status()
+            for pool in iter_json_array(resp.iter_content(self.chunk_size)):
+                n_scanned += 1
+                if self.filter(pool):
+                    kept.append(pool)
+        self._table, self.n_scanned = YieldsTable(kept), n_scanned
+        self.state.fetched()
+        return self._table
+
+    @property
+    def table(self):
+        if self.is_stale():
+            with self._lock:
+                if self.is_stale():  # another thread may have refreshed while we waited
+                    try:
+                        self.refresh()
+                    except Exception as e:
+                        if self._table is None:
+                            raise
+                        self.state.failed()
+                        logger.warning(f"defillama yields refresh failed, serving table from {self.updated_at}|e={e}")
+        return self._table
+
+    def select(self, project=None, chain=None, symbol=None, min_tvl_usd=None):
+        """
+        list of pool dicts matching every given criteria
+        """
+        table = self.table
+        return table.to_records(table.rows(project, chain, symbol, min_tvl_usd))
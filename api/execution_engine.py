@@ -0,0 +1,321 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .fill_store import FillStore
+
+logger = logging.getLogger(__name__)
+
+EXECUTION_WORKERS = 8
+BATCH_ORDERS_MAX = 5          # orders per batchOrders request (futures)
+ACK_TIMEOUT_S = 10
+CLIENT_ORDER_ID_PREFIX = 'hedge_'
+ORDER_RETENTION_S = 60 * 60   # final orders are dropped from the state after this long
+
+# order status, Binance ones plus the local states before an ack
+PENDING_NEW = 'PENDING_NEW'   # sent, no ack yet
+THROTTLED = 'THROTTLED'       # held back by a per symbol limit, never sent
+FAILED = 'FAILED'             # request errored / rejected by the exchange
+FINAL_STATES = {'FILLED', 'CANCELED', 'EXPIRED', 'REJECTED', 'EXPIRED_IN_MATCH', THROTTLED, FAILED}
+
+BATCH_EXCHANGES = {'BINANCE_FUTURES_USDM', 'BINANCE_FUTURES_COINM'}  # spot has no batchOrders
+
+
+class ExecutionEngine:
+    """
+    Submits orders for many symbols at once on a BinanceClient
+
+    cancels and posts run concurrently on a thread pool, futures orders go out through
+    batchOrders (BATCH_ORDERS_MAX per request), order state is updated from the REST acks
+    and from ORDER_TRADE_UPDATE / executionReport when a BinanceStream is attached
+
+    per symbol min-interval / hourly-volume limits are O(1) reads of a FillStore (the stream's one
+    when attached, it adds every fill), synced incrementally from userTrades (first use, stream
+    down or reconnected)
+
+    engine = ExecutionEngine(client, stream, min_minutes_between_trades={'BTCUSDT': 5}, max_volume_usd_1h={'BTCUSDT': 1e5})
+    engine.submit([{'symbol': 'BTCUSDT', 'side': 'SELL', 'type': 'LIMIT', 'quantity': 0.01, 'price': 30000, 'timeInForce': 'GTC'}])
+    """
+
+    def __init__(
+            self,
+            client,
+            stream=None,
+            min_minutes_between_trades=None,
+            max_volume_usd_1h=None,
+            max_workers=EXECUTION_WORKERS,
+            use_batch=True,
+    ):
+        """
+        :param stream: BinanceStream of the same account, order updates and fills are taken from it
+        :param min_minutes_between_trades: {symbol: minutes}, no order while the last fill is more recent
+        :param max_volume_usd_1h: {symbol: usd}, no order once the fills of the last hour reach it
+        """
+        self.client = client
+        self.stream = stream
+        self.min_minutes_between_trades = dict(min_minutes_between_trades or {})
+        self.max_volume_usd_1h = dict(max_volume_usd_1h or {})
+        self.use_batch = use_batch and client.exchange in BATCH_EXCHANGES
+        self.orders = {}                  # clientOrderId -> order state
+        self.fill_store = stream.fill_store if stream is not None else FillStore(client)
+        self._reconnects = {}             # symbol -> stream reconnects at its last sync
+        self._pending = []                # futures of requests in flight
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='execution')
+        if stream is not None:
+            stream.add_listener('ORDER_TRADE_UPDATE', self._on_futs_order_update)
+            stream.add_listener('executionReport', self._on_spot_order_update)
+
+    ################################# fills / limits
+
+    def add_fill(self, fill):
+        return self.fill_store.add(fill)
+
+    def _ensure_fills(self, symbol):
+        # synced once, afterwards the stream delivers every fill, REST again while it is down
+        # or after a reconnect (fills in the gap are picked up by fromId)
+        stream = self.stream
+        if stream is not None and stream.user_data and stream.is_live:
+            if self.fill_store.is_synced(symbol) and self._reconnects.get(symbol) == stream.reconnects:
+                return
+        self.fill_store.sync(symbol)
+        if stream is not None:
+            self._reconnects[symbol] = stream.reconnects
+
+    def minutes_since_last_trade(self, symbol, now_ms=None):
+        return self.fill_store.minutes_since_last(symbol, now_ms)
+
+    def volume_usd_1h(self, symbol, now_ms=None):
+        return self.fill_store.notional(symbol, now_ms)
+
+    def check_limits(self, symbol):
+        """
+        returns;
+            None if an order on symbol is allowed, otherwise the reason it is not
+        """
+        self._ensure_fills(symbol)
+        min_minutes = self.min_minutes_between_trades.get(symbol)
+        minutes = self.minutes_since_last_trade(symbol)
+        if min_minutes is not None and minutes is not None and minutes < min_minutes:
+            return f"only {int(minutes)}mins elapsed since last {symbol} trade"
+        max_volume = self.max_volume_usd_1h.get(symbol)
+        volume = self.volume_usd_1h(symbol)
+        if max_volume is not None and volume >= max_volume:
+            return f"${volume:.0f} volume for {symbol} over last hour"
+        return None
+
+    ################################# order state
+
+    def _new_order(self, params):
+        order = {
+            'symbol': params['symbol'].upper(),
+            'side': params['side'].upper(),
+            'type': params.get('type', 'LIMIT').upper(),
+            'quantity': params['quantity'],
+            'price': params.get('price'),
+            'timeInForce': params.get('timeInForce', 'GTC'),
+            'clientOrderId': params.get('newClientOrderId') or CLIENT_ORDER_ID_PREFIX + uuid.uuid4().hex[:20],
+            'orderId': None,
+            'status': PENDING_NEW,
+            'executedQty': 0.,
+            'avgPrice': None,
+            'error': None,
+            'sent_at': None,
+            'updated_at': time.time(),
+            'confirmed': False,     # status came from the exchange (ack / stream), not inferred locally
+        }
+        with self._lock:
+            self.orders[order['clientOrderId']] = order
+        return order
+
+    def _update_order(self, client_order_id, confirmed=True, **state):
+        """
+        :param confirmed: False for states inferred locally (THROTTLED, FAILED, CANCELED after a cancel all),
+            the exchange can still correct those
+        """
+        with self._lock:
+            order = self.orders.get(client_order_id)
+            if order is None:
+                return None
+            # the stream can be ahead of the REST ack, never move a confirmed final order back
+            if order['confirmed'] and order['status'] in FINAL_STATES and state.get('status') not in (None, order['status']):
+                state.pop('status')
+            if 'status' in state:
+                state['confirmed'] = confirmed
+            order.update(state, updated_at=time.time())
+            return order
+
+    def _prune(self, now=None):
+        # final orders are only kept for get_orders / debugging, bounded by ORDER_RETENTION_S
+        cutoff = (now or time.time()) - ORDER_RETENTION_S
+        with self._lock:
+            for cid in [cid for cid, o in self.orders.items() if o['status'] in FINAL_STATES and o['updated_at'] < cutoff]:
+                del self.orders[cid]
+
+    def _apply_ack(self, order, ack):
+        if not isinstance(ack, dict) or ('code' in ack and 'orderId' not in ack):
+            self._update_order(order['clientOrderId'], confirmed=False, status=FAILED, error=ack)
+            logger.warning(f"order {order['symbol']} {order['side']} {order['quantity']} failed|resp={ack}")
+            return
+        avg_price = float(ack.get('avgPrice') or 0) or None
+        self._update_order(
+            order['clientOrderId'],
+            orderId=ack['orderId'],
+            status=ack.get('status', 'NEW'),
+            executedQty=float(ack.get('executedQty') or 0),
+            avgPrice=avg_price,
+        )
+
+    def _on_futs_order_update(self, data):
+        o = data['o']
+        self._update_order(
+            o['c'], orderId=o['i'], status=o['X'], executedQty=float(o['z']), avgPrice=float(o['ap']) or None,
+        )
+
+    def _on_spot_order_update(self, data):
+        executed = float(data['z'])
+        self._update_order(
+            data['c'], orderId=data['i'], status=data['X'], executedQty=executed,
+            avgPrice=float(data['Z']) / executed if executed else None,
+        )
+
+    def get_orders(self, symbol=None, open_only=False):
+        with self._lock:
+            orders = [dict(o) for o in self.orders.values()]
+        return [
+            o for o in orders
+            if (symbol is None or o['symbol'] == symbol.upper()) and not (open_only and o['status'] in FINAL_STATES)
+        ]
+
+    ################################# submission
+
+    @staticmethod
+    def _order_params(order):
+        params = {
+            'symbol': order['symbol'],
+            'side': order['side'],
+            'type': order['type'],
+            'quantity': order['quantity'],
+            'newClientOrderId': order['clientOrderId'],
+        }
+        if order['price'] is not None:
+            params['price'] = order['price']
+            params['timeInForce'] = order['timeInForce']
+        return params
+
+    def _post_one(self, order):
+        params = self._order_params(order)
+        order['sent_at'] = time.time()
+        try:
+            ack = self.client.post_order(
+                params.pop('symbol'), params.pop('side'), params.pop('type'), params.pop('quantity'),
+                params.pop('price', None), params.pop('timeInForce', None), **params,
+            )
+        except Exception as e:
+            ack = {'code': None, 'msg': str(e)}
+        self._apply_ack(order, ack)
+
+    def _post_batch(self, orders):
+        sent_at = time.time()
+        for order in orders:
+            order['sent_at'] = sent_at
+        try:
+            acks = self.client.post_batch_orders([self._order_params(o) for o in orders])
+        except Exception as e:
+            acks = {'code': None, 'msg': str(e)}
+        if not isinstance(acks, list):
+            acks = [acks] * len(orders)  # the whole batch was rejected
+        for order, ack in zip(orders, acks):
+            self._apply_ack(order, ack)
+
+    def _cancel(self, symbol):
+        """
+        cancel every open order of symbol, local states only move to CANCELED when the request succeeded
+        (unconfirmed, ORDER_TRADE_UPDATE corrects them), orders without an ack count once their
+        request is older than ACK_TIMEOUT_S (it either never reached the exchange or is cancelled now)
+        """
+        started = time.time()
+        try:
+            resp = self.client.cancel_open_orders(symbol)
+        except Exception as e:
+            resp = {'code': None, 'msg': str(e)}
+        # futures {code: 200, msg}, spot a list of cancelled orders or -2011 when there is none
+        ok = isinstance(resp, list) or (isinstance(resp, dict) and resp.get('code') in (200, -2011))
+        if not ok:
+            logger.warning(f"cancel open orders {symbol} failed|resp={resp}")
+            return False
+        with self._lock:
+            cids = [
+                cid for cid, o in self.orders.items()
+                if o['symbol'] == symbol and o['status'] not in FINAL_STATES
+                and (o['status'] != PENDING_NEW or (o['sent_at'] is not None and started - o['sent_at'] > ACK_TIMEOUT_S))
+            ]
+        for cid in cids:
+            self._update_order(cid, confirmed=False, status='CANCELED')
+        return True
+
+    def _check_limits(self, order):
+        # one symbol's REST failure (ie userTrades error) must not abort the others
+        try:
+            return self.check_limits(order['symbol']), None
+        except Exception as e:
+            return None, e
+
+    def submit(self, orders, cancel_open=True, wait_acks=True, timeout=ACK_TIMEOUT_S):
+        """
+        check limits, cancel open orders of the symbols, then post every allowed order concurrently
+
+        :param orders: [{symbol, side, type, quantity, price, timeInForce}], one per symbol
+        :param wait_acks: False returns straight after sending, states fill in as acks / stream updates arrive
+
+        returns;
+            order states, ie {clientOrderId, symbol, side, status, executedQty, avgPrice, error, ...}
+        """
+        self._prune()
+        states = [self._new_order(o) for o in orders]
+
+        # limits use REST only for symbols not synced yet, those requests run side by side
+        checks = list(self._pool.map(self._check_limits, states))
+        allowed = []
+        for order, (reason, error) in zip(states, checks):
+            if error is not None:
+                self._update_order(order['clientOrderId'], confirmed=False, status=FAILED, error=repr(error))
+                logger.warning(f"limit check {order['symbol']} failed, no order|e={error}")
+            elif reason is not None:
+                self._update_order(order['clientOrderId'], confirmed=False, status=THROTTLED, error=reason)
+                logger.info(f"NOK: {reason}")
+            else:
+                allowed.append(order)
+
+        # stale orders of throttled symbols are cancelled too, only the new order is held back
+        if cancel_open and states:
+            wait([self._pool.submit(self._cancel, s) for s in {o['symbol'] for o in states}])
+
+        if self.use_batch:
+            chunks = [allowed[i:i + BATCH_ORDERS_MAX] for i in range(0, len(allowed), BATCH_ORDERS_MAX)]
+            futures = [self._pool.submit(self._post_batch, c) for c in chunks]
+        else:
+            futures = [self._pool.submit(self._post_one, o) for o in allowed]
+        with self._lock:
+            self._pending = [f for f in self._pending if not f.done()] + futures
+
+        if wait_acks:
+            self.wait_acks(timeout)
+        return [self.orders[o['clientOrderId']] for o in states]
+
+    def wait_acks(self, timeout=ACK_TIMEOUT_S):
+        """
+        block until every request sent so far got its response, returns False on timeout
+        """
+        with self._lock:
+            pending = list(self._pending)
+        _, not_done = wait(pending, timeout=timeout)
+        return not not_done
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+    def __repr__(self):
+        return f"ExecutionEngine({self.client.exchange}, orders={len(self.orders)}, batch={self.use_batch})"
@@ -0,0 +1,198 @@
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+FILL_WINDOW_MS = 60 * 60 * 1000   # rolling notional window, the hourly volume limit
+MAX_FILLS_PER_SYMBOL = 5000
+USER_TRADES_LIMIT = 1000          # max page of userTrades
+MAX_SYNC_PAGES = 10
+
+
+def parse_trade(trade):
+    """
+    userTrades row -> fill record as kept by BinanceStream, {id, symbol, side, qty, price, quoteQty, time}
+    """
+    return {
+        'id': int(trade['id']),
+        'symbol': trade['symbol'],
+        'side': trade.get('side') or ('BUY' if trade.get('isBuyer') else 'SELL'),
+        'qty': float(trade['qty']),
+        'price': float(trade['price']),
+        'quoteQty': float(trade['quoteQty']),
+        'time': int(trade['time']),
+    }
+
+
+class _SymbolFills:
+    """
+    fills of one symbol; a time sorted ring buffer plus the fills inside the rolling
+    window with their running notional, expired ones are dropped from the front on read
+    """
+
+    def __init__(self, maxlen, window_ms):
+        self.fills = deque(maxlen=maxlen)
+        self.ids = set()
+        self.window_ms = window_ms
+        self.window = deque()       # (time, quoteQty) of fills not yet expired, time ascending
+        self.window_sum = 0.
+        self.cutoff = 0             # fills before this already left the window
+        self.last_id = None         # highest trade id seen, from any source
+        self.synced_id = None       # highest trade id loaded over REST, fromId of the next sync
+        self.synced_at = None       # local ms of the last sync
+
+    def add(self, fill):
+        if fill['id'] in self.ids:
+            return False
+        if len(self.fills) == self.fills.maxlen:
+            self.ids.discard(self.fills.popleft()['id'])
+        self.ids.add(fill['id'])
+        t = fill['time']
+        if not self.fills or self.fills[-1]['time'] <= t:
+            self.fills.append(fill)
+        else:
+            # late fill (ie REST sync after the stream), rare, insert in place
+            fills = list(self.fills)
+            fills.insert(bisect.bisect_right([f['time'] for f in fills], t), fill)
+            self.fills = deque(fills, maxlen=self.fills.maxlen)
+        self.last_id = fill['id'] if self.last_id is None else max(self.last_id, fill['id'])
+
+        if t >= self.cutoff:
+            item = (t, abs(fill['quoteQty']))
+            if not self.window or self.window[-1][0] <= t:
+                self.window.append(item)
+            else:
+                window = list(self.window)
+                window.insert(bisect.bisect_right(window, item), item)
+                self.window = deque(window)
+            self.window_sum += item[1]
+        return True
+
+    def expire(self, now_ms):
+        self.cutoff = max(self.cutoff, now_ms - self.window_ms)
+        while self.window and self.window[0][0] < self.cutoff:
+            self.window_sum -= self.window.popleft()[1]
+        if not self.window:
+            self.window_sum = 0.  # no float drift carried over
+        return self.window_sum
+
+
+class FillStore:
+    """
+    Own trades per symbol, kept in memory for the hedger's throttling checks
+
+    time since the last fill and notional of the rolling window are O(1) (amortised) reads,
+    fills come from the user stream (add) and from userTrades, paged incrementally by fromId
+
+    store = FillStore(client)
+    store.sync('BTCUSDT')                     # first call loads the last window, then only new trades
+    store.minutes_since_last('BTCUSDT')
+    store.notional('BTCUSDT')                 # usd traded over the last hour
+    """
+
+    def __init__(self, client=None, window_ms=FILL_WINDOW_MS, maxlen=MAX_FILLS_PER_SYMBOL):
+        """
+        :param client: BinanceClient for sync, None when fills are only added
+        """
+        self.client = client
+        self.window_ms = window_ms
+        self.maxlen = maxlen
+        self._symbols = {}
+        self._lock = threading.Lock()
+
+    def _get(self, symbol):
+        s = self._symbols.get(symbol)
+        if s is None:
+            s = self._symbols[symbol] = _SymbolFills(self.maxlen, self.window_ms)
+        return s
+
+    def add(self, fill):
+        """
+        returns;
+            False if the fill (trade id) is already stored
+        """
+        with self._lock:
+            return self._get(fill['symbol']).add(fill)
+
+    def add_many(self, fills):
+        return sum(self.add(f) for f in fills)
+
+    def is_synced(self, symbol):
+        with self._lock:
+            s = self._symbols.get(symbol)
+            return s is not None and s.synced_at is not None
+
+    def sync(self, symbol, max_pages=MAX_SYNC_PAGES):
+        """
+        load trades newer than the last one loaded over REST, page forward with fromId,
+        until a first trade id is known the current window is loaded (startTime)
+
+        returns;
+            number of new fills
+        """
+        with self._lock:
+            s = self._get(symbol)
+            synced_id = s.synced_id
+        added = 0
+        for _ in range(max_pages):
+            if synced_id is None:
+                params = {'symbol': symbol, 'startTime': int(time.time() * 1000) - self.window_ms, 'limit': USER_TRADES_LIMIT}
+            else:
+                params = {'symbol': symbol, 'fromId': synced_id + 1, 'limit': USER_TRADES_LIMIT}
+            trades = self.client.make_signed_request("GET", "userTrades", body_in=params)
+            if isinstance(trades, dict):
+                raise ValueError(f'userTrades {symbol} failed: {trades}')
+            fills = [parse_trade(t) for t in trades]
+            added += self.add_many(fills)
+            with self._lock:
+                if fills:
+                    synced_id = max(synced_id or 0, max(f['id'] for f in fills))
+                s.synced_id, s.synced_at = synced_id, int(time.time() * 1000)
+            if len(trades) < USER_TRADES_LIMIT:
+                break
+        return added
+
+    ################################# reads
+
+    def symbols(self):
+        with self._lock:
+            return list(self._symbols)
+
+    def last_time(self, symbol):
+        with self._lock:
+            s = self._symbols.get(symbol)
+            return s.fills[-1]['time'] if s is not None and s.fills else None
+
+    def minutes_since_last(self, symbol, now_ms=None):
+        """
+        None if there is no fill of symbol
+        """
+        last = self.last_time(symbol)
+        if last is None:
+            return None
+        return ((now_ms or time.time() * 1000) - last) / (1000 * 60)
+
+    def notional(self, symbol, now_ms=None):
+        """
+        usd traded on symbol within the rolling window (last hour)
+        """
+        with self._lock:
+            s = self._symbols.get(symbol)
+            return s.expire(now_ms or time.time() * 1000) if s is not None else 0.
+
+    def get(self, symbol, since_ms=None):
+        """
+        fills oldest first
+        """
+        with self._lock:
+            s = self._symbols.get(symbol)
+            fills = list(s.fills) if s is not None else []
+        if since_ms is None:
+            return fills
+        return fills[bisect.bisect_left([f['time'] for f in fills], since_ms):]
+
+    def __repr__(self):
+        return f"FillStore(symbols={list(self._symbols)})"
@@ -0,0 +1,348 @@
+import bisect
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_LIMIT = 1000
+MAX_BUFFERED_EVENTS = 10000
+RESYNC_ATTEMPTS = 3
+RESYNC_DELAY_S = 0.5      # diffs keep buffering between attempts, the next snapshot should overlap them
+
+
+class OrderBookOutOfSync(Exception):
+    pass
+
+
+class _BookSide:
+    """
+    price -> qty of one side, prices kept sorted best first
+    """
+
+    def __init__(self, is_bid):
+        self.is_bid = is_bid
+        self.levels = {}
+        self._keys = []  # ascending sort keys, -price for bids so index 0 is the best level
+
+    def _key(self, price):
+        return -price if self.is_bid else price
+
+    def clear(self):
+        self.levels.clear()
+        self._keys.clear()
+
+    def update(self, price, qty):
+        key = self._key(price)
+        if qty == 0:
+            if self.levels.pop(price, None) is not None:
+                del self._keys[bisect.bisect_left(self._keys, key)]
+        else:
+            if price not in self.levels:
+                bisect.insort(self._keys, key)
+            self.levels[price] = qty
+
+    def best(self):
+        if not self._keys:
+            return None
+        price = abs(self._keys[0])
+        return price, self.levels[price]
+
+    def iter_levels(self, n=None):
+        """
+        (price, qty) best first
+        """
+        keys = self._keys if n is None else self._keys[:n]
+        for key in keys:
+            price = abs(key)
+            yield price, self.levels[price]
+
+    def __len__(self):
+        return len(self.levels)
+
+
+class OrderBook:
+    """
+    L2 order book replica of one Binance symbol, REST snapshot + depth diff stream
+
+    diffs arriving before the snapshot are buffered and replayed, sequencing follows
+    the Binance rules; the first diff after a snapshot has to bridge it (futures
+    U <= lastUpdateId <= u, spot U <= lastUpdateId + 1 <= u), later ones chain on the
+    previous one (futures pu == previous u, spot U == previous u + 1), a gap marks
+    the book out of sync and triggers a resync from a fresh snapshot
+
+    book = OrderBook('BTCUSDT', client)
+    stream.add_listener('depthUpdate', book.on_depth_update)
+    book.resync()
+    book.price_to_fill(2.5, 'BUY')
+    """
+
+    def __init__(self, symbol, client=None, snapshot_limit=SNAPSHOT_LIMIT, max_buffered=MAX_BUFFERED_EVENTS):
+        """
+        :param client: BinanceClient for snapshots, None when snapshots are applied by hand
+        """
+        self.symbol = symbol.upper()
+        self.client = client
+        self.snapshot_limit = snapshot_limit
+        self.max_buffered = max_buffered
+
+        self.bids = _BookSide(is_bid=True)
+        self.asks = _BookSide(is_bid=False)
+        self.last_update_id = None
+        self.synced = False
+        self.bridged = False    # first diff after the snapshot applied, chaining from here on
+        self.resyncs = 0
+        self.updated_at = None  # local epoch seconds
+        self._buffer = []       # diffs received while not synced
+        self._lock = threading.RLock()
+        self._resyncing = False
+
+    ################################# updates
+
+    def apply_snapshot(self, snapshot):
+        """
+        :param snapshot: get_order_book response {lastUpdateId, bids, asks}
+        """
+        with self._lock:
+            self.bids.clear()
+            self.asks.clear()
+            for price, qty in snapshot['bids']:
+                self.bids.update(float(price), float(qty))
+            for price, qty in snapshot['asks']:
+                self.asks.update(float(price), float(qty))
+            self.last_update_id = snapshot['lastUpdateId']
+            self.updated_at = time.time()
+
+            # replay what arrived while the snapshot was in flight, with an empty buffer
+            # the first live diff does the bridging
+            buffered, self._buffer = self._buffer, []
+            self.synced = True
+            self.bridged = False
+            for i, event in enumerate(buffered):
+                if not self._apply_in_sequence(event, resync=False):
+                    # the failing diff is back in the buffer, keep the tail after it too
+                    self._buffer.extend(buffered[i + 1:])
+                    return False
+            return True
+
+    def _apply(self, event):
+        for price, qty in event['b']:
+            self.bids.update(float(price), float(qty))
+        for price, qty in event['a']:
+            self.asks.update(float(price), float(qty))
+        self.last_update_id = event['u']
+        self.updated_at = time.time()
+
+    def _apply_in_sequence(self, event, resync=True):
+        futures = 'pu' in event
+        if not self.bridged:
+            # first diff after the snapshot, has to straddle lastUpdateId
+            bridge = self.last_update_id if futures else self.last_update_id + 1
+            if event['u'] < bridge:
+                return True  # already in the snapshot
+            in_sequence = event['U'] <= bridge <= event['u']
+        else:
+            if event['u'] <= self.last_update_id:
+                return True  # already applied
+            if futures:
+                in_sequence = event['pu'] == self.last_update_id
+            else:
+                in_sequence = event['U'] == self.last_update_id + 1
+        if not in_sequence:
+            self._out_of_sync(f"gap, last update {self.last_update_id} next diff {event['U']}-{event['u']}", resync)
+            self._buffer.append(event)
+            return False
+        self._apply(event)
+        self.bridged = True
+        return True
+
+    def _out_of_sync(self, reason, resync=True):
+        logger.warning(f"{self.symbol} book out of sync|{reason}")
+        self.synced = False
+        if resync and self.client is not None:
+            self.resync(background=True)
+
+    def apply_diff(self, event):
+        """
+        :param event: depthUpdate event {U, u, (pu), b, a}
+
+        returns;
+            True if applied, False if buffered (not synced yet / gap)
+        """
+        with self._lock:
+            if not self.synced:
+                self._buffer.append(event)
+                if len(self._buffer) > self.max_buffered:
+                    self._buffer = self._buffer[-self.max_buffered:]
+                return False
+            return self._apply_in_sequence(event)
+
+    def on_depth_update(self, data):
+        """
+        BinanceStream 'depthUpdate' listener, ignores other symbols
+        """
+        if data.get('s') == self.symbol:
+            self.apply_diff(data)
+
+    def resync(self, background=False, attempts=RESYNC_ATTEMPTS):
+        """
+        fetch a snapshot and replay buffered diffs, background=True returns straight away
+
+        returns;
+            True once synced, False if every attempt failed, None if a resync is already running
+        """
+        if background:
+            threading.Thread(target=self.resync, name=f'book-resync-{self.symbol}', daemon=True).start()
+            return None
+        with self._lock:
+            if self._resyncing:
+                return None
+            self._resyncing = True
+            self.synced = False
+        try:
+            for attempt in range(attempts):
+                if attempt:
+                    time.sleep(RESYNC_DELAY_S)
+                try:
+                    snapshot = self.client.get_order_book(self.symbol, limit=self.snapshot_limit)
+                except Exception as e:
+                    logger.warning(f"{self.symbol} book snapshot failed|e={e}")
+                    continue
+                self.resyncs += 1
+                if self.apply_snapshot(snapshot):
+                    return True
+            return False
+        finally:
+            self._resyncing = False
+
+    ################################# queries
+
+    def _check(self):
+        if not self.synced:
+            raise OrderBookOutOfSync(self.symbol)
+
+    def best_bid(self):
+        with self._lock:
+            self._check()
+            return self.bids.best()
+
+    def best_ask(self):
+        with self._lock:
+            self._check()
+            return self.asks.best()
+
+    def best_bid_ask(self):
+        """
+        best bid price, best ask price
+        """
+        with self._lock:
+            self._check()
+            bid, ask = self.bids.best(), self.asks.best()
+            return (bid[0] if bid else None), (ask[0] if ask else None)
+
+    def mid(self):
+        """
+        None while a side is empty
+        """
+        bid, ask = self.best_bid_ask()
+        if bid is None or ask is None:
+            return None
+        return (bid + ask) / 2
+
+    def depth_weighted_mid(self, levels=5):
+        """
+        average of the top levels vwap of both sides, None while a side is empty
+        """
+        with self._lock:
+            self._check()
+            sides = []
+            for side in (self.bids, self.asks):
+                notional = qty = 0.
+                for p, q in side.iter_levels(levels):
+                    notional += p * q
+                    qty += q
+                if not qty:
+                    return None
+                sides.append(notional / qty)
+            return sum(sides) / 2
+
+    def price_to_fill(self, qty, side):
+        """
+        walk the book to fill qty as a taker
+
+        :param side: 'BUY' walks the asks, 'SELL' walks the bids
+
+        returns;
+            {avg_price, worst_price, filled_qty, complete}
+        """
+        with self._lock:
+            self._check()
+            book_side = self.asks if side.upper() == 'BUY' else self.bids
+            remaining = qty
+            notional = 0.
+            worst = None
+            for price, level_qty in book_side.iter_levels():
+                take = min(remaining, level_qty)
+                notional += take * price
+                remaining -= take
+                worst = price
+                if remaining <= 0:
+                    break
+            filled = qty - max(remaining, 0.)
+            return {
+                'avg_price': notional / filled if filled else None,
+                'worst_price': worst,
+                'filled_qty': filled,
+                'complete': remaining <= 0,
+            }
+
+    def qty_within(self, price, side):
+        """
+        qty a taker fills at price or better
+
+        :param side: 'BUY' walks the asks up to price, 'SELL' walks the bids down to price
+        """
+        with self._lock:
+            self._check()
+            buy = side.upper() == 'BUY'
+            qty = 0.
+            for level_price, level_qty in (self.asks if buy else self.bids).iter_levels():
+                if (level_price > price) if buy else (level_price < price):
+                    break
+                qty += level_qty
+            return qty
+
+    def slippage_pct(self, qty, side):
+        """
+        worst fill price vs best price of the side, as a fraction (0.001 = 10bps), None if the book is too thin
+        """
+        fill = self.price_to_fill(qty, side)
+        if not fill['complete']:
+            return None
+        bid, ask = self.best_bid_ask()
+        best = ask if side.upper() == 'BUY' else bid
+        return abs(fill['worst_price'] - best) / best
+
+    def __repr__(self):
+        return f"OrderBook({self.symbol}, synced={self.synced}, levels={len(self.bids)}x{len(self.asks)}, last_update_id={self.last_update_id})"
+
+
+def attach_order_books(stream, client=None):
+    """
+    one synced OrderBook per stream symbol fed by its depth diffs, the stream needs depth=True
+
+    books take their snapshot once the stream is connected (and again after every reconnect,
+    diffs sent while it was down are lost), so the snapshot overlaps the first buffered diffs
+
+    returns;
+        {symbol: OrderBook}
+    """
+    client = client or stream.client
+    books = {s: OrderBook(s, client) for s in stream.symbols}
+    for book in books.values():
+        stream.add_listener('depthUpdate', book.on_depth_update)
+        stream.add_listener('connected', lambda _, book=book: book.resync(background=True))
+        if stream.connected:
+            book.resync(background=True)
+    stream.order_books.update(books)
+    return books
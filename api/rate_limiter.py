@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-10S
+_HEADER_RE = re.compile(r'^x-(?:mbx|sapi)-(used-weight|order-count)-(\d+)([smhd])$', re.IGNORECASE)
+_HEADER_2_KIND = {'used-weight': 'weight', 'order-count': 'orders'}
+
+# host -> {bucket: (capacity, window seconds)}
+# bucket names are '<kind>:<interval>', kind is weight / orders / requests
+HOST_2_LIMITS = {
+    'api.binance.com': {'weight:1m': (6000, 60), 'orders:10s': (100, 10), 'orders:1d': (200000, 86400)},
+    'fapi.binance.com': {'weight:1m': (2400, 60), 'orders:10s': (300, 10), 'orders:1m': (1200, 60)},
+    'dapi.binance.com': {'weight:1m': (2400, 60), 'orders:1m': (1200, 60)},
+    # block explorers, 5 calls / second on the free plan
+    'api.etherscan.io': {'requests:1s': (5, 1)},
+    'api.arbiscan.io': {'requests:1s': (5, 1)},
+    'api-optimistic.etherscan.io': {'requests:1s': (5, 1)},
+}
+
+# keep this share of every window free for requests we can't pace (other processes, stream resyncs)
+SAFETY_MARGIN = 0.1
+
+ORDER_ENDPOINTS = {'order', 'batchOrders'}
+
+
+def _depth_weight(host, limit):
+    limit = int(limit or 100)
+    if host == 'api.binance.com':
+        return 5 if limit <= 100 else 25 if limit <= 500 else 50 if limit <= 1000 else 250
+    return 2 if limit <= 50 else 5 if limit <= 100 else 10 if limit <= 500 else 20
+
+
+def request_weight(host, endpoint, params, method='GET'):
+    """
+    request weight of a Binance endpoint, 1 when unknown (the response headers correct any drift)
+    """
+    if endpoint == 'depth':
+        return _depth_weight(host, params.get('limit'))
+    if endpoint == 'ticker/price':
+        return 1 if 'symbol' in params else (4 if host == 'api.binance.com' else 2)
+    if endpoint in ('account', 'userTrades'):
+        return 10 if host == 'api.binance.com' and endpoint == 'account' else 5
+    if endpoint == 'allOrders':
+        return 5
+    if endpoint == 'exchangeInfo':
+        return 20 if host == 'api.binance.com' else 1
+    return 1
+
+
+class TokenBucket:
+    """
+    capacity tokens refilled evenly over window seconds, thread safe
+    """
+
+    def __init__(self, capacity, window, margin=SAFETY_MARGIN):
+        self.capacity = capacity * (1 - margin)
+        self.window = window
+        self.rate = self.capacity / window  # tokens / second
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost=1):
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0., (min(cost, self.capacity) - self.tokens) / self.rate)
+
+    def try_acquire(self, cost=1):
+        """
+        take cost tokens if available
+
+        returns;
+            0 if taken, otherwise seconds until they will be
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            cost = min(cost, self.capacity)
+            if self.tokens >= cost:
+                self.tokens -= cost
+                return 0.
+            return (cost - self.tokens) / self.rate
+
+    def release(self, cost=1):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + cost)
+
+    def sync(self, used):
+        """
+        server reported usage of the current window, never hand out more than it allows
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, self.capacity - used)
+
+    def __repr__(self):
+        return f"TokenBucket({self.tokens:.1f}/{self.capacity:.0f} per {self.window}s)"
+
+
+class RateLimiter:
+    """
+    token buckets per host and limit class (request weight, order count, plain request count)
+
+    acquire() blocks just long enough to stay inside every limit of the host, update()
+    resyncs the buckets from the X-MBX-USED-WEIGHT-* / X-MBX-ORDER-COUNT-* headers and
+    pauses the host on 429 / 418 until Retry-After
+    """
+
+    def __init__(self, host_2_limits=None, margin=SAFETY_MARGIN):
+        self.host_2_limits = dict(HOST_2_LIMITS if host_2_limits is None else host_2_limits)
+        self.margin = margin
+        self._buckets = {}       # host -> {bucket name: TokenBucket}
+        self._paused_until = {}  # host -> monotonic seconds
+        self._lock = threading.Lock()
+
+    def buckets(self, host):
+        buckets = self._buckets.get(host)
+        if buckets is None:
+            with self._lock:
+                buckets = self._buckets.get(host)
+                if buckets is None:
+                    buckets = self._buckets[host] = {
+                        name: TokenBucket(capacity, window, self.margin)
+                        for name, (capacity, window) in self.host_2_limits.get(host, {}).items()
+                    }
+        return buckets
+
+    def configure_host(self, host, limits):
+        """
+        :param limits: {bucket: (capacity, window seconds)}, ie {'requests:1s': (5, 1)}
+        """
+        with self._lock:
+            self.host_2_limits[host] = dict(limits)
+            self._buckets.pop(host, None)
+
+    @staticmethod
+    def _parse(url):
+        parts = urlsplit(url)
+        endpoint = parts.path.rstrip('/').split('/v1/')[-1].split('/v2/')[-1].split('/v3/')[-1]
+        params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        return parts.netloc, endpoint, params
+
+    def costs(self, url, method='GET'):
+        """
+        {bucket: tokens} a request to url would take
+        """
+        host, endpoint, params = self._parse(url)
+        costs = {}
+        for name in self.buckets(host):
+            kind = name.split(':')[0]
+            if kind == 'weight':
+                costs[name] = request_weight(host, endpoint, params, method)
+            elif kind == 'orders':
+                if endpoint in ORDER_ENDPOINTS and method == 'POST':
+                    costs[name] = 1
+            else:
+                costs[name] = 1
+        return costs
+
+    def _take(self, host, costs):
+        """
+        take the costs of one request from every bucket of host at once
+
+        returns;
+            0 once taken, otherwise seconds to wait before trying again
+        """
+        buckets = self.buckets(host)
+        paused = self._paused_until.get(host, 0.) - time.monotonic()
+        # check all buckets first so a request never takes tokens from some and then waits on others
+        wait = max([paused] + [buckets[name].wait_time(cost) for name, cost in costs.items()])
+        if wait > 0:
+            return wait
+        taken = []
+        for name, cost in costs.items():
+            wait = buckets[name].try_acquire(cost)
+            if wait:
+                break
+            taken.append((name, cost))
+        else:
+            return 0
+        # lost a race with another thread, give back and retry
+        for name, cost in taken:
+            buckets[name].release(cost)
+        return wait
+
+    def acquire(self, url, method='GET', timeout=None):
+        """
+        block until the request fits every limit of its host
+
+        returns;
+            seconds waited
+        """
+        host = urlsplit(url).netloc
+        costs = self.costs(url, method)
+        start = time.monotonic()
+        while True:
+            wait = self._take(host, costs)
+            if not wait:
+                return time.monotonic() - start
+            if timeout is not None and time.monotonic() - start + wait > timeout:
+                raise TimeoutError(f'rate limit wait on {host} would exceed {timeout}s')
+            time.sleep(wait)
+
+    async def acquire_async(self, url, method='GET', timeout=None):
+        """
+        acquire for the asyncio clients, waits without blocking the event loop
+        """
+        host = urlsplit(url).netloc
+        costs = self.costs(url, method)
+        start = time.monotonic()
+        while True:
+            wait = self._take(host, costs)
+            if not wait:
+                return time.monotonic() - start
+            if timeout is not None and time.monotonic() - start + wait > timeout:
+                raise TimeoutError(f'rate limit wait on {host} would exceed {timeout}s')
+            await asyncio.sleep(wait)
+
+    def update(self, url, resp):
+        """
+        feed back a response (requests or aiohttp), its headers are the source of truth for used weight / order count
+        """
+        host = urlsplit(url).netloc
+        buckets = self.buckets(host)
+        for header, value in resp.headers.items():
+            m = _HEADER_RE.match(header)
+            if not m:
+                continue
+            name = f'{_HEADER_2_KIND[m.group(1).lower()]}:{m.group(2)}{m.group(3).lower()}'
+            bucket = buckets.get(name)
+            if bucket is None:
+                continue
+            try:
+                bucket.sync(float(value))
+            except ValueError:
+                pass
+
+        status = getattr(resp, 'status_code', None) or getattr(resp, 'status', None)
+        if status in (418, 429):
+            retry_after = float(resp.headers.get('Retry-After') or 60)
+            self._paused_until[host] = time.monotonic() + retry_after
+            logger.warning(f"{host} rate limited ({status}), paused {retry_after}s")
+
+    def __repr__(self):
+        return f"RateLimiter({list(self._buckets)})"
+
+
+# process wide limiter, shared by every session
+RATE_LIMITER = RateLimiter()
@@ -0,0 +1,144 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .rate_limiter import RATE_LIMITER
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (3.05, 10)
+
+DEFAULT_POOL_CONFIG = {
+    'pool_connections': 4,  # number of per-host pools kept by the adapter
+    'pool_maxsize': 10,     # keep-alive connections kept per pool
+    'retries': 3,
+    'backoff_factor': 0.3,  # sleeps 0.3, 0.6, 1.2 ... between retries
+    # no 429, RATE_LIMITER.update has to see it to pause the host (retrying it on Binance can earn a 418 ban)
+    'status_forcelist': (500, 502, 503, 504),
+    'timeout': DEFAULT_TIMEOUT,
+}
+
+# per host overrides, ie more connections for hosts we poll concurrently
+HOST_2_POOL_CONFIG = {
+    'api.binance.com': {'pool_maxsize': 20},
+    'fapi.binance.com': {'pool_maxsize': 20},
+    'yields.llama.fi': {'timeout': (3.05, 60)},  # large response
+    'api.llama.fi': {'timeout': (3.05, 30)},     # full protocol histories, fetched concurrently by TvlStore
+}
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter applying a default timeout when the caller does not pass one
+    """
+
+    def __init__(self, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class SessionManager:
+    """
+    Keeps one keep-alive requests.Session per host so repeated calls
+    reuse warm connections instead of doing a fresh TCP + TLS handshake
+    """
+
+    def __init__(self, host_config=None, rate_limiter=RATE_LIMITER, **default_config):
+        """
+        :param host_config: {host: config} overrides, see HOST_2_POOL_CONFIG
+        :param rate_limiter: RateLimiter pacing requests per host, None disables pacing
+        :param **default_config: overrides of DEFAULT_POOL_CONFIG for every host
+        """
+        self.rate_limiter = rate_limiter
+        self.default_config = {**DEFAULT_POOL_CONFIG, **default_config}
+        self.host_config = dict(HOST_2_POOL_CONFIG if host_config is None else host_config)
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get_config(self, host):
+        return {**self.default_config, **self.host_config.get(host, {})}
+
+    def configure_host(self, host, **config):
+        """
+        update pool / retry / timeout config of a host, drops its current session
+        """
+        self.host_config[host] = {**self.host_config.get(host, {}), **config}
+        with self._lock:
+            session = self._sessions.pop(host, None)
+        if session is not None:
+            session.close()
+
+    def _make_session(self, host):
+        config = self.get_config(host)
+        retry = Retry(
+            total=config['retries'],
+            backoff_factor=config['backoff_factor'],
+            status_forcelist=config['status_forcelist'],
+            allowed_methods=frozenset(['GET', 'HEAD', 'DELETE', 'PUT', 'OPTIONS']),  # never retry POST (orders)
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = TimeoutHTTPAdapter(
+            pool_connections=config['pool_connections'],
+            pool_maxsize=config['pool_maxsize'],
+            max_retries=retry,
+            timeout=config['timeout'],
+        )
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def get_session(self, url):
+        """
+        :param url: any url on the host, ie https://api.binance.com/api/v3
+        """
+        host = urlsplit(url).netloc
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = self._sessions[host] = self._make_session(host)
+        return session
+
+    def request(self, method, url, **kwargs):
+        if self.rate_limiter is None:
+            return self.get_session(url).request(method, url, **kwargs)
+        self.rate_limiter.acquire(url, method)
+        resp = self.get_session(url).request(method, url, **kwargs)
+        self.rate_limiter.update(url, resp)
+        return resp
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+
+# process wide manager, shared by every client
+SESSIONS = SessionManager()
+
+
+def get_session(url):
+    return SESSIONS.get_session(url)
@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import threading
+import time
+from decimal import ROUND_DOWN, ROUND_HALF_UP, Decimal
+
+from utils import TtlState, write_json_atomic
+
+from .utils_api import EXCHANGE_TO_BASE_URL, make_get_request
+
+logger = logging.getLogger(__name__)
+
+SYMBOL_RULES_DIR = os.environ.get(
+    'SYMBOL_RULES_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'defi_public', 'exchange_info'),
+)
+SYMBOL_RULES_TTL = 24 * 60 * 60   # seconds, filters rarely change, new listings show up within a day
+RETRY_AFTER_S = 5 * 60            # wait before retrying a failed refresh while stale rules are served
+MIN_FORCED_REFRESH_S = 60         # unknown symbols refetch exchangeInfo at most this often
+
+
+def _scale(step):
+    """
+    decimals of a step, ie Decimal('0.010') -> 2, Decimal('1.0') -> 0
+    """
+    return max(0, -step.normalize().as_tuple().exponent)
+
+
+def parse_symbol_filters(symbol_info):
+    """
+    exchangeInfo symbol -> {tickSize, minPrice, maxPrice, stepSize, minQty, maxQty, minNotional, ...} as str,
+    spot (MIN_NOTIONAL / NOTIONAL minNotional) and futures (MIN_NOTIONAL notional) layouts
+    """
+    rules = {
+        'symbol': symbol_info['symbol'],
+        'status': symbol_info.get('status'),
+        'baseAsset': symbol_info.get('baseAsset'),
+        'quoteAsset': symbol_info.get('quoteAsset'),
+    }
+    for f in symbol_info.get('filters', []):
+        kind = f.get('filterType')
+        if kind == 'PRICE_FILTER':
+            rules.update(tickSize=f['tickSize'], minPrice=f['minPrice'], maxPrice=f['maxPrice'])
+        elif kind == 'LOT_SIZE':
+            rules.update(stepSize=f['stepSize'], minQty=f['minQty'], maxQty=f['maxQty'])
+        elif kind == 'MARKET_LOT_SIZE':
+            rules.update(marketMaxQty=f['maxQty'])
+        elif kind in ('MIN_NOTIONAL', 'NOTIONAL'):
+            rules['minNotional'] = f.get('minNotional') or f.get('notional')
+    return rules
+
+
+class SymbolRules:
+    """
+    trading filters of one symbol, steps kept as Decimal with their scales precomputed
+
+    rules.round_qty(0.123456)     # 0.123, down to stepSize
+    rules.round_price(30123.456)  # 30123.5, nearest tickSize
+    rules.validate(price, qty)    # None or why Binance would reject the order
+    """
+
+    def __init__(self, rules):
+        self.rules = dict(rules)
+        self.symbol = rules['symbol']
+        self.tick_size = Decimal(rules.get('tickSize') or '0')
+        self.step_size = Decimal(rules.get('stepSize') or '0')
+        self.min_price = float(rules.get('minPrice') or 0)
+        self.max_price = float(rules.get('maxPrice') or 0)   # 0, no limit
+        self.min_qty = float(rules.get('minQty') or 0)
+        self.max_qty = float(rules.get('maxQty') or 0)
+        self.min_notional = float(rules.get('minNotional') or 0)
+        self.price_scale = _scale(self.tick_size) if self.tick_size else None
+        self.qty_scale = _scale(self.step_size) if self.step_size else None
+        self._price_exp = Decimal(1).scaleb(-self.price_scale) if self.tick_size else None
+        self._qty_exp = Decimal(1).scaleb(-self.qty_scale) if self.step_size else None
+
+    @staticmethod
+    def _round(value, step, exp, rounding):
+        if not step:
+            return Decimal(str(value))
+        return ((Decimal(str(value)) / step).to_integral_value(rounding) * step).quantize(exp)
+
+    def round_price_d(self, price, rounding=ROUND_HALF_UP):
+        return self._round(price, self.tick_size, self._price_exp, rounding)
+
+    def round_qty_d(self, qty, rounding=ROUND_DOWN):
+        return self._round(qty, self.step_size, self._qty_exp, rounding)
+
+    def round_price(self, price, rounding=ROUND_HALF_UP):
+        """
+        nearest multiple of tickSize
+        """
+        return float(self.round_price_d(price, rounding))
+
+    def round_qty(self, qty, rounding=ROUND_DOWN):
+        """
+        multiple of stepSize, down by default so a hedge never exceeds its size
+        """
+        return float(self.round_qty_d(qty, rounding))
+
+    def format_price(self, price):
+        """
+        order param string, no float repr / exponent (ie 5e-05)
+        """
+        return f'{self.round_price_d(price):f}'
+
+    def format_qty(self, qty):
+        return f'{self.round_qty_d(qty):f}'
+
+    def validate(self, price, qty):
+        """
+        returns;
+            None if the order passes PRICE_FILTER / LOT_SIZE / MIN_NOTIONAL, otherwise the reason it does not
+        """
+        if self.rules.get('status') not in (None, 'TRADING'):
+            return f"{self.symbol} status {self.rules['status']}"
+        if qty <= 0 or qty < self.min_qty:
+            return f"{self.symbol} qty {qty} < minQty {self.min_qty}"
+        if self.max_qty and qty > self.max_qty:
+            return f"{self.symbol} qty {qty} > maxQty {self.max_qty}"
+        if price is not None:
+            if price < self.min_price:
+                return f"{self.symbol} price {price} < minPrice {self.min_price}"
+            if self.max_price and price > self.max_price:
+                return f"{self.symbol} price {price} > maxPrice {self.max_price}"
+            if price * qty < self.min_notional:
+                return f"{self.symbol} notional {price * qty:.2f} < minNotional {self.min_notional}"
+        return None
+
+    def __repr__(self):
+        return f"SymbolRules({self.symbol}, tick={self.tick_size}, step={self.step_size}, minNotional={self.min_notional})"
+
+
+class SymbolRulesCache:
+    """
+    SymbolRules of every symbol of an exchange from one exchangeInfo request,
+    persisted to disk and refreshed on a TTL (or when an unknown symbol is asked for)
+
+    rules = get_symbol_rules_cache('BINANCE_FUTURES_USDM').get('BTCUSDT')
+    """
+
+    def __init__(self, exchange, path=SYMBOL_RULES_DIR, ttl=SYMBOL_RULES_TTL):
+        """
+        :param ttl: seconds before exchangeInfo is downloaded again, None never expires
+        """
+        self.exchange = exchange.upper()
+        self.base_url = EXCHANGE_TO_BASE_URL[self.exchange]
+        self.path = os.path.join(path, f'{self.exchange.lower()}.json')
+        self.state = TtlState(ttl, RETRY_AFTER_S)
+        self._rules = None      # symbol -> SymbolRules
+        self._lock = threading.Lock()
+
+    def _set(self, symbol_2_filters, fetched_at):
+        self._rules = {s: SymbolRules(f) for s, f in symbol_2_filters.items()}
+        self.state.fetched(fetched_at)
+
+    @property
+    def fetched_at(self):
+        return self.state.fetched_at
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+            self._set(stored['symbols'], stored['fetched_at'])
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+    def refresh(self):
+        info = make_get_request(self.base_url, 'exchangeInfo')
+        symbol_2_filters = {s['symbol']: parse_symbol_filters(s) for s in info.get('symbols', [])}
+        if not symbol_2_filters:
+            raise ValueError(f'empty exchangeInfo: {str(info)[:200]}')
+        self._set(symbol_2_filters, time.time())
+        write_json_atomic({'fetched_at': self.fetched_at, 'symbols': symbol_2_filters}, self.path)
+        return self._rules
+
+    def is_stale(self):
+        return self.state.is_stale()
+
+    def _ensure(self, force=False):
+        if self._rules is not None and not force and not self.is_stale():
+            return
+        with self._lock:
+            if self._rules is None:
+                self._load()
+            forced = force and time.time() - (self.fetched_at or 0) > MIN_FORCED_REFRESH_S
+            if self.is_stale() or forced:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    if self._rules is None:
+                        raise
+                    # keep serving the stale rules
+                    self.state.failed()
+                    logger.warning(f"{self.exchange} exchangeInfo refresh failed, using rules from {self.fetched_at}|e={e}")
+
+    def get(self, symbol):
+        """
+        :param symbol: exchange symbol, ie BTCUSDT
+
+        returns;
+            SymbolRules, KeyError if the exchange has no such symbol (after a refresh)
+        """
+        symbol = symbol.upper()
+        self._ensure()
+        rules = self._rules.get(symbol)
+        if rules is None:
+            self._ensure(force=True)  # listed since the last refresh
+            rules = self._rules.get(symbol)
+        if rules is None:
+            raise KeyError(f'{symbol} not in {self.exchange} exchangeInfo')
+        return rules
+
+    def symbols(self):
+        self._ensure()
+        return list(self._rules)
+
+
+# process wide caches, one per exchange
+SYMBOL_RULES_CACHES = {}
+_LOCK = threading.Lock()
+
+
+def get_symbol_rules_cache(exchange):
+    exchange = exchange.upper()
+    cache = SYMBOL_RULES_CACHES.get(exchange)
+    if cache is None:
+        with _LOCK:
+            cache = SYMBOL_RULES_CACHES.get(exchange)
+            if cache is None:
+                cache = SYMBOL_RULES_CACHES[exchange] = SymbolRulesCache(exchange)
+    return cache
@@ -0,0 +1,174 @@
+import logging
+import threading
+import time
+
+from .utils_api import EXCHANGE_TO_BASE_URL, make_get_request
+
+logger = logging.getLogger(__name__)
+
+TICKER_MAX_AGE_S = 5      # lookups older than this trigger a bulk refresh
+REFRESH_INTERVAL_S = 2    # background refresher period
+
+
+class TickerCache:
+    """
+    Every ticker/price of an exchange from one bulk request, indexed by symbol
+
+    lookups are dict reads, the whole list is refetched once it is older than max_age
+    (or continuously by start()), concurrent callers share a single refresh
+
+    cache = get_ticker_cache('BINANCE')
+    cache.get('BTCUSDT')
+    cache.get_spot(['BTC', 'ETH'])  # {'BTC': .., 'ETH': ..}
+    """
+
+    def __init__(self, base_url, endpoint='ticker/price', max_age=TICKER_MAX_AGE_S):
+        self.base_url = base_url
+        self.endpoint = endpoint
+        self.max_age = max_age
+        self.prices = {}          # symbol -> price
+        self.updated_at = None    # monotonic seconds of the last successful refresh
+        self.refreshes = 0
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def age(self):
+        return None if self.updated_at is None else time.monotonic() - self.updated_at
+
+    def is_stale(self, max_age=None):
+        max_age = self.max_age if max_age is None else max_age
+        return self.updated_at is None or self.age() > max_age
+
+    def refresh(self):
+        """
+        bulk fetch, replaces the index in one assignment so readers never see a partial update
+        """
+        return self.load(make_get_request(self.base_url, self.endpoint))
+
+    def load(self, resp):
+        """
+        index a ticker/price response fetched elsewhere, ie by an async client
+        """
+        self.prices = {d['symbol']: float(d['price']) for d in resp}
+        self.updated_at = time.monotonic()
+        self.refreshes += 1
+        return self.prices
+
+    def _ensure_fresh(self, max_age=None):
+        if not self.is_stale(max_age):
+            return
+        with self._refresh_lock:
+            if self.is_stale(max_age):  # another thread may have refreshed while we waited
+                self.refresh()
+
+    def get(self, symbol, max_age=None):
+        """
+        :param symbol: exchange symbol, ie BTCUSDT
+
+        returns;
+            price or None if the exchange has no such symbol
+        """
+        self._ensure_fresh(max_age)
+        return self.prices.get(symbol.upper())
+
+    def get_many(self, symbols, max_age=None):
+        self._ensure_fresh(max_age)
+        prices = self.prices
+        return {s: prices[s.upper()] for s in symbols if s.upper() in prices}
+
+    def get_spot(self, bases, quote='USDT', max_age=None):
+        """
+        {base: price} of base + quote symbols, ie get_spot(['BTC', 'ETH'])
+        """
+        if isinstance(bases, str):
+            bases = [bases]
+        self._ensure_fresh(max_age)
+        prices = self.prices
+        return {b: prices[f'{b.upper()}{quote}'] for b in bases if f'{b.upper()}{quote}' in prices}
+
+    def start(self, interval=REFRESH_INTERVAL_S):
+        """
+        refresh in a background thread every interval seconds, lookups then never block on the network
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+
+        def _run():
+            while not self._stop.is_set():
+                try:
+                    with self._refresh_lock:
+                        self.refresh()
+                except Exception as e:
+                    logger.warning(f"ticker refresh failed {self.base_url}|e={e}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=_run, name='ticker-cache', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def __repr__(self):
+        return f"TickerCache({self.base_url}, symbols={len(self.prices)}, age={self.age()})"
+
+
+class CachedValueMissing(Exception):
+    pass
+
+
+class CachedValue:
+    """
+    single value kept for max_age seconds, ie the USDT/USD rate
+
+    a failed refresh (fetch returns None or raises) keeps serving the last good value,
+    CachedValueMissing while there has never been one
+    """
+
+    def __init__(self, fetch, max_age=TICKER_MAX_AGE_S):
+        self.fetch = fetch
+        self.max_age = max_age
+        self.value = None
+        self.updated_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self.updated_at is None or time.monotonic() - self.updated_at > self.max_age:
+            with self._lock:
+                if self.updated_at is None or time.monotonic() - self.updated_at > self.max_age:
+                    try:
+                        value = self.fetch()
+                    except Exception as e:
+                        if self.value is None:
+                            raise CachedValueMissing(f'first fetch failed|e={e}') from e
+                        return self.value
+                    if value is None:
+                        if self.value is None:
+                            raise CachedValueMissing('first fetch returned None')
+                        return self.value  # keep serving the last good value
+                    self.value, self.updated_at = value, time.monotonic()
+        return self.value
+
+
+# process wide caches, one per exchange
+TICKER_CACHES = {}
+_LOCK = threading.Lock()
+
+
+def get_ticker_cache(exchange='BINANCE', max_age=None):
+    """
+    :param exchange: key of EXCHANGE_TO_BASE_URL with a binance style ticker/price endpoint
+    """
+    exchange = exchange.upper()
+    cache = TICKER_CACHES.get(exchange)
+    if cache is None:
+        with _LOCK:
+            cache = TICKER_CACHES.get(exchange)
+            if cache is None:
+                cache = TICKER_CACHES[exchange] = TickerCache(EXCHANGE_TO_BASE_URL[exchange])
+    if max_age is not None:
+        cache.max_age = max_age
+    return cache
@@ -2,7 +2,7 @@ import os
 import time
 from urllib.parse import urlencode
 
-import requests
+from .session_manager import SESSIONS
 
 EXCHANGE_TO_BASE_URL = {
     'BINANCE': 'https://api.binance.com/api/v3',
@@ -17,6 +17,12 @@ EXCHANGE_TO_BASE_URL = {
     'KRAKEN': 'https://api.kraken.com/0/public',
 }
 
+EXCHANGE_TO_WS_URL = {
+    'BINANCE': 'wss://stream.binance.com:9443',
+    'BINANCE_FUTURES_USDM': 'wss://fstream.binance.com',
+    'BINANCE_FUTURES_COINM': 'wss://dstream.binance.com',
+}
+
 
 def make_endpoint(endpoint, **args):
     return endpoint + '?' + urlencode(args) if args else endpoint
@@ -28,7 +34,7 @@ def make_get_request(url: str, endpoint: str, **args):
     :param endpoint: endpoint of API to be called
     :params **args: urlencodes args, ie endpoint + ? arg1=val1 & arg2=val2
     """
-    return requests.get(os.path.join(url, make_endpoint(endpoint, **args))).json()
+    return SESSIONS.get(os.path.join(url, make_endpoint(endpoint, **args))).json()
 
 
 def get_timestamp_ms():
@@ -0,0 +1,295 @@
+"""
+Key / value + hash cache backends with the Redis subset data.py reads
+
+    get(key), set(key, value, ex=None), delete(key)
+    hgetall(key), hset(key, mapping=...)
+
+values are str (as redis-py with decode_responses=True), backends;
+
+    LruCache     in process, bounded, default
+    SqliteCache  on disk, shared by processes on one box
+    RedisCache   redis-py / fakeredis client
+
+make_cache('memory://'), make_cache('sqlite:////tmp/cache.db'), make_cache('redis://localhost:6379/0'),
+make_cache('fakeredis://') for a local stand-in
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+
+LRU_MAXSIZE = 4096
+KLINES_TTL_S = 6 * 3600
+
+
+def ticker_key(exchange):
+    return f"ticker:{exchange}"
+
+
+def klines_key(exchange, base, quote, freq):
+    return f"options:klines:{exchange}:{base}:{quote}:{freq}"
+
+
+class CacheBackend(ABC):
+    """
+    interface, backends store str values, a backend missing a method fails on creation
+    """
+
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    @abstractmethod
+    def set(self, key, value, ex=None):
+        """
+        :param ex: seconds to live, None keeps the key
+        """
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    @abstractmethod
+    def hgetall(self, key):
+        """
+        {field: value}, {} if the key does not exist
+        """
+
+    @abstractmethod
+    def hset(self, key, mapping):
+        pass
+
+    def __bool__(self):
+        # an empty cache is still a cache (data.py checks `if get_cache()`)
+        return True
+
+
+class LruCache(CacheBackend):
+    """
+    in process, least recently used keys dropped past maxsize
+    """
+
+    def __init__(self, maxsize=LRU_MAXSIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and time.time() >= expires_at:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def _set(self, key, value, ex=None):
+        self._data[key] = (value, None if ex is None else time.time() + ex)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            value = self._get(key)
+            return value if isinstance(value, str) else None
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._set(key, str(value), ex)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def hgetall(self, key):
+        with self._lock:
+            value = self._get(key)
+            return dict(value) if isinstance(value, dict) else {}
+
+    def hset(self, key, mapping):
+        with self._lock:
+            value = self._get(key)
+            value = dict(value) if isinstance(value, dict) else {}
+            value.update({k: str(v) for k, v in mapping.items()})
+            self._set(key, value)
+
+
+class SqliteCache(CacheBackend):
+    """
+    on disk, WAL mode so several processes can read while one publishes
+    """
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS hashes (key TEXT, field TEXT, value TEXT, PRIMARY KEY (key, field))")
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and time.time() >= expires_at:
+                self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, str(value), None if ex is None else time.time() + ex))
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+            self._conn.execute("DELETE FROM hashes WHERE key = ?", (key,))
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._conn.execute("SELECT field, value FROM hashes WHERE key = ?", (key,)).fetchall())
+
+    def hset(self, key, mapping):
+        # one transaction, readers never see the new timestamp with the old raw
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO hashes (key, field, value) VALUES (?, ?, ?)",
+                    [(key, k, str(v)) for k, v in mapping.items()])
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisCache(CacheBackend):
+    """
+    wraps a redis-py compatible client (redis.Redis, fakeredis.FakeRedis), values decoded to str
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url):
+        import redis
+        return cls(redis.Redis.from_url(url, decode_responses=True))
+
+    @staticmethod
+    def _decode(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    def get(self, key):
+        return self._decode(self.client.get(key))
+
+    def set(self, key, value, ex=None):
+        self.client.set(key, value, ex=None if ex is None else int(ex))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def hgetall(self, key):
+        return {self._decode(k): self._decode(v) for k, v in self.client.hgetall(key).items()}
+
+    def hset(self, key, mapping):
+        self.client.hset(key, mapping=mapping)
+
+
+def make_cache(url=None):
+    """
+    :param url: memory:// (default), sqlite:///rel.db or sqlite:////abs.db, redis://host:port/db, fakeredis://
+    """
+    if not url or url.startswith('memory://'):
+        return LruCache()
+    if url.startswith('sqlite:///'):
+        # sqlite:///relative.db, sqlite:////abs/path.db
+        return SqliteCache(url[len('sqlite:///'):])
+    if url.startswith('fakeredis://'):
+        import fakeredis
+        return RedisCache(fakeredis.FakeRedis(decode_responses=True))
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisCache.from_url(url)
+    raise ValueError(f'unsupported cache url {url}')
+
+
+class CachePublisher:
+    """
+    writes the keys data.py reads;
+
+        ticker:{exchange}  hash {timestamp: epoch seconds, raw: json {pair: {price}}}
+        options:klines:{Exchange}:{base}:{quote}:{freq}  json list of (ts, o, h, l, c, v)
+
+    publisher = CachePublisher(cache, {'Binance': lambda: {'BTCUSDT': 30000.}})
+    publisher.start(interval=5)
+    """
+
+    def __init__(self, cache, ticker_fetchers=None):
+        """
+        :param ticker_fetchers: {exchange: callable returning {pair: price}}
+        """
+        self.cache = cache
+        self.ticker_fetchers = dict(ticker_fetchers or {})
+        self._thread = None
+        self._stop = threading.Event()
+
+    def publish_tickers(self, exchange, pair_2_price, timestamp=None):
+        self.cache.hset(ticker_key(exchange), mapping={
+            'timestamp': datetime.now().timestamp() if timestamp is None else timestamp,
+            'raw': json.dumps({pair: {'price': str(px)} for pair, px in pair_2_price.items() if px is not None}),
+        })
+
+    def publish_klines(self, exchange, base, quote, freq, klines, ttl=KLINES_TTL_S):
+        self.cache.set(klines_key(exchange, base, quote, freq), json.dumps([list(k) for k in klines]), ex=ttl)
+
+    def publish_once(self):
+        """
+        run every ticker fetcher once, a failing exchange does not stop the others
+
+        returns;
+            {exchange: exception} of the ones that failed
+        """
+        errors = {}
+        for exchange, fetch in self.ticker_fetchers.items():
+            try:
+                self.publish_tickers(exchange, fetch())
+            except Exception as e:
+                errors[exchange] = e
+        return errors
+
+    def start(self, interval=5):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+
+        def _run():
+            while not self._stop.is_set():
+                self.publish_once()
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=_run, name='cache-publisher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
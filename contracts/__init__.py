@@ -1,2 +1,4 @@
 from .contracts import NETWORK_2_RPC, NETWORK_2_EXPLORER, NETWORK_2_EXPORER_API, ADDRESS_BOOK, convert_balance_2_units, \
-                        address_2_checksum, ContractFactory, init_w3_provider, CONTRACT_FACTORIES, ADDRESS_2_PROXY, NETWORK_2_API_KEY
+                        address_2_checksum, ContractFactory, init_w3_provider, CONTRACT_FACTORIES, ADDRESS_2_PROXY, NETWORK_2_API_KEY, \
+                        Multicall, MulticallError, MULTICALL3_ADDRESS, LazyRegistry, LazyDict, W3_PROVIDERS
+from .abi_cache import ABI_CACHE, AbiCache
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from utils import write_json_atomic
+
+ABI_CACHE_DIR = os.environ.get('ABI_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'defi_public', 'abi'))
+ABI_CACHE_TTL = 7 * 24 * 60 * 60  # seconds, verified ABIs rarely change
+
+
+class AbiCache:
+    """
+    On disk ABI store keyed by (network, address, proxy address)
+
+    <path>/abis/<sha256>.json :: ABIs stored by content hash, identical ABIs (ie ERC20s) stored once
+    <path>/index.json         :: {network:address:proxy: {'hash': sha256, 'fetched_at': unix ts}}
+    """
+
+    def __init__(self, path=ABI_CACHE_DIR, ttl=ABI_CACHE_TTL):
+        """
+        :param path: cache directory
+        :param ttl: seconds before an entry is refetched, None never expires
+        """
+        self.path = path
+        self.ttl = ttl
+        self._index = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(network, address, proxy_address=None):
+        return f"{network.upper()}:{address.lower()}:{(proxy_address or '').lower()}"
+
+    @property
+    def index_path(self):
+        return os.path.join(self.path, 'index.json')
+
+    def _abi_path(self, abi_hash):
+        return os.path.join(self.path, 'abis', f'{abi_hash}.json')
+
+    @property
+    def index(self):
+        if self._index is None:
+            try:
+                with open(self.index_path) as f:
+                    self._index = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self):
+        write_json_atomic(self.index, self.index_path)
+
+    def get(self, network, address, proxy_address=None):
+        """
+        returns;
+            cached ABI (list) or None if missing / expired
+        """
+        entry = self.index.get(self.key(network, address, proxy_address))
+        if entry is None:
+            return None
+        if self.ttl is not None and time.time() - entry['fetched_at'] > self.ttl:
+            return None
+        try:
+            with open(self._abi_path(entry['hash'])) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, network, address, abi, proxy_address=None):
+        blob = json.dumps(abi, sort_keys=True, separators=(',', ':'))
+        abi_hash = hashlib.sha256(blob.encode()).hexdigest()
+        abi_path = self._abi_path(abi_hash)
+        with self._lock:
+            if not os.path.exists(abi_path):
+                write_json_atomic(abi, abi_path)
+            self.index[self.key(network, address, proxy_address)] = {'hash': abi_hash, 'fetched_at': time.time()}
+            self._save_index()
+
+    def invalidate(self, network=None, address=None, proxy_address=None):
+        """
+        drop entries, ie invalidate('ARBI', address) after a contract upgrade
+
+        no args drops everything, network only drops the whole network,
+        proxy_address=None drops the address regardless of proxy
+        """
+        with self._lock:
+            for key in list(self.index):
+                network_, address_, proxy_ = key.split(':')
+                if network is not None and network_ != network.upper():
+                    continue
+                if address is not None and address_ != address.lower():
+                    continue
+                if proxy_address is not None and proxy_ != proxy_address.lower():
+                    continue
+                self.index.pop(key)
+            self._save_index()
+
+    def get_or_fetch(self, network, address, fetch, proxy_address=None):
+        """
+        :param fetch: callable returning the ABI, only called on a cache miss
+        """
+        abi = self.get(network, address, proxy_address)
+        if abi is None:
+            abi = fetch()
+            self.put(network, address, abi, proxy_address)
+        return abi
+
+
+ABI_CACHE = AbiCache()
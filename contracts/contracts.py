@@ -1,20 +1,101 @@
 import json
-import time
+import logging
+import threading
 from collections import namedtuple
+from collections.abc import Mapping
+from functools import partial
 
 import requests
-import web3
-from bs4 import BeautifulSoup
-from web3 import Web3, HTTPProvider
+
+from .abi_cache import ABI_CACHE
+
+logger = logging.getLogger(__name__)
+
+# web3 (and bs4) are imported inside the functions that need them,
+# importing contracts stays cheap until a provider / checksum is actually used
+
+
+class LazyRegistry(Mapping):
+    """
+    Read-only mapping whose values are built by factory on first access and memoized,
+    ie LazyRegistry({'ARBI': partial(ContractFactory, 'ARBI')})
+    """
+
+    def __init__(self, factories):
+        self._factories = dict(factories)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        factory = self._factories[key]
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = factory()
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self):
+        return len(self._factories)
+
+    def is_loaded(self, key):
+        return key in self._values
+
+
+class LazyDict(Mapping):
+    """
+    Read-only mapping built in one go by factory on first access
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._data = None
+        self._lock = threading.Lock()
+
+    @property
+    def data(self):
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = self._factory()
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
 
 def address_2_checksum(address):
+    from web3 import Web3
     return Web3.toChecksumAddress(address)
 
-# Alchemy free RPC's
+# Alchemy / public free RPC's
+# multiple per network in case you get rate-limited, see ProviderPool
 NETWORK_2_RPC = {
-    "ARBI": "https://arb-mainnet.g.alchemy.com/v2/<KEY>",
-    "ETH": "https://rpc.ankr.com/eth", 
-    "OP": "https://rpc.ankr.com/optimism", # have multiple in case you get rate-limited
+    "ARBI": [
+        "https://arb-mainnet.g.alchemy.com/v2/<KEY>",
+        "https://arb1.arbitrum.io/rpc",
+        "https://rpc.ankr.com/arbitrum",
+    ],
+    "ETH": [
+        "https://rpc.ankr.com/eth",
+        "https://eth.llamarpc.com",
+        "https://cloudflare-eth.com",
+    ],
+    "OP": [
+        "https://rpc.ankr.com/optimism",
+        "https://mainnet.optimism.io",
+    ],
 }
 
 NETWORK_2_EXPLORER = {
@@ -65,7 +146,8 @@ ADDRESS_2_PROXY = {
     "0x912CE59144191C1204E64559FE8253a0e49E6548": "0xC4ed0A9Ea70d5bCC69f748547650d32cC219D882", # ARB ARBI
 }
 
-ADDRESS_2_PROXY = {address_2_checksum(k) : address_2_checksum(v) for k, v in ADDRESS_2_PROXY.items()}
+ADDRESS_2_PROXY = LazyDict(partial(
+    lambda d: {address_2_checksum(k) : address_2_checksum(v) for k, v in d.items()}, ADDRESS_2_PROXY))
 
 # named tuple
 ContractSpec = namedtuple('Contract', ['address', 'is_token'])
@@ -74,14 +156,16 @@ def convert_keys_2_named_tuple(dct):
     d = dict(dct)
     return {k: ContractSpec(address=address_2_checksum(add), is_token=bool_) for k, (add, bool_) in d.items()}
 
-ADDRESS_BOOK = {
-    "ARBI": convert_keys_2_named_tuple(ADDRESS_ARBITRUM),
-    "ETH": convert_keys_2_named_tuple(ADDRESS_ETHEREUM),
-}
+# checksummed per network on first access
+ADDRESS_BOOK = LazyRegistry({
+    "ARBI": partial(convert_keys_2_named_tuple, ADDRESS_ARBITRUM),
+    "ETH": partial(convert_keys_2_named_tuple, ADDRESS_ETHEREUM),
+})
 
 
 # move to utils?
 def convert_balance_2_units(balance, unit="ether"):
+    from web3 import Web3
     return float(Web3.fromWei(balance, unit=unit))
 
 # convert to checksum address
@@ -93,28 +177,181 @@ def convert_balance_2_units(balance, unit="ether"):
 #     return dict_
 
 # instantiate a web3 remote provider
-def init_w3_provider(network):
-    return Web3(Web3.HTTPProvider(NETWORK_2_RPC[network]))
+# (pooled over every RPC of the network, routes to the fastest healthy one)
+def init_w3_provider(network, **pool_kwargs):
+    from web3 import Web3
+    from .provider_pool import ProviderPool
+    return Web3(ProviderPool(NETWORK_2_RPC[network], **pool_kwargs))
+
+
+# one provider per network, created on first use
+W3_PROVIDERS = LazyRegistry({network: partial(init_w3_provider, network) for network in NETWORK_2_RPC})
+
+# same address on every chain, https://www.multicall3.com
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+MULTICALL3_ABI = [{
+    "inputs": [{
+        "components": [
+            {"internalType": "address", "name": "target", "type": "address"},
+            {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+            {"internalType": "bytes", "name": "callData", "type": "bytes"},
+        ],
+        "internalType": "struct Multicall3.Call3[]", "name": "calls", "type": "tuple[]",
+    }],
+    "name": "aggregate3",
+    "outputs": [{
+        "components": [
+            {"internalType": "bool", "name": "success", "type": "bool"},
+            {"internalType": "bytes", "name": "returnData", "type": "bytes"},
+        ],
+        "internalType": "struct Multicall3.Result[]", "name": "returnData", "type": "tuple[]",
+    }],
+    "stateMutability": "payable",
+    "type": "function",
+}]
+
+# calls per aggregate3 / batch request, keeps calldata + response size sane
+MULTICALL_CHUNK_SIZE = 300
+
+
+class MulticallError(Exception):
+    pass
+
+
+class Multicall:
+    """
+    Collects view calls from contracts built by ContractFactory and executes them as
+    one Multicall3 aggregate3 eth_call (falls back to a JSON-RPC batch of eth_calls)
+
+    mc = Multicall(w3)
+    mc.add('glp_price', cmap['ARBI']['glp_manager'].functions.getPrice(True))
+    mc.add(('fsglp', address), cmap['ARBI']['fsglp'].functions.balanceOf(address))
+    out = mc.call()  # {key: decoded result}
+    """
+
+    def __init__(self, w3, allow_failure=False, chunk_size=MULTICALL_CHUNK_SIZE):
+        """
+        :param w3: Web3 instance, ie ContractFactory.w3 or contract.web3
+        :param allow_failure: failed calls return None instead of raising MulticallError
+        """
+        self.w3 = w3
+        self.allow_failure = allow_failure
+        self.chunk_size = chunk_size
+        self.calls = []
+        self.use_rpc_batch = False
+
+    def add(self, key, contract_function):
+        """
+        :param key: any hashable, key of the result in call()
+        :param contract_function: bound call, ie contract.functions.balanceOf(address)
+        """
+        self.calls.append((key, contract_function))
+        return self
+
+    def __len__(self):
+        return len(self.calls)
+
+    def call(self, block_identifier='latest'):
+        """
+        returns;
+            {key: decoded output}, single outputs are unwrapped like ContractFunction.call()
+        """
+        from web3.exceptions import BadFunctionCallOutput, ContractLogicError
+
+        out = {}
+        for i in range(0, len(self.calls), self.chunk_size):
+            chunk = self.calls[i:i + self.chunk_size]
+            targets = [(fn.address, fn._encode_transaction_data()) for _, fn in chunk]
+            results = None
+            if not self.use_rpc_batch:
+                try:
+                    results = self._call_aggregate3(targets, block_identifier)
+                except (BadFunctionCallOutput, ContractLogicError) as e:
+                    # no multicall3 on this chain (empty output) / it reverts, stay on batch
+                    self.use_rpc_batch = True
+                    logger.warning(f"aggregate3 unusable, switching to batch eth_call|e={e}")
+                except Exception as e:
+                    # timeout, provider hiccup ... only this chunk goes through the batch
+                    logger.debug(f"aggregate3 failed, batch eth_call for this chunk|e={e}")
+            if results is None:
+                results = self._call_rpc_batch(targets, block_identifier)
+
+            for (key, fn), (success, data) in zip(chunk, results):
+                if success and data:
+                    out[key] = self._decode(fn, data)
+                elif self.allow_failure:
+                    out[key] = None
+                else:
+                    raise MulticallError(f"{fn.fn_name} call to {fn.address} failed")
+        return out
+
+    def _call_aggregate3(self, targets, block_identifier):
+        multicall = self.w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+        calls = [(target, True, data) for target, data in targets]
+        return multicall.functions.aggregate3(calls).call(block_identifier=block_identifier)
+
+    def _call_rpc_batch(self, targets, block_identifier):
+        block = hex(block_identifier) if isinstance(block_identifier, int) else block_identifier
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": "eth_call", "params": [{"to": target, "data": data}, block]}
+            for i, (target, data) in enumerate(targets)
+        ]
+        make_batch_request = getattr(self.w3.provider, 'make_batch_request', None)
+        if make_batch_request is not None:
+            resp = make_batch_request(payload)
+        else:
+            resp = requests.post(self.w3.provider.endpoint_uri, json=payload, timeout=30).json()
+        if not isinstance(resp, list):
+            raise MulticallError(f"batch eth_call rejected: {resp}")
+        resp = sorted(resp, key=lambda r: r['id'])
+        return [('result' in r, bytes.fromhex(r.get('result', '0x')[2:])) for r in resp]
+
+    def _decode(self, fn, data):
+        from web3._utils.abi import get_abi_output_types, map_abi_data
+        from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+
+        output_types = get_abi_output_types(fn.abi)
+        decoded = self.w3.codec.decode_abi(output_types, data)
+        normalized = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, decoded)
+        return normalized[0] if len(normalized) == 1 else normalized
+
 
 class ContractFactory:
     
-    def __init__(self, network: str):
+    def __init__(self, network: str, abi_cache=ABI_CACHE):
         """
         :param network: ARBI, AVAX, ETH, POLYGON
+        :param abi_cache: AbiCache, None always fetches from the explorer
         """
         self.network = network.upper()
-        self.w3 = init_w3_provider(self.network)
+        self.abi_cache = abi_cache
+
+    @property
+    def w3(self):
+        # shared per network, only built when a contract / call needs it
+        return W3_PROVIDERS[self.network]
 
     def create_contract(self, address, is_token: bool, key_2_get_abi=False, proxy_contract_address=None):
-        address = Web3.toChecksumAddress(address)
+        """
+        proxy_contract_address (optional), defaults to ADDRESS_2_PROXY lookup
+        """
+        address = address_2_checksum(address)
+        if proxy_contract_address is None:
+            proxy_contract_address = ADDRESS_2_PROXY.get(address)
         address_abi = address
         if proxy_contract_address:
-            address_abi = Web3.toChecksumAddress(proxy_contract_address)
-        
-        if key_2_get_abi:
-            abi = self.get_contract_abi_w_api(address_abi, key_2_get_abi)
+            address_abi = address_2_checksum(proxy_contract_address)
+
+        def fetch_abi():
+            if key_2_get_abi:
+                return self.get_contract_abi_w_api(address_abi, key_2_get_abi)
+            return self.get_contract_abi(address_abi, 'token' if is_token else 'address')
+
+        if self.abi_cache is None:
+            abi = fetch_abi()
         else:
-            abi = self.get_contract_abi(address_abi, 'token' if is_token else 'address')
+            abi = self.abi_cache.get_or_fetch(self.network, address, fetch_abi, proxy_address=proxy_contract_address)
         
         contract = self.w3.eth.contract(
             address=address, 
@@ -123,22 +360,32 @@ class ContractFactory:
         return contract
     
     def get_contract_abi(self, address, is_token: bool):
+        from bs4 import BeautifulSoup
+        from api.session_manager import SESSIONS
+
         url = NETWORK_2_EXPLORER[self.network](address, is_token)
-        data = requests.get(url, headers = {'User-Agent': 'Popular browser\'s user-agent'})
+        data = SESSIONS.get(url, headers = {'User-Agent': 'Popular browser\'s user-agent'})
         html = BeautifulSoup(data.text, 'html.parser')
         abi_html = html.find_all(class_="wordwrap js-copytextarea2")[0]
         abi_json = json.loads(abi_html.next_element)
         return abi_json
 
     def get_contract_abi_w_api(self, address, key):
-        # MAX 5 per seconds
-        r = requests.get(NETWORK_2_EXPORER_API[self.network](address, key), headers = {'User-Agent': 'Popular browser\'s user-agent'})
+        # MAX 5 per seconds, paced by the explorer bucket of RATE_LIMITER (imported here, api is heavy)
+        from api.session_manager import SESSIONS
+
+        url = NETWORK_2_EXPORER_API[self.network](address, key)
+        r = SESSIONS.get(url, headers = {'User-Agent': 'Popular browser\'s user-agent'})
         abi = list(json.loads(r.json()['result']))
-        time.sleep(0.5)
         return abi
+
+    def multicall(self, **kwargs):
+        """
+        batch of view calls against this network, see Multicall
+        """
+        return Multicall(self.w3, **kwargs)
     
     
-CONTRACT_FACTORIES = {
-    'ARBI': ContractFactory('ARBI'),
-    'ETH': ContractFactory('ETH'),
-}
+# factories (and their web3 providers) are created on first access per network
+CONTRACT_FACTORIES = LazyRegistry({network: partial(ContractFactory, network) for network in NETWORK_2_RPC})
+
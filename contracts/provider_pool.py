@@ -0,0 +1,207 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from web3 import HTTPProvider
+from web3.providers.base import BaseProvider
+
+logger = logging.getLogger(__name__)
+
+# read only calls, safe to send to a second endpoint while the first is slow
+HEDGE_METHODS = {
+    'eth_call',
+    'eth_blockNumber',
+    'eth_chainId',
+    'eth_getBalance',
+    'eth_getBlockByNumber',
+    'eth_getCode',
+    'eth_getLogs',
+    'eth_getStorageAt',
+    'eth_getTransactionCount',
+    'eth_getTransactionReceipt',
+}
+
+# JSON-RPC error codes providers use for throttling
+RATE_LIMIT_RPC_CODES = {-32005, -32029, 429}
+
+HEDGE_AFTER_S = 0.75          # fire the hedge if the fastest endpoint has not answered by then
+RATE_LIMIT_BACKOFF_S = 30     # first cool down after a 429, doubles while it keeps happening
+MAX_RATE_LIMIT_BACKOFF_S = 600
+ERROR_BACKOFF_S = 5           # cool down after a connection error / 5xx
+EWMA_ALPHA = 0.2
+REQUEST_TIMEOUT_S = 15
+
+
+class RateLimitedError(Exception):
+    pass
+
+
+class Endpoint:
+    """
+    one RPC url with its rolling latency / error rate
+    """
+
+    def __init__(self, url, timeout=REQUEST_TIMEOUT_S):
+        self.url = url
+        self.provider = HTTPProvider(url, request_kwargs={'timeout': timeout})
+        self.timeout = timeout
+        self.latency = None     # ewma seconds
+        self.error_rate = 0.    # ewma of 0 / 1
+        self.cooldown_until = 0.
+        self.rate_limit_backoff = RATE_LIMIT_BACKOFF_S
+        self._lock = threading.Lock()
+
+    def is_healthy(self, now=None):
+        return (now or time.monotonic()) >= self.cooldown_until
+
+    def score(self):
+        # unknown latency ranks ahead so every endpoint gets measured
+        latency = self.latency if self.latency is not None else 0.
+        return latency * (1 + 10 * self.error_rate)
+
+    def record_success(self, latency):
+        with self._lock:
+            self.latency = latency if self.latency is None else (1 - EWMA_ALPHA) * self.latency + EWMA_ALPHA * latency
+            self.error_rate = (1 - EWMA_ALPHA) * self.error_rate
+            self.rate_limit_backoff = RATE_LIMIT_BACKOFF_S
+
+    def record_error(self, rate_limited=False):
+        with self._lock:
+            self.error_rate = (1 - EWMA_ALPHA) * self.error_rate + EWMA_ALPHA
+            if rate_limited:
+                self.cooldown_until = time.monotonic() + self.rate_limit_backoff
+                self.rate_limit_backoff = min(self.rate_limit_backoff * 2, MAX_RATE_LIMIT_BACKOFF_S)
+            else:
+                self.cooldown_until = time.monotonic() + ERROR_BACKOFF_S
+
+    def __repr__(self):
+        return f"Endpoint({self.url}, latency={self.latency}, error_rate={self.error_rate:.2f}, healthy={self.is_healthy()})"
+
+
+class ProviderPool(BaseProvider):
+    """
+    web3 provider over several RPC endpoints of one network
+
+    routes each request to the fastest healthy endpoint, fails over on errors,
+    cools down endpoints that rate-limit us and hedges slow reads to the runner up
+    """
+
+    def __init__(self, endpoint_uris, hedge_after=HEDGE_AFTER_S, timeout=REQUEST_TIMEOUT_S):
+        """
+        :param endpoint_uris: list of http(s) RPC urls
+        :param hedge_after: seconds before a read is also sent to a second endpoint, None disables hedging
+        """
+        if isinstance(endpoint_uris, str):
+            endpoint_uris = [endpoint_uris]
+        self.endpoints = [Endpoint(url, timeout=timeout) for url in endpoint_uris]
+        self.hedge_after = hedge_after
+        self._executor = ThreadPoolExecutor(max_workers=2 * len(self.endpoints), thread_name_prefix='rpc')
+        self._sessions = {}
+
+    def ranked(self):
+        """
+        healthy endpoints fastest first, then the ones cooling down (soonest available first)
+        """
+        now = time.monotonic()
+        healthy = sorted((e for e in self.endpoints if e.is_healthy(now)), key=Endpoint.score)
+        cooling = sorted((e for e in self.endpoints if not e.is_healthy(now)), key=lambda e: e.cooldown_until)
+        return healthy + cooling
+
+    @property
+    def endpoint_uri(self):
+        return self.ranked()[0].url
+
+    def isConnected(self):
+        try:
+            return 'result' in self.make_request('eth_blockNumber', [])
+        except Exception:
+            return False
+
+    def _request(self, endpoint, method, params):
+        start = time.monotonic()
+        try:
+            resp = endpoint.provider.make_request(method, params)
+        except requests.HTTPError as e:
+            rate_limited = e.response is not None and e.response.status_code == 429
+            endpoint.record_error(rate_limited=rate_limited)
+            raise
+        except Exception:
+            endpoint.record_error()
+            raise
+
+        error = resp.get('error') if isinstance(resp, dict) else None
+        if isinstance(error, dict) and error.get('code') in RATE_LIMIT_RPC_CODES:
+            endpoint.record_error(rate_limited=True)
+            raise RateLimitedError(f"{endpoint.url}: {error}")
+
+        endpoint.record_success(time.monotonic() - start)
+        return resp
+
+    def _failover(self, endpoints, method, params):
+        last_exc = None
+        for endpoint in endpoints:
+            try:
+                return self._request(endpoint, method, params)
+            except Exception as e:
+                logger.debug(f"rpc {method} failed on {endpoint.url}|e={e}")
+                last_exc = e
+        raise last_exc
+
+    def _hedged(self, endpoints, method, params):
+        primary = self._executor.submit(self._request, endpoints[0], method, params)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done and primary.exception() is None:
+            return primary.result()
+
+        # slow or failed, race the rest of the pool (in rank order) against it
+        pending = {primary} if not done else set()
+        backup = self._executor.submit(self._failover, endpoints[1:], method, params)
+        pending.add(backup)
+        last_exc = primary.exception() if done else None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                last_exc = future.exception()
+        raise last_exc
+
+    def make_request(self, method, params):
+        endpoints = self.ranked()
+        if self.hedge_after is not None and method in HEDGE_METHODS and len(endpoints) > 1:
+            return self._hedged(endpoints, method, params)
+        return self._failover(endpoints, method, params)
+
+    def _session(self, endpoint):
+        session = self._sessions.get(endpoint.url)
+        if session is None:
+            session = self._sessions[endpoint.url] = requests.Session()
+        return session
+
+    def make_batch_request(self, payload):
+        """
+        JSON-RPC batch (list of requests) with failover, used by Multicall
+        """
+        last_exc = None
+        for endpoint in self.ranked():
+            start = time.monotonic()
+            try:
+                r = self._session(endpoint).post(
+                    endpoint.url, data=json.dumps(payload),
+                    headers={'Content-Type': 'application/json'}, timeout=endpoint.timeout)
+                if r.status_code == 429:
+                    endpoint.record_error(rate_limited=True)
+                    raise RateLimitedError(endpoint.url)
+                r.raise_for_status()
+                resp = r.json()
+            except Exception as e:
+                if not isinstance(e, RateLimitedError):
+                    endpoint.record_error()
+                last_exc = e
+                continue
+            endpoint.record_success(time.monotonic() - start)
+            return resp
+        raise last_exc
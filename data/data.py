@@ -1,10 +1,20 @@
+import asyncio
 import os
 import json
-import requests
+import statistics
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 from datetime import datetime
 import pandas as pd
 
+from api import COINGECKO_INDEX, RATE_LIMITER, SESSIONS, CachedValue, get_ticker_cache
+import cache
+import ohlc_store
+import utils
+from api.async_client import DEFAULT_CONCURRENCY, gather_with_concurrency, make_client_session
+
 EXCHANGE_AVAIL = [
     'BINANCE',
     'BITFINEX',
@@ -39,6 +49,37 @@ API_OHLC = {
     'KRAKEN': lambda symb, freq: f'OHLC?pair={symb}&interval={freq}',
 }
 
+# OHLC range params (start / end unix seconds, either may be None), appended to API_OHLC
+# exchanges missing here (COINGECKO) only serve their default window
+API_OHLC_RANGE = {
+    'BINANCE': lambda start, end, freq: ''.join([
+        f'&startTime={int(start * 1000)}' if start is not None else '',
+        f'&endTime={int(end * 1000)}' if end is not None else '',
+    ]),
+    'BITFINEX': lambda start, end, freq: ''.join([
+        '?limit=10000&sort=1' if start is not None else '?limit=10000',
+        f'&start={int(start * 1000)}' if start is not None else '',
+        f'&end={int(end * 1000)}' if end is not None else '',
+    ]),
+    # needs both ends, max 300 candles
+    'COINBASE': lambda start, end, freq: '' if start is None and end is None else ''.join([
+        f'&start={datetime.utcfromtimestamp(start if start is not None else end - 299 * freq).isoformat()}',
+        f'&end={datetime.utcfromtimestamp(end if end is not None else start + 299 * freq).isoformat()}',
+    ]),
+    # since only, no end
+    'KRAKEN': lambda start, end, freq: f'&since={int(start)}' if start is not None else '',
+}
+
+# raw candle column of (ts, open, high, low, close, volume), None = not provided, and ts units per second
+EXCHANGE_CANDLE_COLUMNS = {
+    'BINANCE': ((0, 1, 2, 3, 4, 5), 1000),
+    'BITFINEX': ((0, 1, 3, 4, 2, 5), 1000),     # time, open, close, high, low, volume
+    'COINGECKO': ((0, 1, 2, 3, 4, None), 1000),
+    'COINBASE': ((0, 3, 2, 1, 4, 5), 1),        # time, low, high, open, close, volume
+    'FTX': ((0, 1, 2, 3, 4, 5), 1000),
+    'KRAKEN': ((0, 1, 2, 3, 4, 6), 1),          # time, open, high, low, close, vwap, volume, count
+}
+
 EXCH_SYMB_FORMAT = {
     'BINANCE': lambda b, q: f'{b}{q}',
     'BITFINEX': lambda b, q: f't{b}{q}',
@@ -54,6 +95,29 @@ CONVERT_API_SYMB = {
 
 ACCEPTABLE_TICKER_TIME_DELAY = 50  # seconds
 
+# weighted spot, venues are queried concurrently
+SPOT_POLICIES = ('mean', 'first', 'quorum', 'median')
+SPOT_VENUE_TIMEOUT_S = 3        # venues slower than this are left out
+SPOT_MAX_DEVIATION_PCT = 0.02   # median policy drops venues further than this from the median
+SPOT_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix='spot')
+
+# ticker / klines cache and local OHLCV history, created on first use (no files / dirs on import)
+_CACHE = None
+_OHLC_STORE = None
+_LAZY_LOCK = threading.Lock()
+
+
+def get_cache():
+    """
+    process wide ticker / klines cache, see cache.make_cache for CACHE_URL (memory://, sqlite:///, redis://, fakeredis://)
+    """
+    global _CACHE
+    if _CACHE is None:
+        with _LAZY_LOCK:
+            if _CACHE is None:
+                _CACHE = cache.make_cache(os.environ.get('CACHE_URL', 'memory://'))
+    return _CACHE
+
 
 class NoHistoricalPriceDataError(Exception):
     pass
@@ -80,23 +144,29 @@ GET spot data from exchange
 
 def get_px_bfx(base, quote="USD"):
     try:
-        return requests.get(f"https://api-pub.bitfinex.com/v2/ticker/t{base}{quote}").json()[-4]
+        return SESSIONS.get(f"https://api-pub.bitfinex.com/v2/ticker/t{base}{quote}").json()[-4]
     except BaseException as e:
         utils.logger.error(f"Failed to get spot position from Bitfinex for {base}|e={e}")
         return
 
 
+# USDT/USD from Coinbase, shared by every Binance USDT price for a few seconds
+USDT_USD_PX = CachedValue(lambda: get_px_cbs("USDT", "USD"))
+
+
 def get_px_bin(base, quote="USDT"):
     if quote == "USD":
         quote = "USDT"
     try:
-        j = requests.get(f"https://api3.binance.com/api/v3/ticker/price?symbol={base}{quote}").json()  # {base}USDT
-        price = j["price"]
+        # bulk ticker cache, one request for every symbol
+        price = get_ticker_cache('BINANCE').get(f"{base}{quote}")  # {base}USDT
+        if price is None:
+            raise KeyError(f"{base}{quote} not listed")
         if quote.upper() in ["USDT", "USD"]:
-            usdt_usd_px = get_px_cbs("USDT", "USD")
-            return float(price) * usdt_usd_px
+            # CachedValueMissing until Coinbase answered once, never price * None
+            return price * USDT_USD_PX.get()
         else:
-            return float(price)
+            return price
     except BaseException as e:
         utils.logger.error(f"Failed to get spot position from Binance for {base}|e={e}")
         return
@@ -104,7 +174,7 @@ def get_px_bin(base, quote="USDT"):
 
 def get_px_cbs(base, quote="USD"):
     try:
-        j = requests.get(f"https://api.coinbase.com/v2/prices/{base}-{quote}/spot").json()
+        j = SESSIONS.get(f"https://api.coinbase.com/v2/prices/{base}-{quote}/spot").json()
         if 'errors' not in j:
             return float(j["data"]["amount"])
     except BaseException as e:
@@ -114,7 +184,7 @@ def get_px_cbs(base, quote="USD"):
 
 def get_px_ftx(base, quote="USD"):
     try:
-        j = requests.get(f"https://ftx.com/api/markets/{base}/{quote}").json()
+        j = SESSIONS.get(f"https://ftx.com/api/markets/{base}/{quote}").json()
         if j['success']:
             return float(j["result"]["price"])
     except BaseException as e:
@@ -122,6 +192,90 @@ def get_px_ftx(base, quote="USD"):
         return
 
 
+"""
+GET spot data from exchange (async)
+
+twins of the get_px_* functions above, pass a shared aiohttp session
+"""
+
+
+async def _get_json_async(session, url):
+    # paced by the RateLimiter the sync SESSIONS use
+    await RATE_LIMITER.acquire_async(url)
+    async with session.get(url) as resp:
+        RATE_LIMITER.update(url, resp)
+        return await resp.json(content_type=None)
+
+
+async def get_px_bfx_async(session, base, quote="USD"):
+    try:
+        return (await _get_json_async(session, f"https://api-pub.bitfinex.com/v2/ticker/t{base}{quote}"))[-4]
+    except Exception as e:
+        utils.logger.error(f"Failed to get spot position from Bitfinex for {base}|e={e}")
+        return
+
+
+async def get_px_bin_async(session, base, quote="USDT"):
+    if quote == "USD":
+        quote = "USDT"
+    try:
+        url = f"https://api3.binance.com/api/v3/ticker/price?symbol={base}{quote}"
+        if quote.upper() in ["USDT", "USD"]:
+            # fetch USDT/USD alongside instead of after
+            j, usdt_usd_px = await asyncio.gather(_get_json_async(session, url), get_px_cbs_async(session, "USDT", "USD"))
+            return float(j["price"]) * usdt_usd_px
+        j = await _get_json_async(session, url)
+        return float(j["price"])
+    except Exception as e:
+        utils.logger.error(f"Failed to get spot position from Binance for {base}|e={e}")
+        return
+
+
+async def get_px_cbs_async(session, base, quote="USD"):
+    try:
+        j = await _get_json_async(session, f"https://api.coinbase.com/v2/prices/{base}-{quote}/spot")
+        if 'errors' not in j:
+            return float(j["data"]["amount"])
+    except Exception as e:
+        utils.logger.error(f"Failed to get spot position from Coinbase for {base}|e={e}")
+        return
+
+
+async def get_weighted_spot_px_async(base, quote, exchanges=['Coinbase', 'Binance', 'Bitfinex'], session=None):
+    """
+    all venues queried concurrently, wall-clock time is the slowest venue
+    """
+    funcs = {
+        'Coinbase': get_px_cbs_async,
+        'Binance': get_px_bin_async,
+        'Bitfinex': get_px_bfx_async,
+    }
+    funcs = {k: v for k, v in funcs.items() if k in exchanges}
+
+    if session is None:
+        async with make_client_session() as session:
+            return await get_weighted_spot_px_async(base, quote, exchanges=exchanges, session=session)
+
+    pxs = await asyncio.gather(*[func(session, base=base, quote=quote) for func in funcs.values()])
+    pxs = [px for px in pxs if px is not None]
+    if not pxs:
+        raise ValueError(f'did not find {base + quote} in {exchanges}')
+    return sum(pxs) / len(pxs)
+
+
+async def get_weighted_spot_pxs_async(bases, quote, exchanges=['Coinbase', 'Binance', 'Bitfinex'], limit=DEFAULT_CONCURRENCY):
+    """
+    {base: weighted px} for many bases, at most [[limit]] bases in flight on one session
+    """
+    async with make_client_session() as session:
+        pxs = await gather_with_concurrency(
+            limit,
+            *[get_weighted_spot_px_async(b, quote, exchanges=exchanges, session=session) for b in bases],
+            return_exceptions=True,
+        )
+    return {b: px for b, px in zip(bases, pxs) if not isinstance(px, Exception)}
+
+
 def get_cached_weighted_spot_px(base, quote, exchanges, break_at_first=False):
     cached_ticker_exchanges = [
         "Coinbase",
@@ -135,71 +289,186 @@ def get_cached_weighted_spot_px(base, quote, exchanges, break_at_first=False):
             continue
 
         # quote = "USDT" if (exchange == "Binance" and quote.upper() == "USD") else "USD"
-        if quote.upper() == "USD":
-            if exchange == "Binance":
-                quote = "USDT"
-        result = _get_cached_exchange_ticker_price(exchange, base + quote)
+        exchange_quote = "USDT" if (exchange == "Binance" and quote.upper() == "USD") else quote
+        result = _get_cached_exchange_ticker_price(exchange, base + exchange_quote)
         price = result.get("price", None)
         if price is not None:
             pxs.append(price)
             exchange_px.append(exchange)
             if break_at_first:
                 break
-        utils.logger.error(f"[{exchange}]cached_price_unusable|skip_reason={result['error']}")
+        else:
+            utils.logger.debug(f"[{exchange}]cached_price_unusable|skip_reason={result['error']}")
     if not pxs:
         utils.logger.debug(f"Spot position not found in cache for {base}")
     return pxs, exchange_px
 
 
-def get_weighted_spot_px(base, quote, exchanges=['Coinbase', 'Binance', 'Bitfinex'], logging=False, break_at_first=False):
-    funcs = {
-        'Coinbase': get_px_cbs,
-        # 'Ftx': get_px_ftx,
-        'Binance': get_px_bin,
-        'Bitfinex': get_px_bfx,
-    }
-    funcs = {k: v for k, v in funcs.items() if k in exchanges}
+SPOT_FUNCS = {
+    'Coinbase': get_px_cbs,
+    # 'Ftx': get_px_ftx,
+    'Binance': get_px_bin,
+    'Bitfinex': get_px_bfx,
+}
 
-    pxs = []
-    exchange_pxs = {}
-    # Check Cache
-    if CACHE:
-        pxs, exchange_pxs = get_cached_weighted_spot_px(base, quote, exchanges, break_at_first=break_at_first)
-
-    # If cache does not have prices or prices for all exchanges (break_at_first == False)
-    if not pxs or not break_at_first:
-        for venue, func in funcs.items():
-            if venue in exchange_pxs:
-                # Price retreived from cache already, skip
-                continue
-
-            px = func(base=base, quote=quote)
-            if logging:
-                utils.logger.debug(f'Spot {base}-{quote} at {venue}: \t{px}')
-            if px is not None:
-                pxs.append(px)
-                if break_at_first:
-                    break
 
-    if not pxs:
+def _is_settled(venue_2_px, n_pending, policy, quorum):
+    """
+    True once the policy has enough prices (or nothing is left to wait for)
+    """
+    if not n_pending:
+        return True
+    if policy == 'first':
+        return len(venue_2_px) >= 1
+    if policy == 'quorum':
+        return len(venue_2_px) >= quorum
+    return False
+
+
+def _aggregate_spot(pxs, policy, max_deviation=SPOT_MAX_DEVIATION_PCT):
+    if policy == 'median' and len(pxs) > 2:
+        median = statistics.median(pxs)
+        kept = [px for px in pxs if abs(px - median) / median <= max_deviation]
+        pxs = kept or [median]
+    return sum(pxs) / len(pxs)
+
+
+def _collect_spot(jobs, policy, quorum, timeout, results):
+    """
+    :param jobs: {key: {venue: future}}, futures resolve to a px or None
+    :param results: {key: {venue: px}} updated in place with the venues that answered in time
+    """
+    deadline = time.monotonic() + timeout
+    pending = {f: (k, venue) for k, venues in jobs.items() for venue, f in venues.items()}
+    n_pending = {k: len(venues) for k, venues in jobs.items()}
+    open_keys = {k for k, n in n_pending.items() if n}
+
+    while open_keys:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for f in done:
+            key, venue = pending.pop(f)
+            n_pending[key] -= 1
+            try:
+                px = f.result()
+            except Exception:
+                px = None
+            if px is not None and key in open_keys:
+                results[key][venue] = px
+            if key in open_keys and _is_settled(results[key], n_pending[key], policy, quorum):
+                open_keys.discard(key)
+                # answers of a settled key are not used, drop its queries still queued
+                for other, (k, _) in list(pending.items()):
+                    if k == key and other.cancel():
+                        pending.pop(other)
+
+    # past the deadline, queued queries never run, running ones finish in the pool and are ignored
+    for f in pending:
+        f.cancel()
+    return results
+
+
+def get_weighted_spot_pxs(bases, quote, exchanges=['Coinbase', 'Binance', 'Bitfinex'], policy='mean', quorum=2,
+                          timeout=SPOT_VENUE_TIMEOUT_S, logging=False):
+    """
+    {base: weighted px} for many bases, every (base, venue) query in flight at once
+
+    :param policy: 'mean' of every venue answering within timeout, 'first' answer,
+        'quorum' mean of the first [[quorum]] answers, 'median' with outliers (SPOT_MAX_DEVIATION_PCT) dropped
+    :param timeout: seconds for the whole fan-out, one deadline shared by every (base, venue) call,
+        venues that have not answered by then are left out
+    bases without any price are missing from the result
+    """
+    if policy not in SPOT_POLICIES:
+        raise ValueError(f'policy must be one of {SPOT_POLICIES}')
+    funcs = {k: v for k, v in SPOT_FUNCS.items() if k in exchanges}
+
+    base_2_pxs = {b: {} for b in bases}
+    # Check Cache
+    if get_cache():
+        for base in bases:
+            pxs, venues = get_cached_weighted_spot_px(base, quote, exchanges, break_at_first=(policy == 'first'))
+            base_2_pxs[base] = dict(zip(venues, pxs))
+
+    jobs = {}
+    for base, venue_2_px in base_2_pxs.items():
+        # venues with a cached price are not queried again
+        venues = [v for v in funcs if v not in venue_2_px]
+        if _is_settled(venue_2_px, len(venues), policy, quorum):
+            continue
+        jobs[base] = {venue: SPOT_POOL.submit(funcs[venue], base=base, quote=quote) for venue in venues}
+    _collect_spot(jobs, policy, quorum, timeout, base_2_pxs)
+
+    out = {}
+    for base, venue_2_px in base_2_pxs.items():
+        if logging:
+            utils.logger.debug(f'Spot {base}-{quote} by venue: \t{venue_2_px}')
+        if not venue_2_px:
+            continue
+        pxs = list(venue_2_px.values())
+        if policy == 'quorum':
+            pxs = pxs[:quorum]
+        elif policy == 'first':
+            pxs = pxs[:1]
+        out[base] = _aggregate_spot(pxs, policy)
+        if logging:
+            utils.logger.debug(f'Weighted {base}-{quote} spot px is {out[base]}')
+    return out
+
+
+def get_weighted_spot_px(base, quote, exchanges=['Coinbase', 'Binance', 'Bitfinex'], logging=False, break_at_first=False,
+                         policy=None, quorum=2, timeout=SPOT_VENUE_TIMEOUT_S):
+    """
+    venues are queried concurrently, see get_weighted_spot_pxs for policies,
+    break_at_first=True is the 'first' policy
+    """
+    policy = policy or ('first' if break_at_first else 'mean')
+    pxs = get_weighted_spot_pxs([base], quote, exchanges=exchanges, policy=policy, quorum=quorum,
+                                timeout=timeout, logging=logging)
+    if base not in pxs:
         raise ValueError(f'did not find {base + quote} in {exchanges}')
+    return pxs[base]
+
 
-    weighted_px = sum(pxs) / len(pxs)
-    if logging:
-        utils.logger.debug(f'Weighted {base}-{quote} spot px is {weighted_px}')
-    return weighted_px
+def fetch_ohlc(exch, base, quote, freq, start=None, end=None):
+    """
+    OhlcStore fetch, candles of one exchange between start / end (unix seconds), always from the
+    exchange, the klines cache would hand back a 6h old page and freeze the open candle
+    """
+    return MarketDataGateway(exch, base, quote, freq=freq, start=start, end=end, use_cache=False).get_data()
 
 
-def get_ohlc(base, quote, freq='1D', read_csv=False):
+def get_ohlc_store():
+    """
+    process wide local OHLCV history, only new candles are fetched
+    """
+    global _OHLC_STORE
+    if _OHLC_STORE is None:
+        with _LAZY_LOCK:
+            if _OHLC_STORE is None:
+                _OHLC_STORE = ohlc_store.OhlcStore(fetch=fetch_ohlc)
+    return _OHLC_STORE
+
+
+def get_ohlc(base, quote, freq='1D', start=None, end=None, read_csv=False):
+    """
+    start / end (unix seconds), a start older than the stored history is backfilled from the exchange
+    """
     # if read_csv:
     #    return pd.read_csv(f'data/cache/ohlc/{symb}.csv', index_col=0)
 
     exchanges = ['BINANCE', 'COINBASE', 'KRAKEN', 'COINGECKO']
     for e in exchanges:
-        lst = MarketDataGateway(e, base, quote, freq=freq).get_data()
-        if lst:
+        try:
+            arr = get_ohlc_store().get(e, base, quote, freq, start=start, end=end)
+        except Exception as ex:
+            utils.logger.error(f'failed to load {e} {base}{quote} ohlc|e={ex}')
+            continue
+        if len(arr):
             # utils.logger.debug(f'using {e} for {symb} ohlc data')
-            ohlc = mk_data(lst)[['open', 'high', 'low', 'close']]
+            ohlc = mk_data(arr)[['open', 'high', 'low', 'close']]
             ohlc.sort_index(inplace=True)
             if len(ohlc) >= 30:         # need 30d of data
                 return ohlc
@@ -207,13 +476,15 @@ def get_ohlc(base, quote, freq='1D', read_csv=False):
 
 
 def _get_cached_exchange_ticker_price(exchange, pair):
-    if not CACHE:
+    if not get_cache():
         return {"error": "cache not available"}
-    ticker_data = CACHE.hgetall(f"ticker:{exchange}")
+    ticker_data = get_cache().hgetall(cache.ticker_key(exchange))
+    if not ticker_data:
+        return {"error": "no ticker data"}
     timestamp = float(ticker_data.get("timestamp", 0))
     if datetime.now().timestamp() - timestamp > ACCEPTABLE_TICKER_TIME_DELAY:
         return {"error": "stale price"}
-    price_data = json.loads(ticker_data.get("raw", {}))
+    price_data = json.loads(ticker_data.get("raw", "{}"))
     if pair not in price_data:
         return {"error": "pair not in exchange"}
     pair_price = price_data.get(pair, {}).get("price", None)
@@ -256,13 +527,13 @@ note: Binance - USDT margind perps
 def get_market_bin(is_spot=True):
     if is_spot:
         symbs = []
-        j = requests.get('https://api.binance.com/api/v3/exchangeInfo').json()
+        j = SESSIONS.get('https://api.binance.com/api/v3/exchangeInfo').json()
         for i in j['symbols']:
             if i['status'] == 'TRADING' and i['quoteAsset'] == 'USDT' and i['isSpotTradingAllowed']:
                 symbs.append(i['baseAsset'])
         return symbs
     else:
-        j = requests.get("https://testnet.binancefuture.com/fapi/v1/exchangeInfo").json()
+        j = SESSIONS.get("https://testnet.binancefuture.com/fapi/v1/exchangeInfo").json()
         symbs = []
         for i in j['symbols']:
             if i['contractType'] == 'PERPETUAL' and i['status'] == 'TRADING':
@@ -273,7 +544,7 @@ def get_market_bin(is_spot=True):
 def get_market_cbs(is_spot=True):
     if is_spot:
         symbs = []
-        j = requests.get('https://api.exchange.coinbase.com/currencies').json()
+        j = SESSIONS.get('https://api.exchange.coinbase.com/currencies').json()
         for i in j:
             if i['status'] == 'online':
                 symbs.append(i['id'])
@@ -283,7 +554,7 @@ def get_market_cbs(is_spot=True):
 def get_market_ftx(is_spot=True):
     if is_spot:
         symbs = []
-        j = requests.get('https://ftx.com/api/markets').json()
+        j = SESSIONS.get('https://ftx.com/api/markets').json()
         if j['success']:
             for i in j['result']:
                 if i['enabled'] and i['type'] == 'spot' and i['quoteCurrency'] == 'USD':
@@ -291,7 +562,7 @@ def get_market_ftx(is_spot=True):
         return symbs
     else:
         symbs = []
-        j = requests.get('https://ftx.com/api/markets').json()
+        j = SESSIONS.get('https://ftx.com/api/markets').json()
         if j['success']:
             for i in j['result']:
                 if i['enabled'] and i['type'] == 'future' and i['name'].endswith('PERP'):
@@ -350,35 +621,60 @@ df = mk_data(MarketDataGateway("BITFINEX", "BTC", "USD").get_data())
 """
 
 
+def normalise_candles(exch, rows):
+    """
+    raw exchange candles -> ohlc_store.OHLCV_DTYPE array (ts unix seconds, ascending), one vectorised pass
+    """
+    columns, ts_divisor = EXCHANGE_CANDLE_COLUMNS[exch]
+    return ohlc_store.to_ohlcv_array(rows, columns=columns, ts_divisor=ts_divisor)
+
+
 def mk_data(lst):
     """
-    Accepts standardized list of lists of unix timestamp (int) + OHLCV
+    Accepts OHLCV_DTYPE array or standardized list of lists of unix timestamp (int) + OHLCV
+
+    returns;
+        float DataFrame open/high/low/close/volume on a DatetimeIndex (datetime64[ns], UTC naive)
     """
-    df = pd.DataFrame(lst)
-    df.set_index(0, inplace=True)
-    df.index = [datetime.utcfromtimestamp(i).strftime('%Y-%m-%d %H:%M:%S') for i in df.index]
-    df.sort_index(inplace=True)
-    df.columns = ('open', 'high', 'low', 'close', 'volume')
-    return df.astype(float)
+    arr = ohlc_store.to_ohlcv_array(lst)
+    index = pd.DatetimeIndex(pd.to_datetime(arr['ts'] * 1_000_000_000))
+    return pd.DataFrame({c: arr[c] for c in ('open', 'high', 'low', 'close', 'volume')}, index=index)
 
 
 def _get_cached_klines(exchange_name, base, quote, freq):
-    return CACHE.get(f"options:klines:{exchange_name}:{base}:{quote}:{freq}")
+    return get_cache().get(cache.klines_key(exchange_name, base, quote, freq))
+
+
+def make_ticker_publisher(bases, quote="USD", cache_=None):
+    """
+    CachePublisher keeping ticker:Binance (every symbol, one bulk request) and ticker:Coinbase (bases) fresh
+
+    make_ticker_publisher(['BTC', 'ETH']).start(interval=5)
+    """
+    return cache.CachePublisher(cache_ or get_cache(), {
+        'Binance': lambda: dict(get_ticker_cache('BINANCE').refresh()),
+        'Coinbase': lambda: {f"{b}{quote}": get_px_cbs(b, quote) for b in bases},
+    })
 
 
 class MarketDataGateway:
 
-    def __init__(self, exch, base, quote, freq='1D'):
+    def __init__(self, exch, base, quote, freq='1D', start=None, end=None, use_cache=True):
         """
         exch :: exchange to get data from
         base :: base of asset, ie BTC in BTC-USD
         quote :: quote of asset, ie USD in BTC-USD
         freq :: frequency of data, '1m', '5m', '30m' and '1D'
+        start / end :: unix seconds of the candle range, None for the exchange default (latest page)
+        use_cache :: False skips the cached klines (default 1D window only)
         """
         self.exch = exch
         self.base = base
         self.quote = quote
         self.freq = freq
+        self.start = start
+        self.end = end
+        self.use_cache = use_cache
         self._mk_symb()
         self._mk_url()
 
@@ -397,6 +693,8 @@ class MarketDataGateway:
                 symb_tmp = self.symb.replace(self.base, symb_api)
 
         ext = API_OHLC[self.exch](symb_tmp, native_freq)
+        if self.exch in API_OHLC_RANGE:
+            ext += API_OHLC_RANGE[self.exch](self.start, self.end, native_freq)
         self.url = os.path.join(base, ext)
 
     # separate into 2 functions
@@ -405,19 +703,18 @@ class MarketDataGateway:
         if self.exch == "COINGECKO":
             try:
                 base = API_BASE[self.exch]
-                coin_list = requests.get(base + '/coins/list').json()
-                symbol_id = None
-                for coin_dict in coin_list:
-                    if self.base.lower() == coin_dict.get('symbol', '').lower():
-                        symbol_id = coin_dict.get('id')
-                        break
+                # shared persisted symbol -> id index, no /coins/list download per call
+                symbol_id = COINGECKO_INDEX.get_id(self.base)
+                if symbol_id is None:
+                    utils.logger.debug(f'no {self.exch} coin id for {self.base}')
+                    return []
                 ext = API_OHLC[self.exch](symbol_id, "")  # Coingecko OHLC url requires symbol id only
                 self.url = os.path.join(base, ext)
             except Exception as e:
                 utils.logger.error(f'failed to process {self.exch} symbol {self.base}|e={e}')
                 return []
 
-        r = requests.get(self.url).json()   # add logging
+        r = SESSIONS.get(self.url).json()   # add logging
 
         if self.exch == 'BINANCE':
             # logging >>> object.__dict__
@@ -448,28 +745,23 @@ class MarketDataGateway:
 
     def _make_dataframe(self, lst):
         """
-        Accepts standardized list of lists of unix timestamp (int) + OHLCV
+        Accepts OHLCV_DTYPE array or standardized list of lists of unix timestamp (int) + OHLCV
         """
-        df = pd.DataFrame(lst)
-        df.set_index(0, inplace=True)
-        df.index = [datetime.utcfromtimestamp(i).strftime('%Y-%m-%d %H:%M:%S') for i in df.index]
-        df.sort_index(inplace=True)
-        df.columns = ('open', 'high', 'low', 'close', 'volume')
-        return df.astype(float)
-
-    def get_data(self) -> list:
-        # Return timestamp, open, high, low, close, volume
-
-        # Check cache
-        if CACHE and self.freq == "1D":
+        return mk_data(lst)
+
+    def get_data(self):
+        # Return ohlc_store.OHLCV_DTYPE array of timestamp, open, high, low, close, volume (empty if no data)
+
+        # Check cache (default window only)
+        is_default_window = self.use_cache and self.start is None and self.end is None
+        if get_cache() and self.freq == "1D" and is_default_window:
             cached_out = []
+            exchange_name = self.exch.lower().capitalize()
             try:
-                exchange_name = self.exch.lower().capitalize()
-                cached_out = json.loads(_get_cached_klines(exchange_name, self.base, self.quote, self.freq))
+                cached_raw = _get_cached_klines(exchange_name, self.base, self.quote, self.freq)
+                cached_out = json.loads(cached_raw) if cached_raw is not None else []
                 if cached_out:
-                    # json.loads/dumps do not convert list to tuple and vice versa, so convert here to keep datatype format consistent
-                    cached_out = [tuple(p) for p in cached_out]
-                    return cached_out
+                    return ohlc_store.to_ohlcv_array(cached_out)
             except Exception as e:
                 utils.logger.error(f"failed to get data from cache|keyparams=({exchange_name},{self.base},{self.quote},{self.freq})|e={e}")
 
@@ -477,41 +769,33 @@ class MarketDataGateway:
         if not j:
             # logging.info(f'no data for {self.__dict__}')
             utils.logger.debug(f'no data for {self.__dict__}')
-            return []
-
-        if self.exch == 'BINANCE':
-            out = [(i[0] / 1000, i[1], i[2], i[3], i[4], i[5]) for i in j]
-
-        elif self.exch == 'BITFINEX':
-            # returns time, open, close high low volume
-            out = [(i[0] / 1000, i[1], i[3], i[4], i[2], i[5]) for i in j]
-
-        elif self.exch == 'COINGECKO':
-            # returns time, open, high, low, close
-            out = [(i[0] / 1000, i[1], i[2], i[3], i[4], 0.) for i in j]
+            return ohlc_store.to_ohlcv_array([])
 
-        elif self.exch == 'COINBASE':
-            # returns time, 'low','high','open','close','volume'
-            out = [(i[0], i[3], i[2], i[1], i[4], i[5]) for i in j]
-
-        elif self.exch == 'FTX':
-            out = [(i['time'] / 1000, i['open'], i['high'],
-                    i['low'], i['close'], i['volume']) for i in j['result']]
+        if self.exch == 'FTX':
+            j = [(i['time'], i['open'], i['high'], i['low'], i['close'], i['volume']) for i in j['result']]
 
         elif self.exch == 'KRAKEN':
             # returns different key, ie 'XXBTZUSD' for 'BTCUSD'
             j = j['result']
             j.pop('last')
             j = j[list(j.keys())[0]]
-            # [time, open, high, low, closes, vwap, volume, count]
-            out = [(i[0], i[1], i[2], i[3], i[4], i[6]) for i in j]
 
-        else:
+        elif self.exch not in EXCHANGE_CANDLE_COLUMNS:
             raise ValueError()
 
+        out = normalise_candles(self.exch, j)
+
+        # write through so the next lookup is served from cache
+        if get_cache() and self.freq == "1D" and is_default_window and len(out):
+            try:
+                cache.CachePublisher(get_cache()).publish_klines(
+                    self.exch.lower().capitalize(), self.base, self.quote, self.freq, out.tolist())
+            except Exception as e:
+                utils.logger.error(f"failed to write klines to cache|e={e}")
+
         return out
 
     def make_data(self):
         lst = self.get_data()
-        if lst:
+        if len(lst):
             return self._make_dataframe(lst)
@@ -0,0 +1,232 @@
+"""
+Local OHLCV store, one append-only memory-mapped NumPy file per (exchange, base, quote, freq)
+
+only candles newer than the last stored one are fetched, history beyond an exchange's
+page limit is backfilled page by page, reads are served from disk
+
+store = OhlcStore(fetch=fetch_ohlc)      # fetch(exch, base, quote, freq, start, end) -> [(ts, o, h, l, c, v)]
+store.get('BINANCE', 'BTC', 'USDT', '1D')  # structured array, ts ascending
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+OHLC_STORE_DIR = os.environ.get('OHLC_STORE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'defi_public', 'ohlc'))
+
+OHLCV_DTYPE = np.dtype([
+    ('ts', '<i8'),   # candle open, unix seconds
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+FREQ_2_SECONDS = {'1m': 60, '5m': 300, '30m': 1800, '1D': 86400}
+
+# candles per request
+EXCHANGE_PAGE_LIMIT = {
+    'BINANCE': 1000,
+    'BITFINEX': 10000,
+    'COINBASE': 300,
+    'KRAKEN': 720,
+    'COINGECKO': 365,
+}
+
+MAX_BACKFILL_PAGES = 20
+OPEN_CANDLE_REFRESH_S = 60   # the still open last candle is refetched at most this often
+
+
+def to_ohlcv_array(rows, columns=(0, 1, 2, 3, 4, 5), ts_divisor=1):
+    """
+    raw candles -> OHLCV_DTYPE array sorted by ts, last duplicate wins, one vectorised pass
+
+    :param rows: list of lists / 2d array, numbers or numeric strings
+    :param columns: column of ts, open, high, low, close, volume in rows, volume None when missing
+    :param ts_divisor: 1000 for millisecond timestamps
+    """
+    if isinstance(rows, np.ndarray) and rows.dtype == OHLCV_DTYPE:
+        out = rows
+    else:
+        raw = np.asarray(rows, dtype=float)
+        if raw.ndim != 2 or not len(raw):
+            return np.empty(0, dtype=OHLCV_DTYPE)
+        out = np.empty(len(raw), dtype=OHLCV_DTYPE)
+        out['ts'] = raw[:, columns[0]] // ts_divisor
+        for name, col in zip(OHLCV_DTYPE.names[1:], columns[1:]):
+            out[name] = raw[:, col] if col is not None else 0.
+    if not len(out):
+        return out
+    # stable sort then keep the last row of each ts
+    out = out[np.argsort(out['ts'], kind='stable')]
+    keep = np.append(out['ts'][1:] != out['ts'][:-1], True)
+    return out[keep]
+
+
+class OhlcStore:
+
+    def __init__(self, path=OHLC_STORE_DIR, fetch=None, page_limits=EXCHANGE_PAGE_LIMIT, open_candle_refresh=OPEN_CANDLE_REFRESH_S):
+        """
+        :param fetch: fetch(exch, base, quote, freq, start, end) -> rows, start / end unix seconds or None
+        :param open_candle_refresh: seconds the stored values of a still open candle are served before a refetch
+        """
+        self.path = path
+        self.fetch = fetch
+        self.page_limits = dict(page_limits)
+        self.open_candle_refresh = open_candle_refresh
+        self._updated_at = {}   # file -> last update, in memory, a new process refetches the open candle once
+        self._history_start = {}  # file -> oldest ts once backfill found nothing older, in memory
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _file(self, exch, base, quote, freq):
+        return os.path.join(self.path, f'{exch}_{base}_{quote}_{freq}.bin')
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    ################################# disk
+
+    def read(self, exch, base, quote, freq, start=None, end=None):
+        """
+        stored candles with start <= ts <= end, memory-mapped (read only view)
+        """
+        f = self._file(exch, base, quote, freq)
+        if not os.path.exists(f) or os.path.getsize(f) < OHLCV_DTYPE.itemsize:
+            return np.empty(0, dtype=OHLCV_DTYPE)
+        arr = np.memmap(f, dtype=OHLCV_DTYPE, mode='r', shape=(os.path.getsize(f) // OHLCV_DTYPE.itemsize,))
+        lo = 0 if start is None else np.searchsorted(arr['ts'], start, side='left')
+        hi = len(arr) if end is None else np.searchsorted(arr['ts'], end, side='right')
+        return arr[lo:hi]
+
+    def last_ts(self, exch, base, quote, freq):
+        arr = self.read(exch, base, quote, freq)
+        return int(arr['ts'][-1]) if len(arr) else None
+
+    def write(self, exch, base, quote, freq, rows):
+        """
+        merge candles in, newer ones are appended in place, anything older than
+        the last stored candle rewrites the file (atomic replace)
+
+        returns;
+            number of new candles
+        """
+        new = to_ohlcv_array(rows)
+        if not len(new):
+            return 0
+        f = self._file(exch, base, quote, freq)
+        os.makedirs(self.path, exist_ok=True)  # on first write, not on import
+        with self._key_lock(f):
+            old = self.read(exch, base, quote, freq)
+            if not len(old) or new['ts'][0] > old['ts'][-1]:
+                with open(f, 'ab') as fh:
+                    fh.write(new.tobytes())
+                return len(new)
+
+            if new['ts'][0] == old['ts'][-1]:
+                # refresh of the last (still open) candle plus newer ones, overwrite it in place
+                with open(f, 'r+b') as fh:
+                    fh.seek((len(old) - 1) * OHLCV_DTYPE.itemsize)
+                    fh.write(new.tobytes())
+                return len(new) - 1
+
+            merged = to_ohlcv_array(np.concatenate([np.array(old), new]))
+            tmp = f + '.tmp'
+            with open(tmp, 'wb') as fh:
+                fh.write(merged.tobytes())
+            os.replace(tmp, f)
+            return len(merged) - len(old)
+
+    def delete(self, exch, base, quote, freq):
+        f = self._file(exch, base, quote, freq)
+        if os.path.exists(f):
+            os.remove(f)
+
+    ################################# network
+
+    def update(self, exch, base, quote, freq, max_pages=MAX_BACKFILL_PAGES):
+        """
+        fetch only candles from the last stored one onwards (first call fetches the default page),
+        keeps paging forward while pages come back full
+        """
+        added = 0
+        self._updated_at[self._file(exch, base, quote, freq)] = time.time()
+        for _ in range(max_pages):
+            last = self.last_ts(exch, base, quote, freq)
+            rows = self.fetch(exch, base, quote, freq, last, None)
+            n = self.write(exch, base, quote, freq, rows)
+            added += n
+            if last is None or not n or len(rows) < self.page_limits.get(exch, 1000):
+                break
+        return added
+
+    def backfill(self, exch, base, quote, freq, until=None, max_pages=MAX_BACKFILL_PAGES):
+        """
+        page backwards from the oldest stored candle
+
+        :param until: unix seconds to stop at, None walks back until the exchange has no more data
+        """
+        step = FREQ_2_SECONDS[freq] * self.page_limits.get(exch, 1000)
+        added = 0
+        for _ in range(max_pages):
+            stored = self.read(exch, base, quote, freq)
+            if not len(stored):
+                n = self.update(exch, base, quote, freq)
+                if not n:
+                    break
+                added += n
+                continue
+            first = int(stored['ts'][0])
+            if until is not None and first <= until:
+                break
+            end = first - FREQ_2_SECONDS[freq]
+            rows = self.fetch(exch, base, quote, freq, end - step + FREQ_2_SECONDS[freq], end)
+            page = to_ohlcv_array(rows)
+            page = page[page['ts'] < first] if len(page) else page
+            if not len(page):
+                self._history_start[self._file(exch, base, quote, freq)] = first
+                break  # nothing older (or the exchange ignores ranges)
+            added += self.write(exch, base, quote, freq, page)
+        return added
+
+    def is_stale(self, exch, base, quote, freq, now=None):
+        """
+        True when the last stored candle has closed (new ones to fetch), or is still open
+        and was last fetched more than open_candle_refresh ago (its values keep moving)
+        """
+        last = self.last_ts(exch, base, quote, freq)
+        if last is None:
+            return True
+        now = now or time.time()
+        freq_s = FREQ_2_SECONDS[freq]
+        if now - last >= freq_s:
+            return True
+        updated_at = self._updated_at.get(self._file(exch, base, quote, freq), 0)
+        return now - updated_at >= min(self.open_candle_refresh, freq_s)
+
+    def needs_backfill(self, exch, base, quote, freq, start):
+        """
+        True when start is older than the first stored candle and the exchange was not found to end there
+        """
+        stored = self.read(exch, base, quote, freq)
+        if not len(stored):
+            return False
+        first = int(stored['ts'][0])
+        return start < first and self._history_start.get(self._file(exch, base, quote, freq)) != first
+
+    def get(self, exch, base, quote, freq, start=None, end=None, refresh=True):
+        """
+        candles from disk, fetching the new ones first when the last stored candle has closed,
+        the open one is refetched (overwritten in place) every open_candle_refresh, a start
+        before the first stored candle backfills history down to it
+        """
+        if refresh and self.fetch is not None:
+            if self.is_stale(exch, base, quote, freq):
+                self.update(exch, base, quote, freq)
+            if start is not None and self.needs_backfill(exch, base, quote, freq, start):
+                self.backfill(exch, base, quote, freq, until=start)
+        return self.read(exch, base, quote, freq, start, end)
@@ -0,0 +1,252 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger('price_risk')
+
+
+def _changed(old, new):
+    """
+    best effort output comparison, anything we can't compare counts as changed
+    """
+    if old is new:
+        return False
+    try:
+        if hasattr(old, 'equals'):  # pandas
+            return not old.equals(new)
+        return bool(old != new)
+    except Exception:
+        return True
+
+
+class Stage:
+
+    def __init__(self, name, func, deps=(), refresh_interval=0., min_interval=None):
+        """
+        :param name: stage name, dependents receive its output as a kwarg of that name
+        :param func: called as func(**{dep: output of dep})
+        :param deps: names of stages this stage reads
+        :param refresh_interval: seconds the output stays fresh, None only recomputes when a dep changes
+        :param min_interval: seconds between two runs even if deps change (stages with side effects, ie alerts / orders)
+        """
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.refresh_interval = refresh_interval
+        self.min_interval = min_interval
+
+        self.output = None
+        self.version = 0            # bumped every time the output changes
+        self.dep_versions = {}      # versions of deps the output was computed from
+        self.computed_at = None
+        self.duration = None        # seconds of the last run
+        self.runs = 0
+        self.error = None
+        self.future = None          # in flight run, a timed out run may outlive its tick
+
+    @property
+    def has_output(self):
+        return self.computed_at is not None
+
+    def is_stale(self, dep_versions, now):
+        if not self.has_output:
+            return True
+        if self.min_interval is not None and now - self.computed_at < self.min_interval:
+            return False
+        if any(dep_versions[d] != self.dep_versions.get(d) for d in self.deps):
+            return True
+        return self.refresh_interval is not None and now - self.computed_at >= self.refresh_interval
+
+    def compute(self, inputs):
+        """
+        runs func, safe to call from a worker thread (does not touch stage state)
+
+        returns;
+            output, seconds taken
+        """
+        start = time.monotonic()
+        output = self.func(**inputs)
+        return output, time.monotonic() - start
+
+    def commit(self, output, duration, dep_versions):
+        self.duration = duration
+        self.runs += 1
+        if not self.has_output or _changed(self.output, output):
+            self.version += 1
+        self.output = output
+        self.dep_versions = dict(dep_versions)
+        self.computed_at = time.time()
+        self.error = None
+
+    def __repr__(self):
+        return f"Stage({self.name}, deps={self.deps}, refresh_interval={self.refresh_interval}, version={self.version})"
+
+
+class PortfolioEngine:
+    """
+    Long running portfolio pipeline of named stages with declared dependencies
+
+    every stage caches its output, a tick only reruns stages whose refresh interval
+    expired or whose inputs changed since they last ran
+
+    independent stages run concurrently on a thread pool, a stage starts as soon as
+    all of its deps are settled for the tick, so a tick takes as long as the slowest
+    chain of dependent stages rather than the sum of all stages
+
+    engine = PortfolioEngine(max_workers=8, tick_timeout=60)
+    engine.add_stage('spot_prices', load_spot_prices, refresh_interval=10)
+    engine.add_stage('equity', calc_equity, deps=['spot_prices'], refresh_interval=None)
+    engine.tick()
+    """
+
+    def __init__(self, max_workers=1, tick_timeout=None):
+        """
+        :param max_workers: threads running stages, 1 runs them one after another
+        :param tick_timeout: seconds before a tick gives up on unfinished stages, they keep their previous output
+        """
+        self.stages = {}  # insertion order is a topological order, see add_stage
+        self.max_workers = max_workers
+        self.tick_timeout = tick_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stage')
+        self.tick_duration = None
+
+    def add_stage(self, name, func, deps=(), refresh_interval=0., min_interval=None):
+        if name in self.stages:
+            raise ValueError(f'stage {name} already added')
+        missing = [d for d in deps if d not in self.stages]
+        if missing:
+            raise ValueError(f'stage {name} depends on unknown stages {missing}, add them first')
+        stage = self.stages[name] = Stage(name, func, deps, refresh_interval, min_interval)
+        return stage
+
+    def stage(self, name, deps=(), refresh_interval=0., min_interval=None):
+        """
+        decorator version of add_stage
+        """
+        def decorator(func):
+            self.add_stage(name, func, deps, refresh_interval, min_interval)
+            return func
+        return decorator
+
+    def _versions(self):
+        return {name: stage.version for name, stage in self.stages.items()}
+
+    def tick(self, timeout=None):
+        """
+        :param timeout: overrides tick_timeout
+
+        returns;
+            names of the stages recomputed this tick
+        """
+        timeout = self.tick_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+
+        settled = {}   # name -> 'ok' (fresh output, ran or cached) / 'failed'
+        running = {}   # future -> (stage, dep versions it was started with)
+        ran = []
+        waiting = list(self.stages.values())
+
+        while waiting or running:
+            # start every stage whose deps are settled
+            for stage in list(waiting):
+                if not all(d in settled for d in stage.deps):
+                    continue
+                waiting.remove(stage)
+                if any(settled[d] != 'ok' or not self.stages[d].has_output for d in stage.deps):
+                    settled[stage.name] = 'failed'
+                    continue
+                versions = self._versions()
+                if stage.future is not None and not stage.future.done():
+                    # still busy from a timed out tick
+                    settled[stage.name] = 'failed'
+                    continue
+                if not stage.is_stale(versions, time.time()):
+                    settled[stage.name] = 'ok'
+                    continue
+                inputs = {d: self.stages[d].output for d in stage.deps}
+                stage.future = self._executor.submit(stage.compute, inputs)
+                running[stage.future] = (stage, {d: versions[d] for d in stage.deps})
+
+            if not running:
+                if waiting:
+                    continue
+                break
+
+            remaining = None if deadline is None else max(0., deadline - time.monotonic())
+            done, _ = wait(running, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                # timed out, unfinished stages keep their previous output
+                for future, (stage, _) in running.items():
+                    future.cancel()
+                    stage.error = TimeoutError(f'stage {stage.name} exceeded tick timeout {timeout}s')
+                    logger.error(f"stage {stage.name} timed out")
+                break
+
+            for future in done:
+                stage, dep_versions = running.pop(future)
+                try:
+                    output, duration = future.result()
+                except Exception as e:
+                    stage.error = e
+                    settled[stage.name] = 'failed'
+                    logger.exception(f"stage {stage.name} failed|e={e}")
+                    continue
+                stage.commit(output, duration, dep_versions)
+                settled[stage.name] = 'ok'
+                ran.append(stage.name)
+
+        self.tick_duration = time.monotonic() - start
+        return ran
+
+    def get(self, name):
+        return self.stages[name].output
+
+    def invalidate(self, name=None):
+        """
+        force a stage (all stages if name is None) to rerun next tick
+        """
+        for stage in ([self.stages[name]] if name else self.stages.values()):
+            stage.computed_at = None
+
+    def timings(self):
+        """
+        {stage: seconds of its last run}
+        """
+        return {name: stage.duration for name, stage in self.stages.items()}
+
+    def report(self):
+        return {
+            name: {
+                'duration_s': stage.duration,
+                'computed_at': stage.computed_at,
+                'version': stage.version,
+                'runs': stage.runs,
+                'error': repr(stage.error) if stage.error else None,
+            }
+            for name, stage in self.stages.items()
+        }
+
+    def critical_path(self):
+        """
+        slowest chain of dependent stages by last run durations
+
+        returns;
+            [stage names], seconds
+        """
+        best = {}
+        for name, stage in self.stages.items():
+            prev = max((best[d] for d in stage.deps), key=lambda x: x[1], default=([], 0.))
+            best[name] = (prev[0] + [name], prev[1] + (stage.duration or 0.))
+        return max(best.values(), key=lambda x: x[1], default=([], 0.))
+
+    def run_forever(self, interval=10., on_tick=None):
+        """
+        tick every interval seconds, on_tick(engine, ran) called after each tick
+        """
+        while True:
+            start = time.monotonic()
+            ran = self.tick()
+            if on_tick is not None:
+                on_tick(self, ran)
+            time.sleep(max(0., interval - (time.monotonic() - start)))
@@ -2,13 +2,17 @@ import json
 import logging
 import os
 import sys
+import threading
 import time
 
-import requests
+import numpy as np
+import pandas as pd
 from web3 import Web3, HTTPProvider
 
 sys.path.append(os.path.join('/'.join(os.getcwd().split('/')[:-1]), 'contracts'))
+sys.path.append('/'.join(os.getcwd().split('/')[:-1])) # absolute path
 import contracts
+from api import SESSIONS
 from contracts import ADDRESS_BOOK
 
 logger = logging.getLogger('price_risk')
@@ -56,18 +60,153 @@ def map_native_2_wrapper(d):
         return out
 
 
+GLP_SNAPSHOT_TTL_S = 60  # max age of a snapshot, GMX api spot prices included
+GLP_BLOCK_CHECK_S = 5    # snapshots younger than this are reused without asking for the latest block
+
+# a snapshot is rebuilt once the chain moves to another bucket of blocks, not on every block
+# (Arbitrum makes ~4 blocks a second), ~20s of blocks per network
+NETWORK_2_BLOCK_BUCKET = {
+    "ARBI": 80,
+    "AVAX": 10,
+}
+
+# a lagging endpoint of the pool does not know the pinned block yet
+MISSING_BLOCK_ERRORS = ('header not found', 'unknown block', 'missing trie node')
+
+
+def is_missing_block_error(e):
+    msg = str(e).lower()
+    return any(m in msg for m in MISSING_BLOCK_ERRORS)
+
+
+class GlpSnapshot:
+    """
+    Pool wide GLP state (spot prices, GLP price, per token usdgAmounts) pinned to one block
+
+    shared by every GmxRisk of a network, see GlpSnapshot.get
+    """
+
+    _SNAPSHOTS = {}  # {network: GlpSnapshot}
+    _BUILD_LOCKS = {}  # {network: Lock}, held while a snapshot of the network is checked / rebuilt
+    _LOCK = threading.Lock()
+
+    def __init__(self, network, cmap, block_number):
+        self.network = network
+        self.cmap = cmap
+        self.block_number = block_number
+        self.fetched_at = self.checked_at = time.time()
+        self._load()
+
+    @property
+    def w3(self):
+        return self.cmap[self.network]['vault'].web3
+
+    def _load(self):
+        # GMX api prices are not block pinned, fetched once per snapshot
+        glp_price_request = SESSIONS.get(os.path.join(BASE_URL[self.network], "prices")).json()
+        add_2_token = {v.address: k for k, v in ADDRESS_BOOK[self.network].items()}
+        spot_prices = {add_2_token[k]: float(Web3.fromWei(int(v), unit='Tether')) for k, v in glp_price_request.items()}
+
+        # GLP price + every usdgAmounts in one multicall at the pinned block
+        vault = self.cmap[self.network]['vault']
+        mc = contracts.Multicall(self.w3)
+        mc.add('GLP', self.cmap[self.network]['glp_manager'].functions.getPrice(True))
+        for symb in GMX_TOKENS[self.network]:
+            mc.add(symb, vault.functions.usdgAmounts(ADDRESS_BOOK[self.network][symb.lower()].address))
+        out = self.call(mc)
+
+        # set all wrapped tokens = native
+        spot_prices = map_native_2_wrapper(spot_prices)
+        spot_prices["GLP"] = float(Web3.fromWei(out.pop('GLP'), unit="Tether"))
+        self.spot_prices = {k.upper(): v for k, v in spot_prices.items()}
+
+        self.symb_2_glp_usd_risk = {k: float(Web3.fromWei(v, unit="ether")) for k, v in out.items()}
+        glp_total_usd = sum(self.symb_2_glp_usd_risk.values())
+        self.symb_2_glp_pct_risk = {k: v / glp_total_usd for k, v in self.symb_2_glp_usd_risk.items()}
+
+    def call(self, fn):
+        """
+        fn.call at the snapshot block (Multicall or contract function), the pool can route
+        the read to an endpoint lagging behind the one that gave the block number, that
+        read is retried at 'latest'
+        """
+        try:
+            return fn.call(block_identifier=self.block_number)
+        except Exception as e:
+            if not is_missing_block_error(e):
+                raise
+            logger.warning(f"{self.network} block {self.block_number} unknown to the endpoint, reading latest|e={e}")
+            return fn.call(block_identifier='latest')
+
+    @classmethod
+    def _cached(cls, network, ttl, block_check):
+        # snapshot still trusted without any request, None otherwise
+        with cls._LOCK:
+            snapshot = cls._SNAPSHOTS.get(network)
+        now = time.time()
+        if snapshot is None or now - snapshot.fetched_at > ttl or now - snapshot.checked_at > block_check:
+            return None
+        return snapshot
+
+    @classmethod
+    def get(cls, network, cmap, ttl=GLP_SNAPSHOT_TTL_S, block_check=GLP_BLOCK_CHECK_S):
+        """
+        cached snapshot of network, rebuilt when the chain moves to a new block bucket
+        (NETWORK_2_BLOCK_BUCKET) or it is older than ttl
+
+        :param block_check: seconds a snapshot is trusted before checking for a new block
+        """
+        snapshot = cls._cached(network, ttl, block_check)
+        if snapshot is not None:
+            return snapshot
+
+        # network calls outside the class lock, only callers of the same network wait for them
+        with cls._LOCK:
+            build_lock = cls._BUILD_LOCKS.setdefault(network, threading.Lock())
+        with build_lock:
+            snapshot = cls._cached(network, ttl, block_check)
+            if snapshot is not None:
+                return snapshot  # checked / rebuilt by another caller meanwhile
+
+            with cls._LOCK:
+                snapshot = cls._SNAPSHOTS.get(network)
+            block_number = cmap[network]['vault'].web3.eth.block_number
+            bucket = NETWORK_2_BLOCK_BUCKET.get(network, 1)
+            if (
+                snapshot is not None and time.time() - snapshot.fetched_at <= ttl
+                and block_number // bucket == snapshot.block_number // bucket
+            ):
+                snapshot.checked_at = time.time()
+                return snapshot
+
+            snapshot = cls(network, cmap, block_number)
+            with cls._LOCK:
+                cls._SNAPSHOTS[network] = snapshot
+            return snapshot
+
+    @classmethod
+    def invalidate(cls, network=None):
+        with cls._LOCK:
+            if network is None:
+                cls._SNAPSHOTS.clear()
+            else:
+                cls._SNAPSHOTS.pop(network, None)
+
+
 class GmxRisk:
 
     CONTRACTS_DEPLOYED = None # {"ARBI": {}, "AVAX": {}}
-    SYMBOL_2_GLP_USD_RISK = {"ARBI": {}, "AVAX": {}}
-    SYMBOL_2_GLP_PCT_RISK = {"ARBI": {}, "AVAX": {}}
 
-    def __init__(self, address, network, cmap, sleep=False, logging=True):
+    def __init__(self, address, network, cmap, sleep=False, logging=True, snapshot=None):
+        """
+        snapshot (optional), GlpSnapshot to read pool wide state from, defaults to GlpSnapshot.get
+        """
         self.address = address
         self.network = network
         self.cmap = cmap
         self.sleep = sleep
         self.logging = logging
+        self._snapshot = snapshot
 
         # urls based on network
         self.price_url = os.path.join(BASE_URL[self.network], "prices")
@@ -77,36 +216,19 @@ class GmxRisk:
         if self.logging:
             logger.info(f"Address: {self.address} --> {self.network} NETWORK")
 
-    def get_spot_prices(self):
-        glp_price_request = requests.get(self.price_url).json()
-        add_2_token = {v.address: k for k, v in ADDRESS_BOOK[self.network].items()}
-        spot_prices = {add_2_token[k]: float(Web3.fromWei(int(v), unit='Tether')) for k, v in glp_price_request.items()}
+    @property
+    def snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = GlpSnapshot.get(self.network, self.cmap)
+        return self._snapshot
 
-        # set all wrapped tokens = native
-        spot_prices = map_native_2_wrapper(spot_prices)
-
-        # GLP price
-        spot_prices["GLP"] = float(Web3.fromWei(
-            self.cmap[self.network]['glp_manager'].functions.getPrice(True).call(), unit="Tether"))
-        
-        spot_prices = {k.upper(): v for k, v in spot_prices.items()}
-
-        return spot_prices
+    def get_spot_prices(self):
+        # GMX api prices + GLP price, from the shared block pinned snapshot
+        return dict(self.snapshot.spot_prices)
 
     # get token GLP composition %
     def get_glp_token_composition_pct(self):
-        glp_total_usd = 0
-        for symb in GMX_TOKENS[self.network]:
-            if symb not in self.SYMBOL_2_GLP_USD_RISK[self.network]:
-                add = ADDRESS_BOOK[self.network][symb.lower()].address
-                symb_usd_risk = float(Web3.fromWei(
-                    self.cmap[self.network]['vault'].functions.usdgAmounts(add).call(), unit="ether"))
-                self.SYMBOL_2_GLP_USD_RISK[self.network][symb] = symb_usd_risk
-            else:
-                symb_usd_risk = self.SYMBOL_2_GLP_USD_RISK[self.network][symb]
-            glp_total_usd += symb_usd_risk
-
-        symbol_2_glp_pct_risk = {k: v / glp_total_usd for k, v in self.SYMBOL_2_GLP_USD_RISK[self.network].items()}
+        symbol_2_glp_pct_risk = dict(self.snapshot.symb_2_glp_pct_risk)
         if self.logging:
             logger.info(f"symbol_2_glp_pct_risk: {json.dumps(({k: round(v * 100, 2) for k, v in symbol_2_glp_pct_risk.items()}),indent=4)}")
 
@@ -120,13 +242,14 @@ class GmxRisk:
         returns;
             total GLP (staked + vested), staked GLP total, vested GLP total
         """        
-        # get staked GLP amount
-        staked_glp = float(Web3.fromWei(
-            self.cmap[self.network]['fsglp'].functions.balanceOf(self.address).call(), unit="ether"))
-
-        # get total vested GLP
-        vested_glp = float(Web3.fromWei(
-            self.cmap[self.network]['vglp'].functions.pairAmounts(self.address).call(), unit="ether"))
+        # staked GLP amount + total vested GLP in one round trip
+        # (at the snapshot block so it is consistent with the GLP price / composition)
+        mc = contracts.Multicall(self.cmap[self.network]['fsglp'].web3)\
+            .add('staked', self.cmap[self.network]['fsglp'].functions.balanceOf(self.address))\
+            .add('vested', self.cmap[self.network]['vglp'].functions.pairAmounts(self.address))
+        out = self.snapshot.call(mc)
+        staked_glp = float(Web3.fromWei(out['staked'], unit="ether"))
+        vested_glp = float(Web3.fromWei(out['vested'], unit="ether"))
 
         return staked_glp, vested_glp
 
@@ -135,10 +258,53 @@ class GmxRisk:
         #  (ETH for ARBI, AVAX for AVAX)
         pending_reward_native = {
             PENDING_REWARDS[self.network]: float(Web3.fromWei(
-                self.cmap[self.network]['fglp'].functions.claimable(self.address).call(), unit="ether"))
+                self.snapshot.call(self.cmap[self.network]['fglp'].functions.claimable(self.address)), unit="ether"))
         }
         return pending_reward_native
 
+    @classmethod
+    def for_addresses(cls, addresses, network, cmap, snapshot=None):
+        """
+        GLP risk of many addresses at once
+
+        pool wide state is read once (GlpSnapshot), staked / vested / claimable of every
+        address in one multicall at the snapshot block, risk computed as an outer product
+
+        returns;
+            glp_native_risk :: DataFrame, address x token native risk
+            glp_risk :: Series, address -> GLP (staked + vested)
+            glp_usd_risk :: Series, address -> GLP $ risk
+            pending_rewards :: DataFrame, address x pending reward token
+        """
+        addresses = list(addresses)
+        if snapshot is None:
+            snapshot = GlpSnapshot.get(network, cmap)
+
+        mc = contracts.Multicall(snapshot.w3)
+        for address in addresses:
+            mc.add(('staked', address), cmap[network]['fsglp'].functions.balanceOf(address))
+            mc.add(('vested', address), cmap[network]['vglp'].functions.pairAmounts(address))
+            mc.add(('claimable', address), cmap[network]['fglp'].functions.claimable(address))
+        out = snapshot.call(mc)
+
+        def to_units(name):
+            return np.array([out[(name, address)] for address in addresses], dtype=float) / 1e18
+
+        glp = to_units('staked') + to_units('vested')
+        glp_usd = glp * snapshot.spot_prices['GLP']
+
+        tokens = list(snapshot.symb_2_glp_pct_risk)
+        pct = np.array([snapshot.symb_2_glp_pct_risk[k] for k in tokens])
+        px = np.array([snapshot.spot_prices[k.upper()] for k in tokens])
+        native = np.outer(glp_usd, pct / px)
+
+        return {
+            'glp_native_risk': pd.DataFrame(native, index=addresses, columns=tokens),
+            'glp_risk': pd.Series(glp, index=addresses),
+            'glp_usd_risk': pd.Series(glp_usd, index=addresses),
+            'pending_rewards': pd.DataFrame({PENDING_REWARDS[network]: to_units('claimable')}, index=addresses),
+        }
+
     ###################### Trader risk bias
 
     def get_token_utilization_pct(self, symb):
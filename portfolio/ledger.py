@@ -0,0 +1,182 @@
+import threading
+
+import numpy as np
+
+from gmx_utils import WRAPPERS_2_NATIVE
+
+STABLECOINS = ('USDT', 'BUSD', 'USDC', 'DAI', 'FRAX', 'USD')
+
+
+class SymbolIndex:
+    """
+    Symbol -> row lookup with wrapper -> native mapping resolved once,
+    ie 'WBTC', 'WBTC.e', 'BTC.b' and 'BTC' all map to the BTC row
+
+    rows are only ever appended, so row numbers stay valid for the life of the index;
+    appends are locked, stages running concurrently share one index
+    """
+
+    def __init__(self, symbols=(), wrappers_2_native=WRAPPERS_2_NATIVE, stablecoins=STABLECOINS):
+        self.wrappers_2_native = dict(wrappers_2_native)
+        self.symbols = []       # native symbol of each row
+        self._rows = {}         # any alias (native or wrapper) -> row
+        self._stable_rows = set()
+        self.stablecoins = set(stablecoins)
+        self._lock = threading.Lock()
+        for symbol in symbols:
+            self.row(symbol)
+
+    def row(self, symbol):
+        try:
+            return self._rows[symbol]
+        except KeyError:
+            pass
+        native = self.wrappers_2_native.get(symbol, symbol)
+        with self._lock:
+            row = self._rows.get(native)
+            if row is None:
+                row = self._rows[native] = len(self.symbols)
+                self.symbols.append(native)
+                if native in self.stablecoins:
+                    self._stable_rows.add(row)
+            self._rows[symbol] = row
+        return row
+
+    def rows(self, symbols):
+        return np.fromiter((self.row(s) for s in symbols), dtype=np.intp)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def stable_mask(self, n=None):
+        """
+        boolean mask of stablecoin rows (first n rows)
+        """
+        n = len(self) if n is None else n
+        mask = np.zeros(n, dtype=bool)
+        with self._lock:
+            stable_rows = [r for r in self._stable_rows if r < n]
+        mask[stable_rows] = True
+        return mask
+
+    def price_vector(self, prices, n=None):
+        """
+        prices (dict, any alias) as a row aligned array, stablecoins default to 1, nan where unknown
+        """
+        n = len(self) if n is None else n
+        out = np.full(n, np.nan)
+        out[self.stable_mask(n)] = 1.
+        for symbol, px in prices.items():
+            row = self.row(symbol)
+            if row < n:
+                out[row] = px
+        return out
+
+
+class RiskLedger:
+    """
+    Native amounts per symbol (rows, see SymbolIndex) x source (columns) in one NumPy array
+
+    ledger = RiskLedger(index, ['bin_wallet', 'futs'])
+    ledger.add('futs', {'BTC': -1.5})
+    ledger.usd(spot_prices, sources=['futs'])
+    """
+
+    def __init__(self, index, sources):
+        self.index = index
+        self.sources = list(sources)
+        self._cols = {s: i for i, s in enumerate(self.sources)}
+        self.values = np.zeros((max(len(index), 1), len(self.sources)))
+
+    def _grow(self):
+        n = len(self.index)
+        if n > self.values.shape[0]:
+            self.values = np.vstack([self.values, np.zeros((n - self.values.shape[0], len(self.sources)))])
+
+    def cols(self, sources=None):
+        return slice(None) if sources is None else [self._cols[s] for s in sources]
+
+    def add(self, source, amounts, sign=1.):
+        """
+        :param amounts: {symbol: native amount}, wrappers land on the native row
+        """
+        if not amounts:
+            return self
+        rows = self.index.rows(amounts.keys())
+        self._grow()
+        np.add.at(self.values[:, self._cols[source]], rows, sign * np.fromiter(amounts.values(), dtype=float))
+        return self
+
+    def merge(self, other):
+        """
+        add another ledger on the same index, sources missing here are appended
+        """
+        for source in other.sources:
+            if source not in self._cols:
+                self._cols[source] = len(self.sources)
+                self.sources.append(source)
+                self.values = np.hstack([self.values, np.zeros((self.values.shape[0], 1))])
+        self._grow()
+        other._grow()
+        n = other.values.shape[0]
+        self.values[:n, [self._cols[s] for s in other.sources]] += other.values
+        return self
+
+    @property
+    def n(self):
+        return self.values.shape[0]
+
+    def net(self, sources=None):
+        """
+        native net amount per row across sources
+        """
+        return self.values[:, self.cols(sources)].sum(axis=1)
+
+    def prices(self, spot_prices):
+        return self.index.price_vector(spot_prices, self.n)
+
+    def usd(self, spot_prices, sources=None):
+        """
+        $ value per row, nan where the symbol has no price (see unpriced)
+        """
+        return self.net(sources) * self.prices(spot_prices)
+
+    def unpriced(self, spot_prices, sources=None):
+        """
+        symbols holding a non zero amount but missing from spot_prices
+        """
+        return self.symbols((self.net(sources) != 0) & np.isnan(self.prices(spot_prices)))
+
+    def risk_mask(self):
+        """
+        rows carrying price risk (not a stablecoin, non zero somewhere)
+        """
+        return ~self.index.stable_mask(self.n) & self.values.any(axis=1)
+
+    def symbols(self, mask=None):
+        symbols = self.index.symbols[:self.n]
+        if mask is None:
+            return list(symbols)
+        return [s for s, m in zip(symbols, mask) if m]
+
+    def to_dict(self, sources=None, mask=None, decimals=None):
+        """
+        {source: {symbol: amount}} of non zero cells, for logging
+        """
+        sources = self.sources if sources is None else sources
+        rows = np.arange(self.n) if mask is None else np.flatnonzero(mask)
+        values = self.values if decimals is None else self.values.round(decimals)
+        symbols = self.index.symbols
+        return {
+            s: {symbols[r]: float(values[r, self._cols[s]]) for r in rows if values[r, self._cols[s]]}
+            for s in sources
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, RiskLedger) \
+            and self.sources == other.sources \
+            and self.index.symbols[:self.n] == other.index.symbols[:other.n] \
+            and np.array_equal(self.values, other.values)
+
+    def __repr__(self):
+        return f"RiskLedger({self.n} symbols x {self.sources})"
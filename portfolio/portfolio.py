@@ -3,16 +3,20 @@ Redesigned portfolio\
 (Automated ABIs, etc …)
 
 *Equity
-a) Balances (Defi / Binance) 
+a) Balances (Defi / Binance)
 
 *Alerting
-a) job - Margin in accounts 
+a) job - Margin in accounts
 b) job - Portfolio price risk
 c) trigger - high funding rates (in either direction)
-d) trigger - price risk $ > limit 
+d) trigger - price risk $ > limit
+
+Runs as a long lived PortfolioEngine (see engine.py), every stage below caches
+its output and is only recomputed when its refresh interval expires or its inputs change
 
 """
 
+import asyncio
 from collections import defaultdict
 from configparser import ConfigParser
 import json
@@ -22,17 +26,22 @@ import sys
 from client import TelegramBotHandler
 sys.path.append('/'.join(os.getcwd().split('/')[:-1])) # absolute path
 
-import pandas as pd
-import requests
+import numpy as np
 from web3 import Web3
 
 import api
+from api.async_client import get_accounts
+from api.binance_stream import BinanceStream
+from api.execution_engine import FAILED, THROTTLED
+from api.order_book import OrderBookOutOfSync, attach_order_books
 import config
 import contracts
 import crv_utils
 import gmx_utils
 import portfolio_utils
 import utils
+from engine import PortfolioEngine
+import ledger
 from vault import VaultClient
 from client import TelegramBotHandler
 
@@ -41,18 +50,35 @@ GMX_ADDRESSES = [
     portfolio_utils.ADDRESSES['GMX_INST_2'],
 ]
 
+# seconds between engine ticks
+TICK_INTERVAL = 10
+# stages unfinished after this many seconds keep their previous output for the tick
+TICK_TIMEOUT = 60
+# independent stages (Binance, ARBI reads, ETH reads, spot prices, ...) run concurrently
+STAGE_WORKERS = 8
+# background refresh of the shared Binance ticker cache
+TICKER_REFRESH_INTERVAL = 5
+# seconds to wait for the websocket feed on start up
+STREAM_READY_TIMEOUT = 10
+# stages with side effects rerun at most this often, however often price_risk / binance change
+ALERT_INTERVAL = 300
+HEDGE_INTERVAL = 60
+
 # logging
 logger = logging.getLogger('price_risk')
 logger.setLevel(logging.INFO)
+# per tick / static config logs, file only (no Telegram handler)
+engine_logger = logging.getLogger('price_risk_engine')
+engine_logger.setLevel(logging.INFO)
 
-if __name__ == "__main__":
 
-    ###################### INIT LOGGER
+def init_logger():
     log_name = "defi_portfolio"
     stream = open(f"{log_name}.log", "a")
     stream_handler = logging.StreamHandler(stream)
     stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-8s %(message)s"))
     logger.addHandler(stream_handler)
+    engine_logger.addHandler(stream_handler)
     logging.getLogger("urllib3.util.retry").disabled = True
     logging.getLogger("urllib3.util").disabled = True
     logging.getLogger("urllib3").disabled = True
@@ -67,38 +93,56 @@ if __name__ == "__main__":
             logging.Formatter("%(asctime)s %(levelname)s - %(message)s")
        )
     logger.addHandler(telegram_handler)
-    
-    ################################# Load prices
-    #################################
 
+
+################################# Load prices
+#################################
+
+def load_spot_prices():
     spot_symbs = ["BTC", "ETH"] # alts not inluded
-    binance_prices = requests.get(f"https://api.binance.com/api/v3/ticker/price").json()
-    spot_prices = {s: float(d['price']) for d in binance_prices for s in spot_symbs if d['symbol'] == f'{s}USDT'}
-    
-    ################################# Binance data
-    #################################
-    
-    ################################# connect binance clients
+    return api.get_ticker_cache('BINANCE').get_spot(spot_symbs)
+
+
+################################# Binance data
+#################################
+
+def load_binance_clients():
     bgs = []
     for account_ in config.BINANCE_ACCOUNTS:
         vc = VaultClient(binance_vault_path=account_)
         err, resp = vc.get_binance_api_secret()
         bgs.append(api.BinanceClient(
-            'BINANCE_FUTURES_USDM', 
-            resp.get("BINANCE_API_KEY"), 
+            'BINANCE_FUTURES_USDM',
+            resp.get("BINANCE_API_KEY"),
             resp.get("BINANCE_API_SECRET"),
         ))
+    return bgs
+
+
+def start_binance_stream(binance_clients):
+    # hedging account, positions / fills / top of book kept live over websocket
+    symbols = [f'{s}USDT' for s, yes in config.HEDGE_SYMBS.items() if yes]
+    stream = BinanceStream(binance_clients[0], symbols=symbols, depth=True)
+    # books subscribe before the stream starts so no diff is missed
+    attach_order_books(stream)
+    stream.start()
+    if not stream.wait_ready(STREAM_READY_TIMEOUT):
+        logger.warning("binance stream not ready, hedger falls back to REST")
+    return stream
 
-    ################################# connect binance equity
+
+def load_binance(binance_clients):
     futs_lst = defaultdict(list)
     wallet_lst = defaultdict(list)
-    urlz_lst = defaultdict(list) 
+    urlz_lst = defaultdict(list)
+
+    # all accounts fetched concurrently
+    accounts = asyncio.run(get_accounts(binance_clients))
 
-    for bg in bgs:
-        account_ = bg.get_account()
+    for bg, account_ in zip(binance_clients, accounts):
 
         # futures positions
-        futs_ = bg.get_open_futs_positions()
+        futs_ = bg.get_open_futs_positions(account=account_)
         [futs_lst[k].append(v) for k, v in futs_.items()]
 
         # unrealized pnl
@@ -112,27 +156,30 @@ if __name__ == "__main__":
         # margin balance = wallet balance + urlz pnl (w the haircut)
         # liquidation value (equity) of the account is the sum of all tokens * spot
         wallet_ = {
-            d['asset']: float(d['walletBalance']) 
-            for d in account_['assets'] 
+            d['asset']: float(d['walletBalance'])
+            for d in account_['assets']
             if abs(float(d['walletBalance'])) > 0
         }
         [wallet_lst[k].append(v) for k, v in wallet_.items()]
 
-        wallet_usd_ = sum({k: v * spot_prices[k] for k, v in wallet_.items()}.values())
-
-    symb_2_bin_wallet = {k: sum(v) for k, v in wallet_lst.items()}
     symb_2_urlz_pnl = {k: sum(v) for k, v in urlz_lst.items()}
-    symb_2_urlz_pnl_usd = {'USDT': sum(symb_2_urlz_pnl.values())}
-    symb_2_futs = {k[:-4]: sum(v) for k, v in futs_lst.items()}
-    
-    
-    ################################# init contracts
-    #################################
-    
+    return {
+        'bin_wallet': {k: sum(v) for k, v in wallet_lst.items()},
+        'urlz_pnl': symb_2_urlz_pnl,
+        'urlz_pnl_usd': {'USDT': sum(symb_2_urlz_pnl.values())},
+        'futs': {k[:-4]: sum(v) for k, v in futs_lst.items()},
+        'available_balance': float(accounts[0]['availableBalance']),  # hedging account
+    }
+
+
+################################# init contracts
+#################################
+
+def build_contracts():
     # contracts commented out
-    arbi_contracts_yes = [               
+    arbi_contracts_yes = [
     ]
-    
+
     eth_contracts_yes = [
     ]
 
@@ -147,73 +194,75 @@ if __name__ == "__main__":
         for symb_, contract_ in contracts.ADDRESS_BOOK[network].items():
             if symb_ in contracts_yes[network]:
 
-                # point abi to proxy
-                if contract_.address in contracts.ADDRESS_2_PROXY:
-                    address_abi_ = contracts.ADDRESS_2_PROXY[contract_.address]
-                else:
-                    address_abi_ = None
-
                 # create contract
+                # (abi read from contracts.ABI_CACHE, proxies resolved via ADDRESS_2_PROXY)
                 c_ = contracts.CONTRACT_FACTORIES[network].create_contract(
-                    contract_.address, 
-                    contract_.is_token, 
+                    contract_.address,
+                    contract_.is_token,
                     key_2_get_abi=contracts.NETWORK_2_API_KEY[network],
-                    proxy_contract_address=address_abi_,
                 )
                 cmap[network][symb_] = c_
-                
-                
-    ################################# Pending Rewards
-    #################################
-
-    # CRV - PENDING
-    # (in Convex)
-    crv_pending_in_cvx = float(Web3.fromWei(cmap['ETH']['<REWARD_POOL>'].functions.earned(
-        account=portfolio_utils.ADDRESSES['CRV_INST']).call(), unit="ether"))
 
     # (in Curve)
     # change abi of claimable tokens to view
     abi_tmp_ = list(cmap['ETH']['<POOL>'].abi)
-    abi_tmp_[12]['stateMutability'] = 'view' 
+    abi_tmp_[12]['stateMutability'] = 'view'
     cmap['ETH']['<POOL>'].abi = abi_tmp_
-    crv_pending_in_crv = contracts.convert_balance_2_units(
-        cmap['ETH']['<POOL>'].functions.claimable_tokens(portfolio_utils.ADDRESSES['CRV_INST']).call())
+    return cmap
+
 
-    crv_pending = crv_pending_in_cvx + crv_pending_in_crv
+################################# Pending Rewards + balanceOf
+#################################
 
-    # GMX - PENDING
-    eth_pending = 0
-    esgmx_pending = 0
+def load_arbi_reads(cmap):
+    # GMX - PENDING + balanceOf
+    # (all per address ARBI reads in one multicall)
+    arbi_mc = contracts.CONTRACT_FACTORIES['ARBI'].multicall()
     for address_ in GMX_ADDRESSES:
-        eth_pending += float(Web3.fromWei(cmap['ARBI']['fglp'].functions.claimable(address_).call(), unit="ether"))
-        esgmx_pending += float(Web3.fromWei(cmap['ARBI']['fsglp'].functions.claimable(address_).call(), unit="ether"))
+        arbi_mc.add(('eth_pending', address_), cmap['ARBI']['fglp'].functions.claimable(address_))
+        arbi_mc.add(('esgmx_pending', address_), cmap['ARBI']['fsglp'].functions.claimable(address_))
+        arbi_mc.add(('arb_balance_of', address_), cmap['ARBI']['arb'].functions.balanceOf(address_))
+        arbi_mc.add(('gmx_balance_of', address_), cmap['ARBI']['gmx'].functions.balanceOf(address_))
+        arbi_mc.add(('esgmx_balance_of', address_), cmap['ARBI']['fsglp'].functions.cumulativeRewards(address_))
+    arbi_reads = defaultdict(int)
+    for (name_, _), val_ in arbi_mc.call().items():
+        arbi_reads[name_] += val_
+
+    return {
+        'pending': {
+            'esGMX': float(Web3.fromWei(arbi_reads['esgmx_pending'], unit="ether")),
+            'ETH': float(Web3.fromWei(arbi_reads['eth_pending'], unit="ether")),
+        },
+        'balance_of': {
+            'ARB': contracts.convert_balance_2_units(arbi_reads['arb_balance_of'], unit="ether"),
+            'esGMX': contracts.convert_balance_2_units(arbi_reads['esgmx_balance_of'], unit="ether"),
+        },
+    }
 
-    symb_2_pending = {
-        'CRV': crv_pending,
-        'esGMX': esgmx_pending,
-        'ETH': eth_pending,
 
-    }
-    
-    ################################# balanceOf
-    #################################
-    
-    crv_balance_of = cmap['ETH']['crv'].functions.balanceOf(portfolio_utils.ADDRESSES['CRV_INST']).call()
-    gmx_balance_of = 0
-    esgmx_balance_of = 0
-    for address_ in GMX_ADDRESSES:
-        gmx_balance_of += cmap['ARBI']['gmx'].functions.balanceOf(address_).call()
-        esgmx_balance_of += cmap['ARBI']['fsglp'].functions.cumulativeRewards(address_).call()
-        
+def load_eth_reads(cmap):
+    # CRV - PENDING
+    eth_mc = contracts.CONTRACT_FACTORIES['ETH'].multicall()
+    # (in Convex)
+    eth_mc.add('crv_pending_in_cvx', cmap['ETH']['<REWARD_POOL>'].functions.earned(
+        account=portfolio_utils.ADDRESSES['CRV_INST']))
+    # (in Curve)
+    eth_mc.add('crv_pending_in_crv', cmap['ETH']['<POOL>'].functions.claimable_tokens(portfolio_utils.ADDRESSES['CRV_INST']))
+
     # claimed rewards
     # sell all rewards into usdc in wallets,
     # if transferred to binance, equity still picked up
-    usdc_balance_of = 0
+    eth_mc.add('crv_balance_of', cmap['ETH']['crv'].functions.balanceOf(portfolio_utils.ADDRESSES['CRV_INST']))
     for address_ in [
         portfolio_utils.ADDRESSES['CRV_INST'],
         ]:
-        usdc_balance_of += cmap['ETH']['usdc'].functions.balanceOf(address_).call()
+        eth_mc.add(('usdc_balance_of', address_), cmap['ETH']['usdc'].functions.balanceOf(address_))
+    eth_reads = eth_mc.call()
 
+    crv_pending = contracts.convert_balance_2_units(eth_reads.pop('crv_pending_in_cvx')) \
+        + contracts.convert_balance_2_units(eth_reads.pop('crv_pending_in_crv'))
+    crv_balance_of = eth_reads.pop('crv_balance_of')
+    usdc_balance_of = sum(eth_reads.values())
 
 #     # how much CRV we'll receive if withdraw
 #     # (includes slippage)
@@ -223,244 +272,352 @@ if __name__ == "__main__":
 #         unit='wei'
 #     )
 
-    symb_2_balance_of = {
-        'ARB': contracts.convert_balance_2_units(arb_balance_of, unit="ether"),
-        'esGMX': contracts.convert_balance_2_units(esgmx_balance_of, unit="ether"),
-        'USDC': contracts.convert_balance_2_units(usdc_balance_of, unit="mwei"),
-        # 'CRV': crv_withdraw, # includes slippage
+    return {
+        'pending': {
+            'CRV': crv_pending,
+        },
+        'balance_of': {
+            'USDC': contracts.convert_balance_2_units(usdc_balance_of, unit="mwei"),
+            # 'CRV': crv_withdraw, # includes slippage
+        },
     }
-    
-    ################################# Glp Equity
-    #################################
 
-    glp_native = defaultdict(list)
-    glp_trader_bias = defaultdict(list)
-    glp_tokens = 0
 
-    for address_ in GMX_ADDRESSES:
-        g = gmx_utils.GmxRisk(address_, 'ARBI', cmap, logging=False)
-        out = g.main()
-        glp_risk_native_ = out['glp_native_risk']
-        glp_risk_ = out['glp_risk']
-        trader_bias_net_ = out['trader_bias']
-
-        # 
-        [glp_native[k].append(v) for k, v in glp_risk_native_.items()]
-        [glp_trader_bias[k].append(v) for k, v in trader_bias_net_.items()]
-        glp_tokens += glp_risk_
-
-    symb_2_glp_native = {k: sum(v) for k, v in glp_native.items()}
-    symb_2_trader_bias = {k: sum(v) for k, v in glp_trader_bias.items()}
-    
-    ################################# Curve Pool price risk
-    #################################
-    
+def merge_onchain(arbi_reads, eth_reads):
+    return {
+        'pending': {**arbi_reads['pending'], **eth_reads['pending']},
+        'balance_of': {**arbi_reads['balance_of'], **eth_reads['balance_of']},
+    }
+
+
+################################# Glp Equity
+#################################
+
+def load_glp(cmap):
+    # every GMX address in one batch, address x token risk matrix
+    glp_batch = gmx_utils.GmxRisk.for_addresses(GMX_ADDRESSES, 'ARBI', cmap)
+    return {
+        'glp_tokens': glp_batch['glp_risk'].sum(),
+        'glp_native': glp_batch['glp_native_risk'].sum(axis=0).to_dict(),
+        'trader_bias': {}, # trader bias risk commented out in gmx_utils
+    }
+
+
+################################# Curve Pool price risk
+#################################
+
+def load_crv_pool(cmap):
     _, symb_2_crv_pool_risk = crv_utils.calc_risk_of_crv_tricrypto(portfolio_utils.ADDRESSES['CRV_INST'])
     symb_2_crv_pool_risk.pop('USD')
-    
-
-    ################################# Assets
-    #################################
-    
-    def convert_index_keys_2_native(ser):
-        s = pd.Series(ser)
-        s.index = [gmx_utils.WRAPPERS_2_NATIVE.get(i, i) for i in s.index]
-        return s
-
-    assets_native = pd.concat([
-        convert_index_keys_2_native(pd.Series(symb_2_bin_wallet)),
-        convert_index_keys_2_native(pd.Series(symb_2_urlz_pnl_usd)),
-        convert_index_keys_2_native(pd.Series(symb_2_balance_of)),
-        convert_index_keys_2_native(pd.Series(symb_2_pending)),
-        convert_index_keys_2_native(pd.Series(symb_2_glp_native)),
-    ], axis=1, keys=['bin_wallet', 'bin_urlz_pnl', 'balance_of', 'pending', 'glp_native'])
-
-
-    ################################# Portfolio Equity
-    #################################
-    
-    asset_tmp = defaultdict(list)
-    for d_ in [
-        symb_2_bin_wallet, 
-        symb_2_urlz_pnl_usd, 
-        symb_2_balance_of, 
-        symb_2_pending, 
-        symb_2_glp_native]:
-
-        [asset_tmp[gmx_utils.WRAPPERS_2_NATIVE.get(k, k)].append(v) for k, v in d_.items()]
-
-    symb_2_asset = {k: sum(v) for k, v in asset_tmp.items()}      
-    symb_2_asset_usd = sum({k: v * spot_prices[k] for k, v in symb_2_asset.items()}.values())
+    return symb_2_crv_pool_risk
+
+
+################################# Loans
+#################################
 
+def load_loans():
     # loans native
-    # loans dollar
     LOANS = config.LOANS
     loans_lst = defaultdict(list)
     for _, d in LOANS.items():
         tmp = {k: sum(v.values()) for k, v in d.items()}
         [loans_lst[k_].append(v_) for k_, v_ in tmp.items()]
-    symb_2_loans = {k: sum(v) for k, v in loans_lst.items()}
-    symb_2_loans_usd = sum({k: v * spot_prices[k] for k, v in symb_2_loans.items()}.values())
+    return {k: sum(v) for k, v in loans_lst.items()}
+
+
+################################# Risk Ledger
+#################################
+
+# one row per native symbol (wrappers resolved once), rows are added as new symbols show up
+SYMBOL_INDEX = ledger.SymbolIndex(['BTC', 'ETH', 'GMX', 'esGMX', 'ARB', 'CRV'] + list(ledger.STABLECOINS))
+
+# ledger columns
+# assets; bin_wallet, bin_urlz_pnl, balance_of, pending, glp_native
+# price risk; bin_wallet, balance_of, pending, glp_native, urlz, futs, trader_bias, loans
+ASSET_SOURCES = ['bin_wallet', 'bin_urlz_pnl', 'balance_of', 'pending', 'glp_native']
+RISK_SOURCES = ['bin_wallet', 'balance_of', 'pending', 'glp_native', 'urlz', 'futs', 'trader_bias', 'loans']
+LEDGER_SOURCES = ASSET_SOURCES + ['urlz', 'futs', 'trader_bias', 'loans']
+
+# ledger column -> name in the price risk detail log
+RISK_SOURCE_2_LABEL = {
+    'bin_wallet': 'Bin_Wallet',
+    'balance_of': 'Balance_Of',
+    'pending': 'Pending',
+    'glp_native': 'GLP',
+    'urlz': 'Urlz',
+    'futs': 'Futs',
+    'trader_bias': 'Trader_bias',
+    'loans': 'Loans',
+}
 
-    # portfolio equity $
-    equity_all_usd = symb_2_asset_usd - symb_2_loans_usd
 
-    
-    ################################# Portfolio Price Risk
-    #################################
-    
+def build_ledger(binance, onchain, glp, loans, spot_prices):
     # account for urlz pnl as native risk
     symb_2_urlz_tmp = {'USDT': 0}
-    for symb_, urlz_usd_ in symb_2_urlz_pnl.items():
+    for symb_, urlz_usd_ in binance['urlz_pnl'].items():
         if symb_ in {'BTCUSDT', 'ETHUSDT'}:
             symb_2_urlz_tmp[symb_[:-4]] = urlz_usd_ / spot_prices[symb_[:-4]]
         else:
             symb_2_urlz_tmp['USDT'] += urlz_usd_
-                
-    price_risk_dict = {
-        'Bin_Wallet': symb_2_bin_wallet,
-        'Balance_Of': symb_2_balance_of,
-        'Pending': symb_2_pending,
-        'GLP': symb_2_glp_native,
-        'Urlz': symb_2_urlz_tmp,
-        'Futs': symb_2_futs,
-        'Trader_bias': symb_2_trader_bias,
-        'Loans': {k: -1 * v for k, v in symb_2_loans.items()},
+
+    return ledger.RiskLedger(SYMBOL_INDEX, LEDGER_SOURCES) \
+        .add('bin_wallet', binance['bin_wallet']) \
+        .add('bin_urlz_pnl', binance['urlz_pnl_usd']) \
+        .add('balance_of', onchain['balance_of']) \
+        .add('pending', onchain['pending']) \
+        .add('glp_native', glp['glp_native']) \
+        .add('urlz', symb_2_urlz_tmp) \
+        .add('futs', binance['futs']) \
+        .add('trader_bias', glp['trader_bias']) \
+        .add('loans', loans, sign=-1)
+
+
+################################# Assets
+#################################
+
+def calc_assets(risk_ledger):
+    return risk_ledger.to_dict(ASSET_SOURCES)
+
+
+################################# Portfolio Equity
+#################################
+
+def calc_equity(risk_ledger, spot_prices):
+    # assets - loans, loans are booked negative
+    sources = ASSET_SOURCES + ['loans']
+    unpriced = risk_ledger.unpriced(spot_prices, sources)
+    if unpriced:
+        logger.warning(f"no spot price for {unpriced}, left out of equity")
+
+    # portfolio equity $
+    return float(np.nansum(risk_ledger.usd(spot_prices, sources)))
+
+
+################################# Portfolio Price Risk
+#################################
+
+def calc_price_risk(risk_ledger, spot_prices):
+    mask = risk_ledger.risk_mask()
+    symbols = risk_ledger.symbols(mask)
+    cols = risk_ledger.cols(RISK_SOURCES)
+    detail = risk_ledger.values[mask][:, cols].round(2)
+    native = detail.sum(axis=1).round(2)
+    px = risk_ledger.prices(spot_prices)[mask]
+
+    unpriced = [s for s, p in zip(symbols, px) if p != p]
+    if unpriced:
+        logger.warning(f"no spot price for {unpriced}, left out of usd price risk")
+
+    labels = [RISK_SOURCE_2_LABEL[s] for s in RISK_SOURCES]
+    return {
+        'detail': {s: dict(zip(labels, row.tolist())) for s, row in zip(symbols, detail)},
+        'native': dict(zip(symbols, native.tolist())),
+        'usd': {s: int(v * p) for s, v, p in zip(symbols, native.tolist(), px.tolist()) if p == p},
     }
-    price_risk_dict = {k: {gmx_utils.WRAPPERS_2_NATIVE.get(kk, kk): vv for kk, vv in d.items()} 
-     for k, d in price_risk_dict.items()}
-    price_risk_tmp = pd.DataFrame(price_risk_dict)
-    price_risk_tmp['Net_Risk'] = price_risk_tmp.sum(axis=1)
-    price_risk_tmp['Net_Risk_Usd'] = pd.Series({symb: val * spot_prices[symb] for symb, val in price_risk_tmp['Net_Risk'].items()}).round()
-        
-    ################################# Portfolio Alerting
-    #################################
-    
-    price_risk_ = price_risk_tmp.T.drop(['USDT','BUSD','USDC','DAI','FRAX','USD'],axis=1).round(2).to_dict()
-    price_risk_native_ = {}
-    for k_, d_ in price_risk_.items():
-        d_.pop('Net_Risk')
-        d_.pop('Net_Risk_Usd')
-        price_risk_native_[k_] = round(sum([i for i in d_.values() if i == i]), 2)
-    price_risk_usd_ = {k: int(v * spot_prices[k]) for k, v in price_risk_native_.items()}
 
+
+################################# Portfolio Alerting
+#################################
+
+def alert(assets, price_risk, spot_prices):
     # logging
-    logger.info(f"assets_native: {json.dumps((assets_native.to_dict()), indent=4)}")
-    logger.info(f"symb_2_price_risk_detail: {json.dumps(({s:{k: round(v,2) if v==v else 0 for k,v in d.items()} for s, d in price_risk_.items()}), indent=4)}")
-    logger.info(f"symb_2_price_risk: {json.dumps(({k: round(v, 2) for k, v in price_risk_native_.items()}), indent=4)}")
-        
+    logger.info(f"assets_native: {json.dumps(assets, indent=4)}")
+    logger.info(f"symb_2_price_risk_detail: {json.dumps(({s:{k: round(v,2) if v==v else 0 for k,v in d.items()} for s, d in price_risk['detail'].items()}), indent=4)}")
+    logger.info(f"symb_2_price_risk: {json.dumps(({k: round(v, 2) for k, v in price_risk['native'].items()}), indent=4)}")
 
     #####Check if netRiskUsd >= $100k and send alert######
-    net_risk_usd_ = sum({k: v * spot_prices[k] for k, v in price_risk_native_.items()}.values())
+    net_risk_usd_ = sum(price_risk['usd'].values())
     if abs(net_risk_usd_) >= 100000:
         msg = f"netRiskUsd: {int(net_risk_usd_)}"
-        url = f'https://api.telegram.org/bot{config.TG_BOT_TOKEN}/sendMessage?chat_id={config.TG_GMX_PORTFOLIO_CHAT_ID}&parse_1mode=markdown&text={msg}' 
-        requests.get(url)
-        
-        
-    ################################# Risk Hedger
-    #################################
-    class Hedger:
-        def __init__(self, client):
-            self.client = client
-
-    MIN_AVAIL_BAL_USD = 150000
-        
+        url = f'https://api.telegram.org/bot{config.TG_BOT_TOKEN}/sendMessage?chat_id={config.TG_GMX_PORTFOLIO_CHAT_ID}&parse_1mode=markdown&text={msg}'
+        api.SESSIONS.get(url)
+    return net_risk_usd_
+
+
+################################# Risk Hedger
+#################################
+
+class Hedger:
+    def __init__(self, client):
+        self.client = client
+
+MIN_AVAIL_BAL_USD = 150000
+
+
+def get_order_book(symbol, stream=None):
+    # local L2 replica, None until it is synced
+    book = stream.order_books.get(symbol) if stream is not None and stream.is_live else None
+    return book if book is not None and book.synced else None
+
+
+def get_best_bid_ask(client, symbol, stream=None):
+    # local book / top of book from the stream, REST snapshot while it is down
+    book = get_order_book(symbol, stream)
+    if book is not None:
+        try:
+            bid, ask = book.best_bid_ask()
+        except OrderBookOutOfSync:
+            bid = ask = None
+        if bid is not None and ask is not None:
+            return bid, ask
+    tob = stream.get_top_of_book(symbol) if stream is not None and stream.is_live else None
+    if tob is not None:
+        return tob['bid'], tob['ask']
+    book = client.get_order_book(symbol)
+    return float(book['bids'][0][0]), float(book['asks'][0][0])
+
+
+def start_execution(binance_clients, binance_stream):
+    # hedging account, orders for every symbol go out together, limits checked on in-memory fills
+    return api.ExecutionEngine(
+        binance_clients[0],
+        stream=binance_stream,
+        min_minutes_between_trades={f'{s}USDT': v for s, v in config.SYMB_2_MIN_AMOUNT_MINUTES_BETWEEN_TRADE.items()},
+        max_volume_usd_1h={f'{s}USDT': v for s, v in config.SYMB_2_MIN_AMOUNT_VOLUME_USD_1_HR.items()},
+    )
+
+
+def hedge(execution, binance_stream, binance, price_risk, equity):
     # combine escrowed and native risks
+    price_risk_usd_ = price_risk['usd']
     price_risk_usd_adj = dict(price_risk_usd_)
-    price_risk_usd_adj['GMX'] = price_risk_usd_['GMX'] + price_risk_usd_['esGMX']
-    price_risk_usd_adj.pop('esGMX')
-    
-    # check past orders
-    # (most recent order is last)
-    orders = bgs[0].make_signed_request("GET", "userTrades")
-    df_orders = pd.DataFrame(orders)
-    # df_orders['time_dt'] = df_orders['time'].apply(utils.convert_ms_to_dt)
-    df_orders.set_index('symbol', inplace=True)
-    
+    price_risk_usd_adj['GMX'] = price_risk_usd_.get('GMX', 0) + price_risk_usd_.get('esGMX', 0)
+    price_risk_usd_adj.pop('esGMX', None)
+
     # logging
-    logger.info(f"config.HEDGE_SYMBS: {json.dumps(config.HEDGE_SYMBS, indent=4)}")
-    logger.info(f"config.SYMB_2_MIN_AMOUNT_MINUTES_BETWEEN_TRADE: {json.dumps(config.SYMB_2_MIN_AMOUNT_MINUTES_BETWEEN_TRADE, indent=4)}")
-    logger.info(f"config.SYMB_2_MIN_AMOUNT_VOLUME_USD_1_HR: {json.dumps(config.SYMB_2_MIN_AMOUNT_VOLUME_USD_1_HR, indent=4)}")
+    engine_logger.info(f"config.HEDGE_SYMBS: {json.dumps(config.HEDGE_SYMBS, indent=4)}")
+    engine_logger.info(f"config.SYMB_2_MIN_AMOUNT_MINUTES_BETWEEN_TRADE: {json.dumps(config.SYMB_2_MIN_AMOUNT_MINUTES_BETWEEN_TRADE, indent=4)}")
+    engine_logger.info(f"config.SYMB_2_MIN_AMOUNT_VOLUME_USD_1_HR: {json.dumps(config.SYMB_2_MIN_AMOUNT_VOLUME_USD_1_HR, indent=4)}")
     logger.info(f"symb_2_price_risk_$: {json.dumps(({k: int(v) for k, v in price_risk_usd_adj.items()}), indent=4)}")
-    logger.info(f"equity_all_$: ${int(equity_all_usd)}")
+    logger.info(f"equity_all_$: ${int(equity)}")
 
     # client
-    h = Hedger(bgs[0])s
-    account = h.client.get_account()
-    available_bal = float(account['availableBalance'])
-
-    if available_bal >= MIN_AVAIL_BAL_USD:
-        risk_2_hedge = {symb: risk_usd for symb, risk_usd in price_risk_usd_adj.items() 
-                        if (config.HEDGE_SYMBS.get(symb, False))
-                        and (abs(risk_usd) >= config.MIN_HEDGE_AMOUNT_USD[symb])}
-        logger.info(f"risk_2_hedge: {json.dumps(risk_2_hedge, indent=4)}")
-        
-        for symb_, symb_risk_usd_ in risk_2_hedge.items():
-
-            ########## cancel any open orders
-            h.client.cancel_open_orders(f'{symb_}USDT')
-            
-            ########## implement trading checks
-            #   (check past orders)
-            # symb_minute_limit_ok = True
-            # symb_volume_limit_ok = True
-            symb_orders = df_orders[df_orders.index == f'{symb_}USDT']
-            
-            if not(symb_orders.empty):
-                # condition 1: check last trade timestamp 
-                symb_orders_last = symb_orders.iloc[-1, :]
-                symb_orders_last_ts = symb_orders_last['time']
-                dt_now = datetime.now()
-                ts_now = utils.convert_dt_to_ms(dt_now.year, dt_now.month, dt_now.day)
-                # minutes since last trade
-                # ms / 1000 = s / 60 = m
-                min_since_last_trade = int((ts_now - symb_orders_last_ts) / (1000 * 60))
-                if min_since_last_trade < config.SYMB_2_MIN_AMOUNT_MINUTES_BETWEEN_TRADE[symb_]:
-                    # symb_minute_limit_ok = False
-                    logger.info(f"NOK: Only {min_since_last_trade}mins elapsed since last {symb_} trade")
-                    break
-
-                # condition 2: check all orders over last 1 hour
-                ts_1_hr_start = ts_now - 60 * 1000
-                symb_orders_last_hr = symb_orders[symb_orders['time'] >= ts_1_hr_start]
-                if not(symb_orders_last_hr.empty):
-                    volume_usd_1_hr = float(symb_orders_last_hr['quoteQty'].sum())
-                    if volume_usd_1_hr >= config.SYMB_2_MIN_AMOUNT_VOLUME_USD_1_HR[symb_]:
-                        # symb_volume_limit_ok = False
-                        logger.info(f"NOK: ${volume_usd_1_hr} volume for {symb_} over last hour")
-                        break
-                        
-            
-
-            ########## check book
-            book = h.client.get_order_book(f'{symb_}USDT')
-            best_bid = float(book['bids'][0][0])
-            best_ask = float(book['asks'][0][0])
-            # get quantity and round to tick size
-            min_symb_risk_usd = min(abs(symb_risk_usd_), config.MAX_HEDGE_AMOUNT_USD[symb_])
-            qty_raw = min_symb_risk_usd / ((best_bid + best_ask) / 2)
-            qty_tick = round(qty_raw, h.client.qty_tick_size[symb_])
-            # if qty_tick is 0, set to int
-            if not(h.client.qty_tick_size[symb_]):
-                qty_tick = int(qty_tick)
-
-            ########## place limits with accepable slippage 
-            bid_w_slippage = best_bid - best_bid * config.MAX_SLIPPAGE_PCT[symb_]
-            ask_w_slippage = best_ask + best_ask * config.MAX_SLIPPAGE_PCT[symb_]
-            price_raw = ask_w_slippage if symb_risk_usd_ < 0 else bid_w_slippage
-            price_tick = round(price_raw, h.client.price_tick_size[symb_])
-
-            ########## post order
-            order_params = {
-                'symbol': f'{symb_}USDT',
-                'side': 'BUY' if symb_risk_usd_ < 0 else 'SELL',
-                'type_': 'LIMIT',
-                'quantity': qty_tick,
-                'price': price_tick,
-                'timeInForce': 'GTC',
-            }
-            h.client.post_order(**order_params)
-            logger.info(f"ORDER POSTED: {order_params}")
+    h = Hedger(execution.client)
+    available_bal = binance['available_balance']
+
+    if available_bal < MIN_AVAIL_BAL_USD:
+        logger.info(f"NOK; Available Balance {available_bal} < MIN_AVAIL_BAL_USD {MIN_AVAIL_BAL_USD}, no trades placed")
+        return []
+
+    risk_2_hedge = {symb: risk_usd for symb, risk_usd in price_risk_usd_adj.items()
+                    if (config.HEDGE_SYMBS.get(symb, False))
+                    and (abs(risk_usd) >= config.MIN_HEDGE_AMOUNT_USD[symb])}
+    logger.info(f"risk_2_hedge: {json.dumps(risk_2_hedge, indent=4)}")
+
+    orders = []
+    for symb_, symb_risk_usd_ in risk_2_hedge.items():
+
+        ########## check book
+        book = get_order_book(f'{symb_}USDT', binance_stream)
+        best_bid, best_ask = get_best_bid_ask(h.client, f'{symb_}USDT', binance_stream)
+        # get quantity and round to the symbol's step / tick size (exchangeInfo filters)
+        rules = h.client.get_symbol_rules(f'{symb_}USDT')
+        min_symb_risk_usd = min(abs(symb_risk_usd_), config.MAX_HEDGE_AMOUNT_USD[symb_])
+        mid = None
+        if book is not None:
+            try:
+                mid = book.depth_weighted_mid()
+            except OrderBookOutOfSync:
+                book = None  # went out of sync since get_order_book, top of book only
+        if mid is None:
+            mid = (best_bid + best_ask) / 2
+        qty_raw = min_symb_risk_usd / mid
+        qty_tick = rules.round_qty(qty_raw)
+
+        ########## place limits with accepable slippage
+        bid_w_slippage = best_bid - best_bid * config.MAX_SLIPPAGE_PCT[symb_]
+        ask_w_slippage = best_ask + best_ask * config.MAX_SLIPPAGE_PCT[symb_]
+        price_raw = ask_w_slippage if symb_risk_usd_ < 0 else bid_w_slippage
+        price_tick = rules.round_price(price_raw)
+
+        # slippage check against the local book, no round trip; shrink to what fills within MAX_SLIPPAGE_PCT
+        side = 'BUY' if symb_risk_usd_ < 0 else 'SELL'
+        try:
+            qty_in_slippage = book.qty_within(price_tick, side) if book is not None else None
+        except OrderBookOutOfSync:
+            qty_in_slippage = None
+        if qty_in_slippage is not None and qty_in_slippage < qty_tick:
+            logger.info(f"{symb_} book only has {qty_in_slippage} within MAX_SLIPPAGE_PCT (price {price_tick}), qty {qty_tick} cut down")
+            qty_tick = rules.round_qty(qty_in_slippage)
+
+        # an order failing the exchange filters would only bounce
+        reason = rules.validate(price_tick, qty_tick)
+        if reason is not None:
+            logger.info(f"NOK: {reason}, no {symb_} order placed")
+            continue
+
+        orders.append({
+            'symbol': f'{symb_}USDT',
+            'side': side,
+            'type': 'LIMIT',
+            'quantity': rules.format_qty(qty_tick),
+            'price': rules.format_price(price_tick),
+            'timeInForce': 'GTC',
+        })
+
+    ########## post orders
+    # per symbol trade limits, cancels and posts for every symbol in one concurrent pass
+    states = execution.submit(orders)
+    orders_posted = []
+    for order in states:
+        if order['status'] in (THROTTLED, FAILED):
+            continue
+        logger.info(f"ORDER POSTED: {order}")
+        orders_posted.append(order)
+    return orders_posted
+
+
+################################# Engine
+#################################
+
+def build_engine():
+    """
+    refresh intervals in seconds, None = only when an input changes
+
+    collection stages only depend on binance_clients / cmap so they run in parallel,
+    risk_ledger is the join point, assets, equity and price_risk read from it
+
+    alert (Telegram) and hedge (cancels / posts orders) are throttled by min_interval,
+    their inputs change nearly every tick
+    """
+    engine = PortfolioEngine(max_workers=STAGE_WORKERS, tick_timeout=TICK_TIMEOUT)
+    engine.add_stage('spot_prices', load_spot_prices, refresh_interval=10)
+    engine.add_stage('binance_clients', load_binance_clients, refresh_interval=None)
+    engine.add_stage('binance_stream', start_binance_stream, deps=['binance_clients'], refresh_interval=None)
+    engine.add_stage('binance', load_binance, deps=['binance_clients'], refresh_interval=10)
+    engine.add_stage('cmap', build_contracts, refresh_interval=None)
+    engine.add_stage('arbi_reads', load_arbi_reads, deps=['cmap'], refresh_interval=30)
+    engine.add_stage('eth_reads', load_eth_reads, deps=['cmap'], refresh_interval=60)
+    engine.add_stage('onchain', merge_onchain, deps=['arbi_reads', 'eth_reads'], refresh_interval=None)
+    engine.add_stage('glp', load_glp, deps=['cmap'], refresh_interval=15)  # GlpSnapshot reuses state within a block
+    engine.add_stage('crv_pool', load_crv_pool, deps=['cmap'], refresh_interval=300)
+    engine.add_stage('loans', load_loans, refresh_interval=3600)
+    engine.add_stage('risk_ledger', build_ledger, deps=['binance', 'onchain', 'glp', 'loans', 'spot_prices'], refresh_interval=None)
+    engine.add_stage('assets', calc_assets, deps=['risk_ledger'], refresh_interval=None)
+    engine.add_stage('equity', calc_equity, deps=['risk_ledger', 'spot_prices'], refresh_interval=None)
+    engine.add_stage('price_risk', calc_price_risk, deps=['risk_ledger', 'spot_prices'], refresh_interval=None)
+    engine.add_stage('alert', alert, deps=['assets', 'price_risk', 'spot_prices'], refresh_interval=None, min_interval=ALERT_INTERVAL)
+    engine.add_stage('execution', start_execution, deps=['binance_clients', 'binance_stream'], refresh_interval=None)
+    engine.add_stage('hedge', hedge, deps=['execution', 'binance_stream', 'binance', 'price_risk', 'equity'], refresh_interval=None, min_interval=HEDGE_INTERVAL)
+    return engine
+
+
+def log_tick(engine, ran):
+    timings = engine.timings()
+    path, path_s = engine.critical_path()
+    engine_logger.info(f"tick ran {len(ran)} stages in {engine.tick_duration:.3f}s: {json.dumps({k: round(timings[k], 3) for k in ran})}")
+    engine_logger.info(f"critical path {' -> '.join(path)}: {path_s:.3f}s")
+
+
+if __name__ == "__main__":
+
+    ###################### INIT LOGGER
+    init_logger()
+
+    # --once for a single cron style snapshot
+    engine = build_engine()
+    if '--once' in sys.argv:
+        log_tick(engine, engine.tick())
     else:
-        logger.info(f"NOK; Available Balance {available_bal} < MIN_AVAIL_BAL_USD {MIN_AVAIL_BAL_USD}, no trades placed")
\ No newline at end of file
+        api.get_ticker_cache('BINANCE').start(TICKER_REFRESH_INTERVAL)
+        engine.run_forever(interval=TICK_INTERVAL, on_tick=log_tick)
@@ -0,0 +1,166 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+# importing api pulls in every client, the stream needs aiohttp
+pytest.importorskip('requests')
+pytest.importorskip('numpy')
+aiohttp = pytest.importorskip('aiohttp')
+
+from api import binance_stream  # noqa: E402
+from api.binance_stream import BinanceStream  # noqa: E402
+
+FAR_FUTURE_MS = 2 ** 62
+
+
+def futs_account(position, balance):
+    return {
+        'positions': [{'symbol': 'BTCUSDT', 'positionAmt': str(position), 'unrealizedProfit': '0'}],
+        'assets': [{'asset': 'USDT', 'walletBalance': str(balance)}],
+    }
+
+
+def account_update(event_ms, position, balance):
+    return {'e': 'ACCOUNT_UPDATE', 'E': event_ms, 'a': {
+        'B': [{'a': 'USDT', 'wb': str(balance)}],
+        'P': [{'s': 'BTCUSDT', 'pa': str(position), 'up': '1'}],
+    }}
+
+
+def order_update(trade_id, qty, price, trade_ms):
+    return {'e': 'ORDER_TRADE_UPDATE', 'E': trade_ms, 'o': {
+        's': 'BTCUSDT', 'c': 'hedge_x', 'S': 'SELL', 'x': 'TRADE', 'X': 'FILLED', 'i': 1,
+        'l': str(qty), 'L': str(price), 'z': str(qty), 'ap': str(price), 't': trade_id, 'T': trade_ms,
+    }}
+
+
+def text(data):
+    return SimpleNamespace(type=aiohttp.WSMsgType.TEXT, data=json.dumps({'stream': 'lk', 'data': data}))
+
+
+class FakeClient:
+    exchange = 'BINANCE_FUTURES_USDM'
+    api_key = 'key'
+
+    def __init__(self, accounts, stream=None):
+        self.accounts = list(accounts)
+        self.stream = stream
+        self.seen = []  # (connected, seeded) of the stream when get_account is called
+
+    def create_listen_key(self):
+        return 'lk'
+
+    def keep_alive_listen_key(self, listen_key):
+        pass
+
+    def close_listen_key(self, listen_key):
+        pass
+
+    def get_account(self):
+        self.seen.append((self.stream.connected, self.stream.seeded))
+        return self.accounts.pop(0)
+
+
+class FakeWs:
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.messages:
+            raise StopAsyncIteration
+        return self.messages.pop(0)
+
+    async def close(self):
+        self.messages = []
+
+
+class FakeSession:
+    """
+    one list of messages per connection, the connection closes once they are read
+    """
+
+    def __init__(self, connections):
+        self.connections = list(connections)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def ws_connect(self, url, heartbeat=None):
+        return FakeWs(self.connections.pop(0))
+
+
+def make_stream(accounts):
+    client = FakeClient(accounts)
+    stream = BinanceStream(client, symbols=['BTCUSDT'], book_ticker=False, mark_price=False)
+    client.stream = stream
+    return stream, client
+
+
+def test_seed_drops_account_deltas_older_than_the_request():
+    stream, client = make_stream([futs_account(1, 1000)])
+    session = FakeSession([[
+        text(account_update(0, 5, 5000)),                 # buffered while get_account was in flight
+        text(account_update(FAR_FUTURE_MS, 2, 2000)),
+    ]])
+
+    async def run():
+        stream._loop = asyncio.get_running_loop()
+        await stream._connect_once(session)
+
+    asyncio.run(run())
+    assert client.seen == [(False, False)]
+    assert stream.seeded
+    assert stream.get_positions() == {'BTCUSDT': 2.}
+    assert stream.get_balances() == {'USDT': 2000.}
+
+
+def test_reconnect_reseeds(monkeypatch):
+    stream, client = make_stream([futs_account(1, 1000), futs_account(3, 3000)])
+    connections = [[text(account_update(FAR_FUTURE_MS, 2, 2000))], []]
+    monkeypatch.setattr(binance_stream.aiohttp, 'ClientSession', lambda: FakeSession(connections))
+    monkeypatch.setattr(binance_stream, 'RECONNECT_DELAY_S', 0)
+
+    connects = []
+
+    def on_connected(data):
+        connects.append((data['reconnects'], stream.is_live))
+        if data['reconnects']:
+            stream._stop.set()
+
+    stream.add_listener('connected', on_connected)
+    stream._loop = asyncio.new_event_loop()
+    try:
+        stream._loop.run_until_complete(stream._run())
+    finally:
+        stream._loop.close()
+
+    # not live while seeding, live once seeded, seeded again after the reconnect
+    assert client.seen == [(False, False), (False, False)]
+    assert connects == [(0, True), (1, True)]
+    assert stream.reconnects == 1
+    assert stream.get_positions() == {'BTCUSDT': 3.}
+    assert not stream.connected and not stream.seeded
+
+
+def test_fills_go_to_the_fill_store():
+    stream, _ = make_stream([])
+    stream.handle_message({'data': order_update(7, 0.5, 30000, 1000)})
+    stream.handle_message({'data': order_update(7, 0.5, 30000, 1000)})  # replayed
+    assert [f['id'] for f in stream.get_fills()] == [7]
+    assert stream.fill_store.notional('BTCUSDT', now_ms=1000) == 15000.
+    assert stream.get_fills('ETHUSDT') == []
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+import cache
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'fakeredis'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        return cache.make_cache('memory://')
+    if request.param == 'sqlite':
+        return cache.make_cache(f'sqlite:///{tmp_path / "cache.db"}')
+    pytest.importorskip('fakeredis')
+    return cache.make_cache('fakeredis://')
+
+
+def test_get_set_delete(backend):
+    assert backend.get('missing') is None
+    backend.set('k', 1.5)
+    assert backend.get('k') == '1.5'
+    backend.delete('k')
+    assert backend.get('k') is None
+
+
+def test_empty_cache_is_truthy(backend):
+    assert backend
+
+
+def test_hash(backend):
+    assert backend.hgetall('h') == {}
+    backend.hset('h', mapping={'a': 1, 'b': 'x'})
+    backend.hset('h', mapping={'a': 2})
+    assert backend.hgetall('h') == {'a': '2', 'b': 'x'}
+
+
+def test_expiry(backend, monkeypatch):
+    if isinstance(backend, cache.RedisCache):
+        pytest.skip('fakeredis keeps its own clock')
+    now = [1000.]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    backend.set('k', 'v', ex=10)
+    now[0] += 9
+    assert backend.get('k') == 'v'
+    now[0] += 1
+    assert backend.get('k') is None
+
+
+def test_lru_evicts_least_recently_used():
+    lru = cache.LruCache(maxsize=2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)
+    assert lru.get('b') is None
+    assert lru.get('a') == '1' and lru.get('c') == '3'
+
+
+def test_lru_key_types_do_not_mix():
+    lru = cache.LruCache()
+    lru.hset('h', mapping={'a': 1})
+    assert lru.get('h') is None
+    lru.set('k', 'v')
+    assert lru.hgetall('k') == {}
+
+
+def test_sqlite_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'sub' / 'cache.db')
+    writer, reader = cache.SqliteCache(path), cache.SqliteCache(path)
+    writer.hset('h', mapping={'a': 1})
+    assert reader.hgetall('h') == {'a': '1'}
+    writer.close()
+    reader.close()
+
+
+def test_incomplete_backend_fails_on_creation():
+    class GetOnly(cache.CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnly()
+
+
+def test_make_cache_rejects_unknown_url():
+    with pytest.raises(ValueError):
+        cache.make_cache('memcached://localhost')
+
+
+def test_publisher_writes_the_keys_data_reads(backend):
+    publisher = cache.CachePublisher(backend, {
+        'Binance': lambda: {'BTCUSDT': 30000., 'ETHUSDT': None},
+        'Coinbase': lambda: 1 / 0,
+    })
+    errors = publisher.publish_once()
+    assert list(errors) == ['Coinbase']
+
+    ticker = backend.hgetall(cache.ticker_key('Binance'))
+    assert json.loads(ticker['raw']) == {'BTCUSDT': {'price': '30000.0'}}
+    assert float(ticker['timestamp']) > 0
+
+    publisher.publish_klines('Binance', 'BTC', 'USDT', '1D', [(1, 2., 3., 1., 2.5, 10.)])
+    assert json.loads(backend.get(cache.klines_key('Binance', 'BTC', 'USDT', '1D'))) == [[1, 2., 3., 1., 2.5, 10.]]
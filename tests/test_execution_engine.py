@@ -0,0 +1,185 @@
+import time
+
+import pytest
+
+# importing api pulls in every client
+pytest.importorskip('requests')
+pytest.importorskip('numpy')
+
+from api import execution_engine  # noqa: E402
+from api.execution_engine import BATCH_ORDERS_MAX, FAILED, PENDING_NEW, THROTTLED, ExecutionEngine  # noqa: E402
+
+
+def order(symbol, side='BUY', qty=1., price=100.):
+    return {'symbol': symbol, 'side': side, 'type': 'LIMIT', 'quantity': qty, 'price': price, 'timeInForce': 'GTC'}
+
+
+class FakeClient:
+
+    def __init__(self, exchange='BINANCE_FUTURES_USDM', trades=None, batch_resp=None, cancel_resp=None, failing_symbols=()):
+        self.exchange = exchange
+        self.trades = trades or {}              # symbol -> userTrades rows
+        self.batch_resp = batch_resp            # whole batch response, None acks every order
+        self.cancel_resp = cancel_resp or {'code': 200, 'msg': 'ok'}
+        self.failing_symbols = set(failing_symbols)
+        self.batches = []
+        self.posts = []
+        self.cancels = []
+        self._order_id = 0
+
+    def make_signed_request(self, method, endpoint, body_in):
+        if body_in['symbol'] in self.failing_symbols:
+            raise ConnectionError(f"userTrades {body_in['symbol']}")
+        return [t for t in self.trades.get(body_in['symbol'], []) if t['id'] >= body_in.get('fromId', 0)]
+
+    def _ack(self, params):
+        self._order_id += 1
+        return {'orderId': self._order_id, 'clientOrderId': params['newClientOrderId'], 'status': 'NEW', 'executedQty': '0'}
+
+    def post_batch_orders(self, orders):
+        self.batches.append(orders)
+        if self.batch_resp is not None:
+            return self.batch_resp
+        return [self._ack(o) for o in orders]
+
+    def post_order(self, symbol, side, type_, quantity, price=None, timeInForce=None, **params):
+        self.posts.append(symbol)
+        return self._ack(params)
+
+    def cancel_open_orders(self, symbol):
+        self.cancels.append(symbol)
+        return self.cancel_resp
+
+
+def user_trade(id_, minutes_ago, quote=100., symbol='BTCUSDT'):
+    time_ms = int((time.time() - minutes_ago * 60) * 1000)
+    return {'id': id_, 'symbol': symbol, 'isBuyer': True, 'qty': '1', 'price': str(quote), 'quoteQty': str(quote), 'time': time_ms}
+
+
+@pytest.fixture
+def make_engine():
+    engines = []
+
+    def make(client, **kwargs):
+        engine = ExecutionEngine(client, **kwargs)
+        engines.append(engine)
+        return engine
+
+    yield make
+    for engine in engines:
+        engine.close()
+
+
+def test_futures_orders_go_out_in_batches(make_engine):
+    client = FakeClient()
+    engine = make_engine(client)
+    symbols = [f'SYM{i}USDT' for i in range(BATCH_ORDERS_MAX * 2 + 1)]
+    states = engine.submit([order(s) for s in symbols])
+    assert sorted(len(b) for b in client.batches) == [1, BATCH_ORDERS_MAX, BATCH_ORDERS_MAX]
+    assert not client.posts
+    assert sorted(client.cancels) == sorted(symbols)
+    assert all(s['status'] == 'NEW' and s['orderId'] is not None for s in states)
+
+
+def test_spot_posts_one_by_one(make_engine):
+    client = FakeClient(exchange='BINANCE_SPOT')
+    engine = make_engine(client)
+    states = engine.submit([order('BTCUSDT'), order('ETHUSDT')])
+    assert not client.batches
+    assert sorted(client.posts) == ['BTCUSDT', 'ETHUSDT']
+    assert [s['status'] for s in states] == ['NEW', 'NEW']
+
+
+def test_batch_rejection_fails_every_order(make_engine):
+    rejected = {'code': -1102, 'msg': 'Mandatory parameter missing'}
+    engine = make_engine(FakeClient(batch_resp=rejected))
+    states = engine.submit([order('BTCUSDT'), order('ETHUSDT')])
+    assert [s['status'] for s in states] == [FAILED, FAILED]
+    assert all(s['error'] == rejected and not s['confirmed'] for s in states)
+
+
+def test_per_order_error_in_a_batch(make_engine):
+    rejected = {'code': -2019, 'msg': 'Margin is insufficient.'}
+    engine = make_engine(FakeClient(batch_resp=[{'orderId': 1, 'status': 'NEW'}, rejected]))
+    states = engine.submit([order('BTCUSDT'), order('ETHUSDT')])
+    assert [s['status'] for s in states] == ['NEW', FAILED]
+
+
+def test_confirmed_final_state_is_never_moved_back(make_engine):
+    engine = make_engine(FakeClient())
+    state = engine.submit([order('BTCUSDT')])[0]
+    cid = state['clientOrderId']
+    # the stream reports the fill before a late REST ack
+    engine._on_futs_order_update({'o': {'c': cid, 'i': 1, 'X': 'FILLED', 'z': '1', 'ap': '100'}})
+    engine._apply_ack(state, {'orderId': 1, 'status': 'NEW', 'executedQty': '0'})
+    assert engine.orders[cid]['status'] == 'FILLED'
+
+
+def test_unconfirmed_final_state_can_be_corrected(make_engine):
+    engine = make_engine(FakeClient())
+    state = engine.submit([order('BTCUSDT')])[0]
+    cid = state['clientOrderId']
+    engine._cancel('BTCUSDT')
+    assert engine.orders[cid]['status'] == 'CANCELED'
+    assert not engine.orders[cid]['confirmed']
+    # it filled before the cancel reached it
+    engine._on_futs_order_update({'o': {'c': cid, 'i': 1, 'X': 'FILLED', 'z': '1', 'ap': '100'}})
+    assert engine.orders[cid]['status'] == 'FILLED'
+    assert engine.orders[cid]['confirmed']
+
+
+def test_cancel_waits_for_the_ack_timeout(make_engine):
+    engine = make_engine(FakeClient())
+    fresh = engine._new_order(order('BTCUSDT'))
+    fresh['sent_at'] = time.time()
+    stale = engine._new_order(order('BTCUSDT'))
+    stale['sent_at'] = time.time() - execution_engine.ACK_TIMEOUT_S - 1
+    unsent = engine._new_order(order('BTCUSDT'))
+    assert engine._cancel('BTCUSDT')
+    assert fresh['status'] == PENDING_NEW
+    assert stale['status'] == 'CANCELED'
+    assert unsent['status'] == PENDING_NEW
+
+
+def test_failed_cancel_keeps_the_state(make_engine):
+    client = FakeClient()
+    engine = make_engine(client)
+    state = engine.submit([order('BTCUSDT')])[0]
+    client.cancel_resp = {'code': -1021, 'msg': 'Timestamp for this request is outside of the recvWindow.'}
+    assert not engine._cancel('BTCUSDT')
+    assert engine.orders[state['clientOrderId']]['status'] == 'NEW'
+
+
+def test_min_interval_throttles_but_still_cancels(make_engine):
+    client = FakeClient(trades={'BTCUSDT': [user_trade(1, minutes_ago=2)]})
+    engine = make_engine(client, min_minutes_between_trades={'BTCUSDT': 5})
+    states = engine.submit([order('BTCUSDT'), order('ETHUSDT')])
+    assert states[0]['status'] == THROTTLED
+    assert 'since last BTCUSDT trade' in states[0]['error']
+    assert states[1]['status'] == 'NEW'
+    assert [o['symbol'] for b in client.batches for o in b] == ['ETHUSDT']
+    assert sorted(client.cancels) == ['BTCUSDT', 'ETHUSDT']
+
+
+def test_hourly_volume_throttles(make_engine):
+    trades = {'BTCUSDT': [user_trade(1, minutes_ago=30, quote=6e4), user_trade(2, minutes_ago=10, quote=5e4)]}
+    engine = make_engine(FakeClient(trades=trades), max_volume_usd_1h={'BTCUSDT': 1e5})
+    state = engine.submit([order('BTCUSDT')])[0]
+    assert state['status'] == THROTTLED
+    assert engine.volume_usd_1h('BTCUSDT') == 1.1e5
+
+
+def test_limit_check_error_only_fails_its_symbol(make_engine):
+    client = FakeClient(failing_symbols={'BTCUSDT'})
+    engine = make_engine(client)
+    states = engine.submit([order('BTCUSDT'), order('ETHUSDT')])
+    assert states[0]['status'] == FAILED
+    assert 'userTrades BTCUSDT' in states[0]['error']
+    assert states[1]['status'] == 'NEW'
+
+
+def test_prune_drops_old_final_orders(make_engine):
+    engine = make_engine(FakeClient(batch_resp={'code': -1, 'msg': 'down'}))
+    state = engine.submit([order('BTCUSDT')])[0]
+    engine._prune(now=time.time() + execution_engine.ORDER_RETENTION_S + 1)
+    assert state['clientOrderId'] not in engine.orders
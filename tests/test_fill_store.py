@@ -0,0 +1,127 @@
+import pytest
+
+# importing api pulls in every client
+pytest.importorskip('requests')
+pytest.importorskip('numpy')
+
+from api.fill_store import USER_TRADES_LIMIT, FillStore, parse_trade  # noqa: E402
+
+HOUR_MS = 60 * 60 * 1000
+NOW_MS = 10 * HOUR_MS
+
+
+def fill(id_, time_ms, quote=100., symbol='BTCUSDT'):
+    return {'id': id_, 'symbol': symbol, 'side': 'BUY', 'qty': 1., 'price': quote, 'quoteQty': quote, 'time': time_ms}
+
+
+def trade(id_, time_ms, quote=100.):
+    return {'id': id_, 'symbol': 'BTCUSDT', 'isBuyer': False, 'qty': '1', 'price': str(quote), 'quoteQty': str(quote), 'time': time_ms}
+
+
+class FakeClient:
+
+    def __init__(self, trades):
+        self.trades = trades
+        self.requests = []
+
+    def make_signed_request(self, method, endpoint, body_in):
+        self.requests.append(dict(body_in))
+        if 'fromId' in body_in:
+            rows = [t for t in self.trades if t['id'] >= body_in['fromId']]
+        else:
+            rows = [t for t in self.trades if t['time'] >= body_in['startTime']]
+        return rows[:body_in['limit']]
+
+
+def test_parse_trade():
+    assert parse_trade(trade(7, 1000, 5.)) == {
+        'id': 7, 'symbol': 'BTCUSDT', 'side': 'SELL', 'qty': 1., 'price': 5., 'quoteQty': 5., 'time': 1000}
+
+
+def test_duplicates_are_ignored():
+    store = FillStore()
+    assert store.add(fill(1, NOW_MS))
+    assert not store.add(fill(1, NOW_MS))
+    assert store.notional('BTCUSDT', NOW_MS) == 100.
+
+
+def test_window_expires_old_fills():
+    store = FillStore(window_ms=HOUR_MS)
+    store.add_many([fill(1, NOW_MS - 2 * HOUR_MS), fill(2, NOW_MS - HOUR_MS // 2), fill(3, NOW_MS, 50.)])
+    assert store.notional('BTCUSDT', NOW_MS) == 150.
+    assert store.notional('BTCUSDT', NOW_MS + HOUR_MS // 2 + 1) == 50.
+    assert store.notional('BTCUSDT', NOW_MS + 2 * HOUR_MS) == 0.
+    assert store.notional('ETHUSDT', NOW_MS) == 0.
+
+
+def test_late_fill_is_inserted_in_order():
+    store = FillStore()
+    store.add_many([fill(1, NOW_MS - 1000), fill(3, NOW_MS)])
+    store.add(fill(2, NOW_MS - 500))
+    assert [f['id'] for f in store.get('BTCUSDT')] == [1, 2, 3]
+    assert [f['id'] for f in store.get('BTCUSDT', since_ms=NOW_MS - 500)] == [2, 3]
+    assert store.notional('BTCUSDT', NOW_MS) == 300.
+
+
+def test_fill_older_than_an_expired_window_is_not_counted():
+    store = FillStore(window_ms=HOUR_MS)
+    store.add(fill(1, NOW_MS))
+    store.notional('BTCUSDT', NOW_MS)
+    store.add(fill(2, NOW_MS - 2 * HOUR_MS))
+    assert store.notional('BTCUSDT', NOW_MS) == 100.
+
+
+def test_ring_buffer_bound():
+    store = FillStore(maxlen=3)
+    store.add_many([fill(i, NOW_MS + i) for i in range(5)])
+    assert [f['id'] for f in store.get('BTCUSDT')] == [2, 3, 4]
+    assert store.add(fill(0, NOW_MS + 10))  # dropped from the buffer, its id is free again
+
+
+def test_minutes_since_last():
+    store = FillStore()
+    assert store.minutes_since_last('BTCUSDT') is None
+    store.add(fill(1, NOW_MS))
+    assert store.minutes_since_last('BTCUSDT', NOW_MS + 5 * 60 * 1000) == 5.
+
+
+def test_sync_loads_the_window_then_pages_by_id(monkeypatch):
+    monkeypatch.setattr('api.fill_store.time.time', lambda: NOW_MS / 1000)
+    client = FakeClient([trade(1, NOW_MS - 2 * HOUR_MS), trade(2, NOW_MS - 1000)])
+    store = FillStore(client)
+    assert not store.is_synced('BTCUSDT')
+    assert store.sync('BTCUSDT') == 1
+    assert store.is_synced('BTCUSDT')
+    assert 'startTime' in client.requests[-1]
+
+    client.trades.append(trade(3, NOW_MS))
+    assert store.sync('BTCUSDT') == 1
+    assert client.requests[-1]['fromId'] == 3
+    assert store.notional('BTCUSDT', NOW_MS) == 200.
+
+
+def test_sync_without_trades_keeps_using_the_window(monkeypatch):
+    monkeypatch.setattr('api.fill_store.time.time', lambda: NOW_MS / 1000)
+    client = FakeClient([])
+    store = FillStore(client)
+    assert store.sync('BTCUSDT') == 0
+    assert store.is_synced('BTCUSDT')
+    store.sync('BTCUSDT')
+    assert 'startTime' in client.requests[-1]
+
+
+def test_sync_pages_full_responses(monkeypatch):
+    monkeypatch.setattr('api.fill_store.time.time', lambda: NOW_MS / 1000)
+    client = FakeClient([trade(i, NOW_MS - 1000) for i in range(1, USER_TRADES_LIMIT + 3)])
+    store = FillStore(client)
+    assert store.sync('BTCUSDT') == USER_TRADES_LIMIT + 2
+    assert len(client.requests) == 2
+
+
+def test_sync_error_raises():
+    class ErrorClient:
+        def make_signed_request(self, method, endpoint, body_in):
+            return {'code': -1021, 'msg': 'Timestamp outside of recvWindow'}
+
+    with pytest.raises(ValueError):
+        FillStore(ErrorClient()).sync('BTCUSDT')
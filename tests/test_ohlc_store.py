@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from ohlc_store import OhlcStore  # noqa: E402
+
+DAY = 86400
+PAGE = 10
+
+
+def candle(ts, close=1.):
+    return [ts, close, close, close, close, 1.]
+
+
+class FakeExchange:
+    """
+    daily candles ts 0 .. last, pages of PAGE, start=None gives the latest page
+    """
+
+    def __init__(self, last_day):
+        self.history = [candle(d * DAY, float(d)) for d in range(last_day + 1)]
+        self.calls = []
+
+    def fetch(self, exch, base, quote, freq, start, end):
+        self.calls.append((start, end))
+        rows = [r for r in self.history if (start is None or r[0] >= start) and (end is None or r[0] <= end)]
+        return rows[-PAGE:] if start is None else rows[:PAGE]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return OhlcStore(path=str(tmp_path), page_limits={'BINANCE': PAGE})
+
+
+def closes(arr):
+    return [float(c) for c in arr['close']]
+
+
+def test_write_appends_newer_candles(store):
+    assert store.write('BINANCE', 'BTC', 'USDT', '1D', [candle(0), candle(DAY)]) == 2
+    assert store.write('BINANCE', 'BTC', 'USDT', '1D', [candle(2 * DAY), candle(3 * DAY)]) == 2
+    assert list(store.read('BINANCE', 'BTC', 'USDT', '1D')['ts']) == [0, DAY, 2 * DAY, 3 * DAY]
+
+
+def test_write_overwrites_the_open_candle_in_place(store):
+    store.write('BINANCE', 'BTC', 'USDT', '1D', [candle(0, 1.), candle(DAY, 2.)])
+    assert store.write('BINANCE', 'BTC', 'USDT', '1D', [candle(DAY, 5.), candle(2 * DAY, 6.)]) == 1
+    assert closes(store.read('BINANCE', 'BTC', 'USDT', '1D')) == [1., 5., 6.]
+
+
+def test_write_merges_older_candles(store):
+    store.write('BINANCE', 'BTC', 'USDT', '1D', [candle(2 * DAY, 2.), candle(3 * DAY, 3.)])
+    assert store.write('BINANCE', 'BTC', 'USDT', '1D', [candle(0, 0.), candle(DAY, 1.), candle(3 * DAY, 9.)]) == 2
+    arr = store.read('BINANCE', 'BTC', 'USDT', '1D')
+    assert list(arr['ts']) == [0, DAY, 2 * DAY, 3 * DAY]
+    assert closes(arr) == [0., 1., 2., 9.]
+    assert not [f for f in os.listdir(store.path) if f.endswith('.tmp')]
+
+
+def test_read_range(store):
+    store.write('BINANCE', 'BTC', 'USDT', '1D', [candle(d * DAY) for d in range(5)])
+    assert list(store.read('BINANCE', 'BTC', 'USDT', '1D', start=DAY, end=3 * DAY)['ts']) == [DAY, 2 * DAY, 3 * DAY]
+
+
+def test_get_backfills_a_start_before_the_stored_history(tmp_path):
+    exchange = FakeExchange(last_day=34)
+    store = OhlcStore(path=str(tmp_path), fetch=exchange.fetch, page_limits={'BINANCE': PAGE})
+    store.update('BINANCE', 'BTC', 'USDT', '1D')
+    assert len(store.read('BINANCE', 'BTC', 'USDT', '1D')) == PAGE
+
+    arr = store.get('BINANCE', 'BTC', 'USDT', '1D', start=3 * DAY)
+    assert arr['ts'][0] == 3 * DAY
+    assert len(store.read('BINANCE', 'BTC', 'USDT', '1D')) == 35
+
+    # the exchange has nothing before day 0, asking again does not page back
+    store.get('BINANCE', 'BTC', 'USDT', '1D', start=0)
+    calls = len(exchange.calls)
+    store.get('BINANCE', 'BTC', 'USDT', '1D', start=-10 * DAY)
+    store.get('BINANCE', 'BTC', 'USDT', '1D', start=-10 * DAY)
+    backfill_calls = [c for c in exchange.calls[calls:] if c[1] is not None]
+    assert len(backfill_calls) == 1
@@ -0,0 +1,178 @@
+import pytest
+
+# importing api pulls in every client
+pytest.importorskip('requests')
+pytest.importorskip('numpy')
+
+from api.order_book import OrderBook, OrderBookOutOfSync, attach_order_books  # noqa: E402
+
+SNAPSHOT = {'lastUpdateId': 100, 'bids': [['99', '1'], ['98', '2']], 'asks': [['101', '1'], ['102', '3']]}
+
+
+def futs_diff(U, u, pu, b=(), a=()):
+    return {'e': 'depthUpdate', 's': 'BTCUSDT', 'U': U, 'u': u, 'pu': pu, 'b': list(b), 'a': list(a)}
+
+
+def spot_diff(U, u, b=(), a=()):
+    return {'e': 'depthUpdate', 's': 'BTCUSDT', 'U': U, 'u': u, 'b': list(b), 'a': list(a)}
+
+
+class FakeClient:
+
+    def __init__(self, snapshots):
+        self.snapshots = list(snapshots)
+        self.calls = 0
+
+    def get_order_book(self, symbol, limit=None):
+        self.calls += 1
+        return self.snapshots.pop(0)
+
+
+def test_not_synced_raises():
+    book = OrderBook('BTCUSDT')
+    with pytest.raises(OrderBookOutOfSync):
+        book.best_bid_ask()
+
+
+def test_snapshot_levels_best_first():
+    book = OrderBook('BTCUSDT')
+    assert book.apply_snapshot(SNAPSHOT)
+    assert book.best_bid_ask() == (99., 101.)
+    assert book.mid() == 100.
+
+
+def test_futures_buffered_diffs_bridge_the_snapshot():
+    book = OrderBook('BTCUSDT')
+    assert not book.apply_diff(futs_diff(90, 95, 89, b=[['99', '5']]))      # in the snapshot already
+    assert not book.apply_diff(futs_diff(96, 105, 95, b=[['99', '2']]))     # U <= 100 <= u
+    assert not book.apply_diff(futs_diff(106, 110, 105, a=[['101', '0']]))
+    assert book.apply_snapshot(SNAPSHOT)
+    assert book.last_update_id == 110
+    assert book.best_bid() == (99., 2.)
+    assert book.best_ask() == (102., 3.)
+
+
+def test_futures_first_live_diff_bridges():
+    book = OrderBook('BTCUSDT')
+    book.apply_snapshot(SNAPSHOT)
+    assert book.apply_diff(futs_diff(95, 103, 94, b=[['100', '1']]))
+    assert book.best_bid() == (100., 1.)
+    assert book.apply_diff(futs_diff(104, 107, 103))
+    assert book.synced
+
+
+def test_futures_gap_marks_out_of_sync():
+    book = OrderBook('BTCUSDT')
+    book.apply_snapshot(SNAPSHOT)
+    assert book.apply_diff(futs_diff(95, 103, 94))
+    assert not book.apply_diff(futs_diff(110, 115, 108))
+    assert not book.synced
+    with pytest.raises(OrderBookOutOfSync):
+        book.best_bid()
+
+
+def test_first_diff_past_the_snapshot_is_a_gap():
+    book = OrderBook('BTCUSDT')
+    book.apply_snapshot(SNAPSHOT)
+    assert not book.apply_diff(futs_diff(102, 105, 101))
+    assert not book.synced
+
+
+def test_spot_sequencing():
+    book = OrderBook('BTCUSDT')
+    book.apply_snapshot(SNAPSHOT)
+    assert book.apply_diff(spot_diff(100, 100))                        # u < lastUpdateId + 1, skipped
+    assert book.apply_diff(spot_diff(101, 103, a=[['101', '4']]))     # U <= 101 <= u
+    assert book.apply_diff(spot_diff(104, 104))
+    assert book.best_ask() == (101., 4.)
+    assert not book.apply_diff(spot_diff(106, 107))
+    assert not book.synced
+
+
+def test_resync_replays_the_buffer():
+    client = FakeClient([SNAPSHOT])
+    book = OrderBook('BTCUSDT', client)
+    book.apply_diff(futs_diff(96, 105, 95, b=[['99', '7']]))
+    assert book.resync()
+    assert client.calls == 1
+    assert book.best_bid() == (99., 7.)
+    assert book.resyncs == 1
+
+
+def test_resync_retries_until_the_snapshot_overlaps(monkeypatch):
+    monkeypatch.setattr('api.order_book.RESYNC_DELAY_S', 0)
+    stale = {'lastUpdateId': 50, 'bids': [], 'asks': []}
+    client = FakeClient([stale, SNAPSHOT])
+    book = OrderBook('BTCUSDT', client)
+    book.apply_diff(futs_diff(96, 105, 95))
+    assert book.resync()
+    assert client.calls == 2
+    assert book.last_update_id == 105
+
+
+def test_resync_keeps_the_buffered_tail_after_a_stale_snapshot(monkeypatch):
+    monkeypatch.setattr('api.order_book.RESYNC_DELAY_S', 0)
+    stale = {'lastUpdateId': 90, 'bids': [], 'asks': []}
+    fresh = {'lastUpdateId': 115, 'bids': [['99', '1']], 'asks': [['101', '1']]}
+    client = FakeClient([stale, fresh])
+    book = OrderBook('BTCUSDT', client)
+    book.apply_diff(futs_diff(100, 110, 99))
+    book.apply_diff(futs_diff(111, 120, 110, b=[['99', '4']]))
+    book.apply_diff(futs_diff(121, 130, 120, a=[['101', '6']]))
+    assert book.resync()
+    assert client.calls == 2
+    assert book.last_update_id == 130
+    assert book.best_bid() == (99., 4.)
+    assert book.best_ask() == (101., 6.)
+
+
+def test_price_to_fill_walks_the_book():
+    book = OrderBook('BTCUSDT')
+    book.apply_snapshot(SNAPSHOT)
+    fill = book.price_to_fill(2.5, 'BUY')
+    assert fill['complete'] and fill['worst_price'] == 102.
+    assert fill['avg_price'] == pytest.approx((101 + 1.5 * 102) / 2.5)
+    assert not book.price_to_fill(10, 'SELL')['complete']
+    assert book.slippage_pct(2, 'SELL') == pytest.approx(1 / 99)
+
+
+def test_qty_within_stops_at_the_limit_price():
+    book = OrderBook('BTCUSDT')
+    book.apply_snapshot(SNAPSHOT)
+    assert book.qty_within(101.5, 'BUY') == 1.
+    assert book.qty_within(102, 'BUY') == 4.
+    assert book.qty_within(100, 'BUY') == 0.
+    assert book.qty_within(98, 'SELL') == 3.
+
+
+def test_empty_side_gives_no_mid():
+    book = OrderBook('BTCUSDT')
+    book.apply_snapshot({'lastUpdateId': 1, 'bids': [['99', '1']], 'asks': []})
+    assert book.mid() is None
+    assert book.depth_weighted_mid() is None
+
+
+def test_on_depth_update_ignores_other_symbols():
+    book = OrderBook('BTCUSDT')
+    book.apply_snapshot(SNAPSHOT)
+    book.on_depth_update(dict(futs_diff(95, 103, 94, b=[['100', '1']]), s='ETHUSDT'))
+    assert book.best_bid() == (99., 1.)
+
+
+def test_attach_resyncs_on_connect():
+    class Stream:
+        symbols = ['BTCUSDT']
+        connected = False
+        client = None
+
+        def __init__(self):
+            self.listeners = {}
+            self.order_books = {}
+
+        def add_listener(self, event_type, callback):
+            self.listeners.setdefault(event_type, []).append(callback)
+
+    stream = Stream()
+    books = attach_order_books(stream, FakeClient([]))
+    assert set(books) == {'BTCUSDT'} and stream.order_books == books
+    assert len(stream.listeners['depthUpdate']) == len(stream.listeners['connected']) == 1
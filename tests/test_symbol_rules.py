@@ -0,0 +1,120 @@
+import json
+from decimal import Decimal
+
+import pytest
+
+# importing api pulls in every client
+pytest.importorskip('requests')
+pytest.importorskip('numpy')
+
+from api import symbol_rules  # noqa: E402
+from api.symbol_rules import SymbolRules, SymbolRulesCache, parse_symbol_filters  # noqa: E402
+
+FUTURES_SYMBOL = {
+    'symbol': 'BTCUSDT', 'status': 'TRADING', 'baseAsset': 'BTC', 'quoteAsset': 'USDT',
+    'filters': [
+        {'filterType': 'PRICE_FILTER', 'tickSize': '0.10', 'minPrice': '556.80', 'maxPrice': '4529764'},
+        {'filterType': 'LOT_SIZE', 'stepSize': '0.001', 'minQty': '0.001', 'maxQty': '1000'},
+        {'filterType': 'MARKET_LOT_SIZE', 'stepSize': '0.001', 'minQty': '0.001', 'maxQty': '120'},
+        {'filterType': 'MIN_NOTIONAL', 'notional': '100'},
+    ],
+}
+
+SPOT_SYMBOL = {
+    'symbol': 'SHIBUSDT', 'status': 'TRADING',
+    'filters': [
+        {'filterType': 'PRICE_FILTER', 'tickSize': '0.00000001', 'minPrice': '0.00000001', 'maxPrice': '1.00000000'},
+        {'filterType': 'LOT_SIZE', 'stepSize': '1.00000000', 'minQty': '1.00000000', 'maxQty': '46116860414.00000000'},
+        {'filterType': 'NOTIONAL', 'minNotional': '5.00000000'},
+    ],
+}
+
+
+@pytest.fixture
+def btc():
+    return SymbolRules(parse_symbol_filters(FUTURES_SYMBOL))
+
+
+def test_parse_filters():
+    rules = parse_symbol_filters(FUTURES_SYMBOL)
+    assert rules['tickSize'] == '0.10' and rules['stepSize'] == '0.001'
+    assert rules['minNotional'] == '100' and rules['marketMaxQty'] == '120'
+    assert parse_symbol_filters(SPOT_SYMBOL)['minNotional'] == '5.00000000'
+
+
+def test_scales(btc):
+    assert btc.price_scale == 1 and btc.qty_scale == 3
+    shib = SymbolRules(parse_symbol_filters(SPOT_SYMBOL))
+    assert shib.price_scale == 8 and shib.qty_scale == 0
+
+
+def test_round_qty_down(btc):
+    assert btc.round_qty(0.123456) == 0.123
+    assert btc.round_qty(0.0019999) == 0.001
+    assert btc.round_qty(Decimal('1.2345')) == 1.234
+
+
+def test_round_price_nearest(btc):
+    assert btc.round_price(30123.456) == 30123.5
+    assert btc.round_price(30123.44) == 30123.4
+    assert btc.round_price(0.3 * 3) == 0.9
+
+
+def test_format_has_no_exponent():
+    shib = SymbolRules(parse_symbol_filters(SPOT_SYMBOL))
+    assert shib.format_price(0.0000123456) == '0.00001235'
+    assert shib.format_qty(1234567.9) == '1234567'
+
+
+def test_validate(btc):
+    assert btc.validate(30000., 0.01) is None
+    assert 'minQty' in btc.validate(30000., 0.0001)
+    assert 'maxQty' in btc.validate(30000., 2000)
+    assert 'minPrice' in btc.validate(1., 1)
+    assert 'minNotional' in btc.validate(30000., 0.002)
+    assert btc.validate(None, 0.002) is None
+
+
+def test_validate_status():
+    rules = SymbolRules(parse_symbol_filters(dict(FUTURES_SYMBOL, status='BREAK')))
+    assert 'BREAK' in rules.validate(30000., 0.01)
+
+
+def test_cache_refreshes_once_and_persists(tmp_path, monkeypatch):
+    calls = []
+
+    def get(base_url, endpoint):
+        calls.append(endpoint)
+        return {'symbols': [FUTURES_SYMBOL]}
+
+    monkeypatch.setattr(symbol_rules, 'make_get_request', get)
+    cache = SymbolRulesCache('BINANCE_FUTURES_USDM', path=str(tmp_path))
+    assert cache.get('btcusdt').step_size == Decimal('0.001')
+    assert cache.get('BTCUSDT').symbol == 'BTCUSDT'
+    assert calls == ['exchangeInfo']
+
+    with open(cache.path) as f:
+        assert 'BTCUSDT' in json.load(f)['symbols']
+
+    # a new process reads the file, no request within the ttl
+    assert SymbolRulesCache('BINANCE_FUTURES_USDM', path=str(tmp_path)).symbols() == ['BTCUSDT']
+    assert calls == ['exchangeInfo']
+
+
+def test_cache_unknown_symbol(tmp_path, monkeypatch):
+    monkeypatch.setattr(symbol_rules, 'make_get_request', lambda base_url, endpoint: {'symbols': [FUTURES_SYMBOL]})
+    cache = SymbolRulesCache('BINANCE_FUTURES_USDM', path=str(tmp_path))
+    with pytest.raises(KeyError):
+        cache.get('NOPEUSDT')
+
+
+def test_cache_serves_stale_rules_when_refresh_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(symbol_rules, 'make_get_request', lambda base_url, endpoint: {'symbols': [FUTURES_SYMBOL]})
+    cache = SymbolRulesCache('BINANCE_FUTURES_USDM', path=str(tmp_path), ttl=0)
+    cache.get('BTCUSDT')
+
+    def fail(base_url, endpoint):
+        raise ConnectionError('down')
+
+    monkeypatch.setattr(symbol_rules, 'make_get_request', fail)
+    assert cache.get('BTCUSDT').symbol == 'BTCUSDT'
@@ -0,0 +1,34 @@
+import pytest
+
+# importing api pulls in every client
+pytest.importorskip('requests')
+pytest.importorskip('numpy')
+
+from api.ticker_cache import CachedValue, CachedValueMissing  # noqa: E402
+
+
+def test_cached_value_misses_until_a_first_value():
+    values = [None, 1.01]
+    value = CachedValue(lambda: values.pop(0), max_age=0)
+    with pytest.raises(CachedValueMissing):
+        value.get()
+    assert value.get() == 1.01
+
+
+def test_cached_value_serves_the_last_good_value():
+    def fetch():
+        if calls:
+            raise ConnectionError('down')
+        calls.append(1)
+        return 0.999
+
+    calls = []
+    value = CachedValue(fetch, max_age=0)
+    assert value.get() == 0.999
+    assert value.get() == 0.999
+
+
+def test_first_fetch_error_is_a_miss():
+    value = CachedValue(lambda: 1 / 0)
+    with pytest.raises(CachedValueMissing):
+        value.get()
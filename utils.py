@@ -1,9 +1,23 @@
 import json
+import logging
+import os
 import pickle
 import time
 
 from datetime import datetime
 
+logger = logging.getLogger('defi_public')
+
+
+def is_convertible_to_float(x):
+    if x is None:
+        return False
+    try:
+        float(x)
+        return True
+    except (TypeError, ValueError):
+        return False
+
 
 # def get_timestamp_ms(): # in milliseconds
 #     return int(round(time.time() * 1000))
@@ -29,6 +43,56 @@ def write_to_json(dct, filename):
         json.dump(dct, f)
 
 
+def write_json_atomic(obj, path):
+    """
+    json dump through a temp file + rename, readers (other processes) never see a partial file
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+class TtlState:
+    """
+    refresh bookkeeping of a cached value that is served stale while refreshes fail,
+    stale after ttl, a failed refresh is retried after retry_after instead of on every read
+
+    state = TtlState(ttl=3600, retry_after=300)
+    if state.is_stale():
+        try:
+            refresh(); state.fetched()
+        except Exception:
+            state.failed()
+    """
+
+    def __init__(self, ttl, retry_after, clock=time.time):
+        """
+        :param ttl: seconds, None never expires
+        :param clock: time.time, or time.monotonic for values never persisted
+        """
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.clock = clock
+        self.fetched_at = None
+        self.retry_at = 0.
+
+    def is_stale(self):
+        now = self.clock()
+        if now < self.retry_at:
+            return False
+        return self.fetched_at is None or (self.ttl is not None and now - self.fetched_at > self.ttl)
+
+    def fetched(self, at=None):
+        self.fetched_at = self.clock() if at is None else at
+        self.retry_at = 0.
+
+    def failed(self):
+        self.retry_at = self.clock() + self.retry_after
+
+
 def read_from_json(filename):
     with open(f'{filename}.json') as f:
         data = json.load(f)